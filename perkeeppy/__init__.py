@@ -16,5 +16,8 @@ from perkeeppy.blobclient import (
 from perkeeppy.schema import (
     SchemaObject,
     make_claim,
-    make_permanode
+    make_permanode,
+    put_permanodes,
+    put_schema_objects,
+    to_blob_multi,
 )
@@ -0,0 +1,519 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+from urllib.parse import urljoin
+
+import aiohttp
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from perkeeppy.blobclient import BlobClient, Blob, _chunks, _iter_args
+from perkeeppy.connection import (
+    _config_url,
+    _roots_from_config_response,
+    user_agent,
+)
+from perkeeppy.exceptions import NotFoundError
+from perkeeppy.searchclient import SearchClient
+from perkeeppy.signing import Signer
+from perkeeppy.subscriptions import Subscriptions
+from perkeeppy.uploadhelper import UploadHelper
+
+
+async def _request(http_session, method, url, **kwargs):
+    """
+    Make a request with an :py:class:`aiohttp.ClientSession`, returning
+    the result as a fully-read :py:class:`requests.Response` so that it
+    can be passed to the response handling of the blocking clients.
+    """
+    async with http_session.request(method, url, **kwargs) as aio_resp:
+        content = await aio_resp.read()
+
+    resp = requests.Response()
+    resp.status_code = aio_resp.status
+    resp.reason = aio_resp.reason
+    resp.url = str(aio_resp.url)
+    resp.headers = CaseInsensitiveDict(aio_resp.headers)
+    resp._content = content
+    return resp
+
+
+def _form_data(fields):
+    """
+    Convert a list of ``(name, (filename, value[, content_type]))`` tuples,
+    as accepted by the ``files`` argument in :py:mod:`requests`, into an
+    :py:class:`aiohttp.FormData`.
+    """
+    form = aiohttp.FormData()
+    for (name, field) in fields:
+        filename = field[0]
+        value = field[1]
+        content_type = field[2] if len(field) > 2 else None
+        form.add_field(
+            name, value, filename=filename, content_type=content_type,
+        )
+    return form
+
+
+class AsyncConnection(object):
+    """
+    The asyncio counterpart of :py:class:`perkeeppy.Connection`.
+
+    The clients of an asyncio connection mirror the blocking clients
+    method-for-method, but their I/O methods are coroutines, so many
+    requests can be outstanding at once on a single event loop. They share
+    request encoding and response decoding with the blocking clients, and
+    so raise the same exceptions in the same situations.
+
+    Most callers should obtain an instance via :py:func:`connect`. The
+    connection owns its :py:class:`aiohttp.ClientSession`, so callers
+    should call :py:meth:`close` when done, or use the connection as an
+    asynchronous context manager.
+    """
+
+    #: Provides access to the server's blob store via an instance of
+    #: :py:class:`AsyncBlobClient`.
+    blobs = None
+
+    #: Provides access to the server's search interface via an instance of
+    #: :py:class:`AsyncSearchClient`.
+    searcher = None
+
+    def __init__(
+        self,
+        http_session=None,
+        blob_root=None,
+        search_root=None,
+        sign_root=None,
+        uploadhelper_root=None
+    ):
+
+        self.http_session = http_session
+        self.blob_root = blob_root
+        self.search_root = search_root
+        self.sign_root = sign_root
+        self.uploadhelper_root = uploadhelper_root
+
+        self.blobs = AsyncBlobClient(
+            http_session=http_session,
+            base_url=blob_root,
+        )
+
+        self.searcher = AsyncSearchClient(
+            http_session=http_session,
+            base_url=search_root,
+        )
+
+        if sign_root:
+            self.signer = AsyncSigner(
+                http_session=http_session,
+                base_url=sign_root
+            )
+        else:
+            self.signer = None
+
+        if uploadhelper_root:
+            self.uploadhelper = AsyncUploadHelper(
+                http_session=http_session,
+                base_url=uploadhelper_root
+            )
+        else:
+            self.uploadhelper = None
+
+    async def close(self):
+        """
+        Close the underlying HTTP session.
+        """
+        await self.http_session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+async def connect(base_url, http_session=None):
+    """
+    Create an asyncio connection to the Perkeep instance at the given base
+    URL.
+
+    This runs the same discovery protocol as :py:func:`perkeeppy.connect`,
+    returning an :py:class:`AsyncConnection`. If ``http_session`` is not
+    given, a new :py:class:`aiohttp.ClientSession` is created, so this must
+    be called from within a running event loop.
+    """
+    own_session = http_session is None
+    if own_session:
+        http_session = aiohttp.ClientSession(
+            headers={"User-Agent": user_agent},
+            trust_env=False,
+        )
+
+    try:
+        config_url = _config_url(base_url)
+        config_resp = await _request(http_session, 'GET', config_url)
+        roots = _roots_from_config_response(config_url, config_resp)
+    except BaseException:
+        # Nobody else has a reference to the session we made, so it would
+        # never be closed.
+        if own_session:
+            await http_session.close()
+        raise
+
+    return AsyncConnection(
+        http_session=http_session,
+        **roots
+    )
+
+
+class AsyncBlobClient(object):
+    """
+    The asyncio counterpart of :py:class:`perkeeppy.blobclient.BlobClient`.
+
+    Many calls can be outstanding at once on a single event loop, so
+    callers wanting concurrency can simply gather several coroutines from
+    the same client.
+    """
+
+    max_upload_size = BlobClient.max_upload_size
+    max_batch_blobs = BlobClient.max_batch_blobs
+
+    # URL building, batching and response handling are shared with the
+    # blocking client.
+    _make_url = BlobClient._make_url
+    _make_blob_url = BlobClient._make_blob_url
+    _check_get_response = BlobClient._check_get_response
+    _size_from_response = BlobClient._size_from_response
+    _parse_enumerate_response = BlobClient._parse_enumerate_response
+    _stat_form_data = BlobClient._stat_form_data
+    _sizes_from_response = BlobClient._sizes_from_response
+    _batch_blobs = BlobClient._batch_blobs
+    _missing_from_sizes = BlobClient._missing_from_sizes
+    _check_upload_response = BlobClient._check_upload_response
+
+    def __init__(self, http_session, base_url):
+        self.http_session = http_session
+        self.base_url = base_url
+
+    async def get(self, blobref):
+        """
+        Get the data for a blob, given its blobref.
+
+        See :py:meth:`perkeeppy.blobclient.BlobClient.get`.
+        """
+        blob_url = self._make_blob_url(blobref)
+        resp = await _request(self.http_session, 'GET', blob_url)
+        self._check_get_response(blobref, resp)
+        return Blob(resp.content, blobref=blobref)
+
+    async def get_size(self, blobref):
+        """
+        Get the size of a blob, given its blobref.
+
+        See :py:meth:`perkeeppy.blobclient.BlobClient.get_size`.
+        """
+        blob_url = self._make_blob_url(blobref)
+        resp = await _request(self.http_session, 'HEAD', blob_url)
+        return self._size_from_response(blobref, resp)
+
+    async def blob_exists(self, blobref):
+        """
+        Determine if a blob exists with the given blobref.
+
+        See :py:meth:`perkeeppy.blobclient.BlobClient.blob_exists`.
+        """
+        try:
+            await self.get_size(blobref)
+        except NotFoundError:
+            return False
+        else:
+            return True
+
+    async def enumerate(self):
+        """
+        Enumerate all of the blobs on the server, in blobref order.
+
+        This is an asynchronous generator, to be used with ``async for``.
+        See :py:meth:`perkeeppy.blobclient.BlobClient.enumerate`.
+        """
+        plain_enum_url = self._make_url("camli/enumerate-blobs")
+        next_enum_url = plain_enum_url
+
+        while next_enum_url is not None:
+            resp = await _request(self.http_session, 'GET', next_enum_url)
+            (blob_metas, next_enum_url) = self._parse_enumerate_response(
+                plain_enum_url, next_enum_url, resp,
+            )
+
+            for blob_meta in blob_metas:
+                yield blob_meta
+
+    async def get_size_multi(self, *blobrefs):
+        """
+        Get the size of several blobs at once, given their blobrefs.
+
+        See :py:meth:`perkeeppy.blobclient.BlobClient.get_size_multi`.
+        The blobrefs are sent in chunks of at most :py:attr:`max_batch_blobs`,
+        all of which are in flight at once.
+        """
+        chunks = _chunks(_iter_args(blobrefs, str), self.max_batch_blobs)
+        results = await asyncio.gather(*[
+            self._stat(chunk) for chunk in chunks
+        ])
+
+        ret = {}
+        for sizes in results:
+            ret.update(sizes)
+        return ret
+
+    async def _stat(self, blobrefs):
+        stat_url = self._make_url('camli/stat')
+        resp = await _request(
+            self.http_session, 'POST', stat_url,
+            data=self._stat_form_data(blobrefs),
+        )
+        return self._sizes_from_response(blobrefs, resp)
+
+    async def put(self, blob):
+        """
+        Write a single blob into the store.
+
+        See :py:meth:`perkeeppy.blobclient.BlobClient.put`.
+        """
+        result = await self.put_multi(blob)
+        return result[0]
+
+    async def put_multi(self, *blobs):
+        """
+        Upload several blobs to the store.
+
+        See :py:meth:`perkeeppy.blobclient.BlobClient.put_multi`.
+        """
+        blobrefs = []
+
+        for batch in self._batch_blobs(_iter_args(blobs, Blob)):
+            sizes = await self.get_size_multi(
+                *[blob.blobref for blob in batch]
+            )
+            missing = self._missing_from_sizes(batch, sizes)
+            if len(missing) > 0:
+                await self._upload_blobs(missing)
+
+            blobrefs.extend(blob.blobref for blob in batch)
+
+        return blobrefs
+
+    async def _upload_blobs(self, blobs):
+        upload_url = self._make_url('camli/upload')
+
+        form = _form_data([
+            (
+                blob.blobref,
+                (blob.blobref, blob.data, 'application/octet-stream'),
+            )
+            for blob in blobs
+        ])
+
+        resp = await _request(
+            self.http_session, 'POST', upload_url, data=form,
+        )
+        self._check_upload_response(resp)
+
+
+class AsyncSearchClient(object):
+    """
+    The asyncio counterpart of
+    :py:class:`perkeeppy.searchclient.SearchClient`.
+
+    Note that the ``describe_another`` method of the returned
+    :py:class:`perkeeppy.searchclient.BlobDescription` objects returns a
+    coroutine when it needs to make a request on behalf of this client.
+    """
+
+    _make_url = SearchClient._make_url
+    _query_data = SearchClient._query_data
+    _query_request_data = SearchClient._query_request_data
+    _page_from_response = SearchClient._page_from_response
+    _page_from_data = SearchClient._page_from_data
+    _next_query_data = SearchClient._next_query_data
+    _description_from_meta = SearchClient._description_from_meta
+    _description_from_response = SearchClient._description_from_response
+    _claims_from_response = SearchClient._claims_from_response
+
+    def __init__(self, http_session, base_url):
+        self.http_session = http_session
+        self.base_url = base_url
+
+    async def query(self, q, page_size=None, limit=None, describe=None):
+        """
+        Run a query against the index.
+
+        This is an asynchronous generator of
+        :py:class:`perkeeppy.searchclient.SearchResult`, to be used with
+        ``async for``. Each page is requested as iteration reaches it,
+        following the server's continuation token, and no page is requested
+        once ``limit`` results have been received. There is no
+        ``prefetch`` option. See
+        :py:meth:`perkeeppy.searchclient.SearchClient.query`.
+        """
+        req_url = self._make_url("camli/search/query")
+        data = self._query_request_data(q, page_size, describe)
+
+        count = 0
+        while data is not None:
+            resp = await _request(
+                self.http_session, 'POST', req_url, data=json.dumps(data),
+            )
+            (results, continue_token) = self._page_from_response(q, resp)
+            data = self._next_query_data(data, results, continue_token)
+
+            for result in results:
+                if limit is not None and count >= limit:
+                    return
+                yield result
+                count += 1
+
+            if limit is not None and count >= limit:
+                return
+
+    async def describe_blob(self, blobref):
+        """
+        Request a description of a particular blob.
+
+        See :py:meth:`perkeeppy.searchclient.SearchClient.describe_blob`.
+        """
+        req_url = self._make_url("camli/search/describe")
+        resp = await _request(
+            self.http_session, 'GET', req_url,
+            params={"blobref": blobref},
+        )
+        return self._description_from_response(blobref, resp)
+
+    async def get_claims_for_permanode(self, blobref):
+        """
+        Get the claims for a particular permanode.
+
+        See the blocking ``SearchClient.get_claims_for_permanode``.
+        """
+        req_url = self._make_url("camli/search/claims")
+        resp = await _request(
+            self.http_session, 'GET', req_url,
+            params={"permanode": blobref},
+        )
+        return self._claims_from_response(blobref, resp)
+
+    def subscriptions(self):
+        """
+        Return a :py:class:`perkeeppy.subscriptions.Subscriptions` for
+        subscribing to live query results over a websocket, which should be
+        used as an asynchronous context manager::
+
+            async with conn.searcher.subscriptions() as subs:
+                sub = await subs.subscribe("is:permanode")
+                async for update in sub:
+                    print(update.added, update.removed)
+        """
+        return Subscriptions(self)
+
+
+class AsyncSigner(object):
+    """
+    The asyncio counterpart of :py:class:`perkeeppy.signing.Signer`.
+    """
+
+    _prepare_dict = Signer._prepare_dict
+    _camli_signer_from_response = Signer._camli_signer_from_response
+    _signed_from_response = Signer._signed_from_response
+    _verification_from_response = Signer._verification_from_response
+
+    def __init__(self, http_session, base_url, camli_signer=None):
+        self.http_session = http_session
+        self.base_url = base_url
+
+        self.discovery_path = urljoin(self.base_url, 'camli/sig/discovery')
+        self.sign_path = urljoin(self.base_url, 'camli/sig/sign')
+        self.verify_path = urljoin(self.base_url, 'camli/sig/verify')
+
+        self.camli_signer = camli_signer
+
+    async def get_camli_signer(self):
+        """
+        Return the blobref of the signer's public key, fetching it via
+        discovery if it is not already known.
+        """
+        if not self.camli_signer:
+            resp = await _request(
+                self.http_session, 'GET', self.discovery_path,
+            )
+            self.camli_signer = self._camli_signer_from_response(resp)
+
+        return self.camli_signer
+
+    async def sign_dict(self, source):
+        """
+        Produce a signed :class:`bytes` version of the ``source``.
+
+        See :py:meth:`perkeeppy.signing.Signer.sign_dict`.
+        """
+        camli_signer = None
+        if 'camliSigner' not in source:
+            camli_signer = await self.get_camli_signer()
+
+        return await self.sign_string(
+            self._prepare_dict(source, lambda: camli_signer),
+        )
+
+    async def sign_string(self, source):
+        """
+        Produce a signed :class:`bytes` version of the JSON string in
+        ``source``.
+
+        See :py:meth:`perkeeppy.signing.Signer.sign_string`.
+        """
+        resp = await _request(
+            self.http_session, 'POST', self.sign_path,
+            data={'json': source},
+        )
+        return self._signed_from_response(resp)
+
+    async def verify_bytes(self, byte_str):
+        """
+        Use the remote signing helper to verify a cryptographically signed
+        JSON document.
+
+        See :py:meth:`perkeeppy.signing.Signer.verify_bytes`.
+        """
+        resp = await _request(
+            self.http_session, 'POST', self.verify_path,
+            data={'sjson': byte_str},
+        )
+        return self._verification_from_response(resp)
+
+
+class AsyncUploadHelper(object):
+    """
+    The asyncio counterpart of :py:class:`perkeeppy.uploadhelper.UploadHelper`.
+    """
+
+    _upload_payload = UploadHelper._upload_payload
+    _fileref_from_response = UploadHelper._fileref_from_response
+    _got_from_response = UploadHelper._got_from_response
+
+    def __init__(self, http_session, base_url):
+        self.http_session = http_session
+        self.base_url = base_url
+
+    async def upload_file(self, filename, fileobj, mtime=None):
+        """
+        Upload a single file.
+
+        See :py:meth:`perkeeppy.uploadhelper.UploadHelper.upload_file`.
+        """
+        payload = self._upload_payload(filename, fileobj, mtime)
+        resp = await _request(
+            self.http_session, 'POST', self.base_url,
+            data=_form_data(payload),
+        )
+        return self._fileref_from_response(resp)
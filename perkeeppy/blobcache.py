@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import os
+import re
+import tempfile
+import threading
+
+from perkeeppy.blobclient import Blob
+from perkeeppy.exceptions import HashMismatchError
+
+# Blobrefs become file names, so we only cache those that can't escape
+# the cache directory or collide with our temporary files.
+_safe_blobref_re = re.compile(r'^[a-zA-Z0-9]+-[a-zA-Z0-9]+$')
+
+_temp_prefix = '.tmp-'
+
+
+class DiskBlobCache(object):
+    """
+    A size-bounded, on-disk cache of blobs, keyed by blobref.
+
+    Since blobs are immutable and content-addressed, a cached copy of a
+    blob never goes stale. This cache can be assigned to
+    :py:attr:`perkeeppy.blobclient.BlobClient.cache` (or passed to
+    :py:func:`perkeeppy.connect`) to avoid fetching the same blobs from the
+    server repeatedly.
+
+    Blobs are stored as individual files under ``path``, which is created
+    if necessary. Each file is written to a temporary name and then renamed
+    into place, so readers never observe a partially-written blob. When the
+    total size of the cached blobs exceeds ``max_size`` bytes, the least
+    recently used blobs are removed. Blobs read from the cache are checked
+    against their blobref, and any that fail the check are discarded.
+
+    A cache directory may be reused by later processes, but should not be
+    shared between processes that are running at the same time.
+    """
+
+    def __init__(self, path, max_size=1024 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        # Maps blobref to size, least recently used first.
+        self._entries = collections.OrderedDict()
+        self._total_size = 0
+
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def get(self, blobref):
+        """
+        Return the cached :py:class:`perkeeppy.Blob` for the given blobref,
+        or ``None`` if it is not cached.
+        """
+        if not self._touch(blobref):
+            return None
+
+        try:
+            with open(self._blob_path(blobref), 'rb') as f:
+                data = f.read()
+            blob = Blob(data, blobref=blobref)
+        except (OSError, HashMismatchError):
+            self._discard(blobref)
+            return None
+
+        return blob
+
+    def get_size(self, blobref):
+        """
+        Return the size of the blob with the given blobref if it is cached,
+        or ``None`` otherwise.
+        """
+        with self._lock:
+            return self._entries.get(blobref)
+
+    def __contains__(self, blobref):
+        with self._lock:
+            return blobref in self._entries
+
+    def put(self, blob):
+        """
+        Add the given :py:class:`perkeeppy.Blob` to the cache, evicting
+        older blobs if necessary to stay within :py:attr:`max_size`.
+        """
+        blobref = blob.blobref
+        if blob.size > self.max_size or not _safe_blobref_re.match(blobref):
+            return
+
+        with self._lock:
+            if blobref in self._entries:
+                self._entries.move_to_end(blobref)
+                return
+
+        final_path = self._blob_path(blobref)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+
+        (fd, temp_path) = tempfile.mkstemp(dir=self.path, prefix=_temp_prefix)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(blob.data)
+            os.replace(temp_path, final_path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            if blobref not in self._entries:
+                self._entries[blobref] = blob.size
+                self._total_size += blob.size
+            evicted = self._evict()
+
+        self._remove_files(evicted)
+
+    def _blob_path(self, blobref):
+        # Spread the files over subdirectories named after the first
+        # characters of the digest, to keep directory sizes manageable.
+        digest = blobref.split('-', 1)[1]
+        return os.path.join(self.path, digest[:2], blobref)
+
+    def _touch(self, blobref):
+        with self._lock:
+            if blobref not in self._entries:
+                return False
+            self._entries.move_to_end(blobref)
+
+        # Record the access on disk too, so that the LRU order survives
+        # into the next process to use this cache.
+        try:
+            os.utime(self._blob_path(blobref))
+        except OSError:
+            pass
+        return True
+
+    def _discard(self, blobref):
+        with self._lock:
+            size = self._entries.pop(blobref, None)
+            if size is not None:
+                self._total_size -= size
+        self._remove_files([blobref])
+
+    def _evict(self):
+        # Must be called with the lock held. Returns the blobrefs whose
+        # files should be removed once the lock is released.
+        evicted = []
+        while self._total_size > self.max_size and len(self._entries) > 0:
+            (blobref, size) = self._entries.popitem(last=False)
+            self._total_size -= size
+            evicted.append(blobref)
+        return evicted
+
+    def _remove_files(self, blobrefs):
+        for blobref in blobrefs:
+            try:
+                os.unlink(self._blob_path(blobref))
+            except OSError:
+                pass
+
+    def _load(self):
+        found = []
+        for entry in os.scandir(self.path):
+            if entry.name.startswith(_temp_prefix):
+                # Left behind by a process that died mid-write.
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+                continue
+            if not entry.is_dir():
+                continue
+            for blob_entry in os.scandir(entry.path):
+                if not _safe_blobref_re.match(blob_entry.name):
+                    continue
+                stat = blob_entry.stat()
+                found.append((stat.st_mtime, blob_entry.name, stat.st_size))
+
+        found.sort()
+        for (_, blobref, size) in found:
+            self._entries[blobref] = size
+            self._total_size += size
+
+        self._remove_files(self._evict())
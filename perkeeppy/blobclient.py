@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
 
+import io
+import itertools
 import json
 import hashlib
+import os
+import tempfile
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
+from perkeeppy.concurrency import bounded_map, interleave
 from perkeeppy.exceptions import (
     ServerFeatureUnavailableError,
     NotFoundError,
@@ -11,6 +18,26 @@ from perkeeppy.exceptions import (
     HashMismatchError
 )
 
+# The protocol forbids upload requests with a payload larger than 32MB.
+MAX_UPLOAD_SIZE = 32 * 1024 * 1024
+
+# Perkeep's stat handler refuses to stat more than 1000 blobs at once, so
+# we use the same limit for both stat and upload batches.
+MAX_BATCH_BLOBS = 1000
+
+# The number of concurrent requests made by the parallel batch methods
+# unless the caller asks for something different.
+DEFAULT_MAX_WORKERS = 8
+
+# The size of the buffer used by BlobClient.get_into when copying into a
+# file-like object.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# A generous estimate of the multipart headers and boundary surrounding each
+# blob in an upload request, so that batches stay under MAX_UPLOAD_SIZE once
+# encoded.
+UPLOAD_PART_OVERHEAD = 512
+
 
 class BlobClient(object):
     """
@@ -29,9 +56,34 @@ class BlobClient(object):
     object and access :py:attr:`camlistore.Connection.blobs`.
     """
 
-    def __init__(self, http_session, base_url):
+    #: The largest number of bytes that :py:meth:`put_multi` will send in
+    #: a single upload request, including an allowance for the multipart
+    #: framing around each blob.
+    max_upload_size = MAX_UPLOAD_SIZE
+
+    #: The largest number of blobs that :py:meth:`get_size_multi` and
+    #: :py:meth:`put_multi` will stat or upload in a single request.
+    max_batch_blobs = MAX_BATCH_BLOBS
+
+    #: An optional local cache of blobs, such as a
+    #: :py:class:`perkeeppy.blobcache.DiskBlobCache`. When set, :py:meth:`get`
+    #: and :py:meth:`get_size` consult it before contacting the server, and
+    #: blobs that are fetched or written are added to it.
+    cache = None
+
+    #: An optional record of the blobs that the server is known to have,
+    #: such as a :py:class:`perkeeppy.presence.MemoryPresenceCache`. When
+    #: set, blobs confirmed by :py:meth:`get_size_multi`, :py:meth:`put_multi`
+    #: and :py:meth:`enumerate` are recorded in it, and
+    #: :py:meth:`get_size_multi` (and thus :py:meth:`put_multi`) only asks
+    #: the server about blobs it doesn't already know.
+    presence = None
+
+    def __init__(self, http_session, base_url, cache=None, presence=None):
         self.http_session = http_session
         self.base_url = base_url
+        self.cache = cache
+        self.presence = presence
 
     def _make_url(self, path):
         if self.base_url is not None:
@@ -54,10 +106,72 @@ class BlobClient(object):
         blob, or raises :py:class:`camlistore.exceptions.NotFoundError` if
         the given blobref is not known to the server.
         """
+        if self.cache is not None:
+            blob = self.cache.get(blobref)
+            if blob is not None:
+                return blob
+
         blob_url = self._make_blob_url(blobref)
         resp = self.http_session.get(blob_url)
+        self._check_get_response(blobref, resp)
+        blob = Blob(resp.content, blobref=blobref)
+
+        if self.cache is not None:
+            self.cache.put(blob)
+
+        return blob
+
+    def get_stream(self, blobref):
+        """
+        Get the data for a blob as a stream, given its blobref.
+
+        Unlike :py:meth:`get`, this does not read the whole blob into memory,
+        and it neither consults nor populates :py:attr:`cache`.
+        Instead it returns a :py:class:`BlobReader`, a read-only binary
+        file-like object that reads the data from the server as it is
+        consumed. The data is hashed as it arrives, and
+        :py:class:`camlistore.exceptions.HashMismatchError` is raised when
+        the end of the stream is reached if it does not match ``blobref``.
+
+        Raises :py:class:`camlistore.exceptions.NotFoundError` if the given
+        blobref is not known to the server. Callers should close the
+        returned reader, or use it as a context manager, so that the
+        underlying connection is released.
+        """
+        blob_url = self._make_blob_url(blobref)
+        resp = self.http_session.get(blob_url, stream=True)
+        try:
+            self._check_get_response(blobref, resp)
+            return BlobReader(blobref, resp)
+        except BaseException:
+            resp.close()
+            raise
+
+    def get_into(self, blobref, target):
+        """
+        Write the data for a blob into ``target``, given its blobref.
+
+        ``target`` can be either a writable binary file-like object or a
+        writable buffer such as a :py:class:`bytearray` or
+        :py:class:`memoryview`. When given a buffer, the data is read
+        directly into it with no intermediate copy; a :py:class:`ValueError`
+        is raised if the buffer is too small to hold the blob.
+
+        The data is verified in the same way as for :py:meth:`get_stream`.
+        Note that if verification fails, the bad data will already have been
+        written into ``target``.
+
+        Returns the number of bytes written.
+        """
+        with self.get_stream(blobref) as reader:
+            if hasattr(target, "write"):
+                return reader.copy_to(target)
+            else:
+                return reader.read_into_buffer(target)
+
+    def _check_get_response(self, blobref, resp):
         if resp.status_code == 200:
-            return Blob(resp.content, blobref=blobref)
+            return
         elif resp.status_code == 404:
             raise NotFoundError(
                 "Blob not found: %s" % blobref,
@@ -71,6 +185,36 @@ class BlobClient(object):
                 )
             )
 
+    def get_multi(self, blobrefs, max_workers=DEFAULT_MAX_WORKERS,
+                  ordered=True):
+        """
+        Get the data for several blobs, fetching up to ``max_workers`` of
+        them concurrently.
+
+        ``blobrefs`` can be any iterable of blobrefs, including a generator;
+        it is consumed only a little ahead of the results.
+
+        This is a generator yielding a ``(blobref, blob)`` pair for each
+        requested blobref, where ``blob`` is a :py:class:`camlistore.Blob`
+        with the same hash verification as :py:meth:`get`. If a blob is not
+        known to the server, ``blob`` is instead the corresponding
+        :py:class:`camlistore.exceptions.NotFoundError` instance, so that
+        one missing blob does not abort the rest of the batch. Other errors
+        are raised as usual.
+
+        If ``ordered`` is ``True`` the pairs are yielded in the same order
+        as the given blobrefs. Otherwise each pair is yielded as soon as it
+        is available, which avoids waiting on one slow request.
+        """
+        results = bounded_map(
+            self.get, blobrefs, max_workers=max_workers, ordered=ordered,
+        )
+        for blobref, future in results:
+            try:
+                yield blobref, future.result()
+            except NotFoundError as e:
+                yield blobref, e
+
     def get_size(self, blobref):
         """
         Get the size of a blob, given its blobref.
@@ -79,8 +223,16 @@ class BlobClient(object):
         or raises :py:class:`camlistore.exceptions.NotFoundError` if
         the given blobref is not known to the server.
         """
+        if self.cache is not None:
+            size = self.cache.get_size(blobref)
+            if size is not None:
+                return size
+
         blob_url = self._make_blob_url(blobref)
         resp = self.http_session.request('HEAD', blob_url)
+        return self._size_from_response(blobref, resp)
+
+    def _size_from_response(self, blobref, resp):
         if resp.status_code == 200:
             return int(resp.headers['content-length'])
         elif resp.status_code == 404:
@@ -114,7 +266,7 @@ class BlobClient(object):
         else:
             return True
 
-    def enumerate(self):
+    def enumerate(self, prefetch=False, after=None):
         """
         Enumerate all of the blobs on the server, in blobref order.
 
@@ -123,43 +275,190 @@ class BlobClient(object):
         will cause one request but continued iteration may cause followup
         requests to retrieve additional chunks.
 
+        If ``after`` is given, only blobs whose blobrefs sort after it are
+        returned. This allows an interrupted enumeration to continue from
+        the last blobref it produced; :py:meth:`enumerate_resumable` keeps
+        track of that automatically.
+
+        If ``prefetch`` is ``True``, the request for each chunk is sent in
+        the background as soon as the previous chunk arrives, so that the
+        next chunk is usually ready by the time the caller has consumed the
+        current one. To enumerate a large store faster still, see
+        :py:meth:`enumerate_sharded`.
+
         Most applications do not need to enumerate all blobs and can instead
         use the facilities provided by the search interface. The enumeration
         interface exists primarily to enable the Camlistore indexer to build
         its search index, but may be useful for other alternative index
         implementations.
         """
+        for blob_metas in self._enumerate_pages(after, None, prefetch):
+            for blob_meta in blob_metas:
+                yield blob_meta
+
+    def enumerate_resumable(
+        self,
+        checkpoint_path=None,
+        after=None,
+        checkpoint_interval=10.0,
+        prefetch=False,
+    ):
+        """
+        Enumerate all of the blobs on the server, in blobref order, in a way
+        that can be resumed after an interruption.
+
+        Returns a :py:class:`ResumableEnumeration`, which is iterable in the
+        same way as the result of :py:meth:`enumerate` but also exposes its
+        position as :py:attr:`ResumableEnumeration.after`.
+
+        If ``checkpoint_path`` is given, the position is also saved to that
+        file at most every ``checkpoint_interval`` seconds and when
+        iteration stops. If the file already exists, and ``after`` was not
+        given, enumeration continues from the position it records. Once the
+        enumeration reaches the end, the file is removed, so that the next
+        enumeration with the same ``checkpoint_path`` starts from the
+        beginning again.
+        """
+        return ResumableEnumeration(
+            self,
+            checkpoint_path=checkpoint_path,
+            after=after,
+            checkpoint_interval=checkpoint_interval,
+            prefetch=prefetch,
+        )
+
+    def enumerate_sharded(
+        self,
+        shards=16,
+        hash_func_names=('sha1', 'sha224'),
+        max_workers=DEFAULT_MAX_WORKERS,
+        ordered=True,
+    ):
+        """
+        Enumerate all of the blobs on the server, splitting the blobref
+        keyspace into ranges that are enumerated concurrently.
+
+        For each of the hash functions named in ``hash_func_names``, the
+        range of possible digests is split into ``shards`` ranges by their
+        leading hex digits. Blobrefs using other hash functions are still
+        enumerated, but are not split any further. Up to ``max_workers``
+        ranges are enumerated at once, each with read-ahead of its next
+        chunk as for :py:meth:`enumerate`.
+
+        If ``ordered`` is ``True`` the blobs are yielded in blobref order,
+        just as for :py:meth:`enumerate`. Otherwise blobs from the
+        different ranges are interleaved as they arrive, which avoids
+        stalling on a single slow range.
+        """
+        ranges = _shard_ranges(shards, hash_func_names)
+
+        def range_pages(after, before):
+            return lambda: self._enumerate_pages(after, before, True)
+
+        pages = interleave(
+            [range_pages(after, before) for (after, before) in ranges],
+            max_workers=max_workers,
+            ordered=ordered,
+        )
+        for blob_metas in pages:
+            for blob_meta in blob_metas:
+                yield blob_meta
+
+    def _enumerate_pages(self, after, before, prefetch):
+        """
+        Generate lists of :py:class:`BlobMeta` for the blobs whose blobrefs
+        sort after ``after`` and before ``before``, either of which can be
+        ``None`` to leave that end of the range open.
+        """
         plain_enum_url = self._make_url("camli/enumerate-blobs")
-        next_enum_url = plain_enum_url
+        if after is None:
+            enum_url = plain_enum_url
+        else:
+            enum_url = urljoin(plain_enum_url, "?after=" + after)
 
-        while next_enum_url is not None:
+        if not prefetch:
+            while enum_url is not None:
+                (blob_metas, enum_url) = self._get_enumerate_page(
+                    plain_enum_url, enum_url, before,
+                )
+                yield blob_metas
+            return
 
-            resp = self.http_session.get(next_enum_url)
-            if resp.status_code != 200:
-                raise ServerError(
-                    "Failed to enumerate blobs from %s: got %i %s" % (
-                        next_enum_url,
-                        resp.status_code,
-                        resp.reason,
+        executor = ThreadPoolExecutor(max_workers=1)
+        next_page = executor.submit(
+            self._get_enumerate_page, plain_enum_url, enum_url, before,
+        )
+        try:
+            while next_page is not None:
+                (blob_metas, enum_url) = next_page.result()
+                if enum_url is not None:
+                    next_page = executor.submit(
+                        self._get_enumerate_page,
+                        plain_enum_url, enum_url, before,
                     )
+                else:
+                    next_page = None
+                yield blob_metas
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+            executor.shutdown(wait=False)
+
+    def _get_enumerate_page(self, plain_enum_url, enum_url, before):
+        resp = self.http_session.get(enum_url)
+        (blob_metas, next_enum_url) = self._parse_enumerate_response(
+            plain_enum_url, enum_url, resp,
+        )
+
+        if before is not None and (
+            len(blob_metas) > 0 and blob_metas[-1].blobref >= before
+        ):
+            blob_metas = [x for x in blob_metas if x.blobref < before]
+            next_enum_url = None
+
+        if self.presence is not None:
+            self.presence.add({
+                blob_meta.blobref: blob_meta.size
+                for blob_meta in blob_metas
+            })
+
+        return blob_metas, next_enum_url
+
+    def _parse_enumerate_response(self, plain_enum_url, enum_url, resp):
+        """
+        Decode one page of an enumeration, returning a list of
+        :py:class:`BlobMeta` and the URL of the next page, or ``None`` if
+        this was the last page.
+        """
+        if resp.status_code != 200:
+            raise ServerError(
+                "Failed to enumerate blobs from %s: got %i %s" % (
+                    enum_url,
+                    resp.status_code,
+                    resp.reason,
                 )
+            )
 
-            data = json.loads(resp.content)
+        data = json.loads(resp.content)
 
-            if "continueAfter" in data:
-                next_enum_url = urljoin(
-                    plain_enum_url,
-                    "?after=" + data["continueAfter"],
-                )
-            else:
-                next_enum_url = None
+        if "continueAfter" in data:
+            next_enum_url = urljoin(
+                plain_enum_url,
+                "?after=" + data["continueAfter"],
+            )
+        else:
+            next_enum_url = None
 
-            for raw_blob_reference in data["blobs"]:
-                yield BlobMeta(
-                    raw_blob_reference["blobRef"],
-                    size=raw_blob_reference["size"],
-                    blob_client=self,
-                )
+        blob_metas = [
+            BlobMeta(
+                raw_blob_reference["blobRef"],
+                size=raw_blob_reference["size"],
+                blob_client=self,
+            )
+            for raw_blob_reference in data["blobs"]
+        ]
+
+        return blob_metas, next_enum_url
 
     def put(self, blob):
         """
@@ -181,7 +480,7 @@ class BlobClient(object):
         result = self.put_multi(blob)
         return result[0]
 
-    def get_size_multi(self, *blobrefs):
+    def get_size_multi(self, *blobrefs, max_workers=DEFAULT_MAX_WORKERS):
         """
         Get the size of several blobs at once, given their blobrefs.
 
@@ -189,15 +488,73 @@ class BlobClient(object):
         mapping object whose keys are the request blobrefs and whose
         values are either the size of each corresponding blob or
         ``None`` if the blobref is not known to the server.
+
+        The blobrefs can be given either as separate arguments or as a
+        single iterable, which may be a generator. They are sent in chunks
+        of at most :py:attr:`max_batch_blobs`, with up to ``max_workers``
+        chunks in flight at once.
+
+        If :py:attr:`presence` is set, only the blobrefs it does not
+        already know about are sent to the server.
         """
+        chunks = _chunks(_iter_args(blobrefs, str), self.max_batch_blobs)
+
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
+            return {}
+        second_chunk = next(chunks, None)
+        if second_chunk is None:
+            # Everything fits in one request, so there's no need to spin
+            # up any worker threads.
+            return self._get_size_chunk(first_chunk)
+
+        ret = {}
+        results = bounded_map(
+            self._get_size_chunk,
+            itertools.chain([first_chunk, second_chunk], chunks),
+            max_workers=max_workers,
+        )
+        for _, future in results:
+            ret.update(future.result())
+
+        return ret
+
+    def _get_size_chunk(self, blobrefs):
+        if self.presence is None:
+            return self._stat(blobrefs)
+
+        ret = {blobref: None for blobref in blobrefs}
+        known = self.presence.get_sizes(ret.keys())
+        ret.update(known)
+
+        unknown = [blobref for blobref in ret if blobref not in known]
+        if len(unknown) > 0:
+            sizes = self._stat(unknown)
+            ret.update(sizes)
+            self.presence.add({
+                blobref: size
+                for blobref, size in sizes.items()
+                if size is not None
+            })
+
+        return ret
+
+    def _stat(self, blobrefs):
+        stat_url = self._make_url('camli/stat')
+        resp = self.http_session.post(
+            stat_url,
+            data=self._stat_form_data(blobrefs),
+        )
+        return self._sizes_from_response(blobrefs, resp)
+
+    def _stat_form_data(self, blobrefs):
         form_data = {}
         form_data["camliversion"] = "1"
         for i, blobref in enumerate(blobrefs):
             form_data["blob%i" % (i + 1)] = blobref
+        return form_data
 
-        stat_url = self._make_url('camli/stat')
-        resp = self.http_session.post(stat_url, data=form_data)
-
+    def _sizes_from_response(self, blobrefs, resp):
         if resp.status_code != 200:
             raise ServerError(
                 "Failed to get sizes of blobs: got %i %s" % (
@@ -222,43 +579,109 @@ class BlobClient(object):
         blobs at once and returning a list of their blobrefs in the
         same order as they were provided in the arguments.
 
-        At present this method does *not* correctly handle the protocol
-        restriction that only 32MB of data can be uploaded at once, so
-        this function will fail if that limit is exceeded. It is intended
-        that this will be fixed in a future version.
+        The blobs can be given either as separate arguments or as a single
+        iterable, which may be a generator of any length. Blobs are consumed
+        from the iterable one batch at a time, and each batch is sized to
+        respect the protocol restriction that at most 32MB of data can be
+        uploaded in a single request (see :py:attr:`max_upload_size` and
+        :py:attr:`max_batch_blobs`), so arbitrarily large imports can be
+        written without holding all of their blobs in memory at once.
         """
-        upload_url = self._make_url('camli/upload')
+        blobrefs = []
 
-        blobrefs = [
-            blob.blobref for blob in blobs
-        ]
+        for batch in self._batch_blobs(_iter_args(blobs, Blob)):
+            missing = self._find_missing(batch)
+            if len(missing) > 0:
+                self._upload_blobs(missing)
 
-        sizes = self.get_size_multi(*blobrefs)
+            blobrefs.extend(blob.blobref for blob in batch)
 
-        files_to_post = {}
+        return blobrefs
+
+    def _batch_blobs(self, blobs):
+        """
+        Group the given iterable of blobs into lists that can each be
+        uploaded in a single request.
+        """
+        batch = []
+        batch_size = 0
+
+        for blob in blobs:
+            part_size = blob.size + UPLOAD_PART_OVERHEAD
+            if len(batch) > 0 and (
+                len(batch) >= self.max_batch_blobs or
+                batch_size + part_size > self.max_upload_size
+            ):
+                yield batch
+                batch = []
+                batch_size = 0
+
+            batch.append(blob)
+            batch_size += part_size
+
+        if len(batch) > 0:
+            yield batch
+
+    def _find_missing(self, blobs):
+        """
+        Ask the server which of the given blobs it does not have yet,
+        returning a list of the blobs that need to be uploaded.
+        """
+        sizes = self.get_size_multi(*[blob.blobref for blob in blobs])
+        missing = self._missing_from_sizes(blobs, sizes)
 
+        if self.cache is not None:
+            for blob in blobs:
+                if sizes[blob.blobref] is not None:
+                    self.cache.put(blob)
+
+        return missing
+
+    def _missing_from_sizes(self, blobs, sizes):
+        missing = []
+        seen = set()
         for blob in blobs:
             blobref = blob.blobref
 
-            if sizes[blobref] is not None:
-                # Server already has this blob, so skip
+            if sizes[blobref] is not None or blobref in seen:
+                # Server already has this blob (or we've already queued
+                # it in this batch), so skip
                 continue
 
-            files_to_post[blobref] = (
-                blobref,
+            seen.add(blobref)
+            missing.append(blob)
+
+        return missing
+
+    def _upload_blobs(self, blobs):
+        """
+        Upload the given blobs in a single request, without checking
+        whether the server already has them.
+
+        Callers are responsible for keeping the batch within the protocol
+        limits; :py:meth:`_batch_blobs` produces suitable batches.
+        """
+        upload_url = self._make_url('camli/upload')
+
+        files_to_post = {}
+        for blob in blobs:
+            files_to_post[blob.blobref] = (
+                blob.blobref,
                 blob.data,
                 'application/octet-stream',
             )
 
-        if len(files_to_post) == 0:
-            # Server already has everything, so nothing to do.
-            return blobrefs
-
-        # FIXME: We should detect if our total upload size is >32MB
-        # and automatically split it into multiple requests, since the
-        # protocol forbids upload payloads greater than 32MB.
         resp = self.http_session.post(upload_url, files=files_to_post)
+        self._check_upload_response(resp)
+
+        if self.cache is not None:
+            for blob in blobs:
+                self.cache.put(blob)
+
+        if self.presence is not None:
+            self.presence.add({blob.blobref: blob.size for blob in blobs})
 
+    def _check_upload_response(self, resp):
         if resp.status_code != 200:
             raise ServerError(
                 "Failed to upload blobs: got %i %s" % (
@@ -267,8 +690,6 @@ class BlobClient(object):
                 )
             )
 
-        return blobrefs
-
 
 class Blob(object):
     """
@@ -389,6 +810,206 @@ class Blob(object):
         self._blobref = None  # force to be recomputed on next access
 
 
+class BlobReader(io.RawIOBase):
+    """
+    A read-only binary stream over the data of a single blob, as returned
+    by :py:meth:`BlobClient.get_stream`.
+
+    The data is hashed incrementally as it is read. Once the end of the
+    stream is reached the hash is compared with :py:attr:`blobref`, and
+    :py:class:`camlistore.exceptions.HashMismatchError` is raised if
+    they differ. Data returned before that point has not been verified,
+    so callers must read to the end before trusting it.
+
+    Callers should not instantiate this class directly.
+    """
+
+    #: The blobref of the blob being read.
+    blobref = None
+
+    def __init__(self, blobref, resp):
+        super(BlobReader, self).__init__()
+        try:
+            (hash_func_name, _) = blobref.split('-', 1)
+        except ValueError as e:
+            raise HashMismatchError(
+                f'Supplied blobref "{blobref}" appears malformed') from e
+
+        self.blobref = blobref
+        self._hash = hashlib.new(hash_func_name)
+        self._resp = resp
+        self._raw = resp.raw
+        # Have urllib3 undo any content-encoding so that we hash the
+        # blob itself rather than its compressed form.
+        self._raw.decode_content = True
+        self._verified = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        if len(view) == 0:
+            return 0
+
+        n = self._raw.readinto(view)
+        if n == 0:
+            self._verify()
+        else:
+            self._hash.update(view[:n])
+        return n
+
+    def copy_to(self, fileobj, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Copy the rest of the stream into the given binary file-like object,
+        returning the number of bytes copied.
+        """
+        buf = memoryview(bytearray(chunk_size))
+        total = 0
+        while True:
+            n = self.readinto(buf)
+            if n == 0:
+                return total
+            fileobj.write(buf[:n])
+            total += n
+
+    def read_into_buffer(self, target):
+        """
+        Read the rest of the stream directly into the given writable
+        buffer, returning the number of bytes read.
+
+        Raises :py:class:`ValueError` if the buffer fills up before the
+        end of the stream.
+        """
+        view = memoryview(target).cast('B')
+        total = 0
+        while True:
+            if total == len(view):
+                # Make sure we're really at the end, so that the hash is
+                # still checked when the buffer is exactly the right size.
+                if self.read(1) != b'':
+                    raise ValueError(
+                        "Buffer of %i bytes is too small for blob %s" % (
+                            len(view),
+                            self.blobref,
+                        )
+                    )
+                return total
+
+            n = self.readinto(view[total:])
+            if n == 0:
+                return total
+            total += n
+
+    def close(self):
+        if not self.closed:
+            self._resp.close()
+        super(BlobReader, self).close()
+
+    def _verify(self):
+        if self._verified:
+            return
+
+        hash_func_name = self.blobref.split('-', 1)[0]
+        apparent_blobref = '-'.join([
+            hash_func_name,
+            self._hash.hexdigest(),
+        ])
+        if apparent_blobref != self.blobref:
+            raise HashMismatchError(
+                "Expected blobref %s but provided data has blobref %s" % (
+                    self.blobref,
+                    apparent_blobref,
+                )
+            )
+        self._verified = True
+
+    def __repr__(self):
+        return "<camlistore.blobclient.BlobReader %s>" % self.blobref
+
+
+class ResumableEnumeration(object):
+    """
+    An enumeration of blobs that keeps track of its position, as returned by
+    :py:meth:`BlobClient.enumerate_resumable`.
+
+    A blob counts as processed once the caller asks for the next one, so
+    after an interruption the enumeration resumes with the first blob the
+    caller had not finished with.
+
+    Callers should not instantiate this class directly.
+    """
+
+    #: The blobref of the last blob that the caller finished processing, or
+    #: ``None`` if none have been processed yet. Passing this value as the
+    #: ``after`` argument of :py:meth:`BlobClient.enumerate` continues the
+    #: enumeration from this point.
+    after = None
+
+    def __init__(
+        self,
+        blob_client,
+        checkpoint_path=None,
+        after=None,
+        checkpoint_interval=10.0,
+        prefetch=False,
+    ):
+        self.blob_client = blob_client
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.prefetch = prefetch
+
+        if after is None and checkpoint_path is not None:
+            after = _read_checkpoint(checkpoint_path)
+        self.after = after
+
+    def __iter__(self):
+        last_checkpoint = time.monotonic()
+        saved_after = self.after
+        finished = False
+        try:
+            blob_metas = self.blob_client.enumerate(
+                prefetch=self.prefetch,
+                after=self.after,
+            )
+            for blob_meta in blob_metas:
+                yield blob_meta
+                # If we get here then the caller has asked for the next
+                # item, so they must be done with this one.
+                self.after = blob_meta.blobref
+
+                if self.checkpoint_path is not None and (
+                    time.monotonic() - last_checkpoint >=
+                    self.checkpoint_interval
+                ):
+                    self.save_checkpoint()
+                    saved_after = self.after
+                    last_checkpoint = time.monotonic()
+            finished = True
+        finally:
+            if self.checkpoint_path is not None:
+                if finished:
+                    # There's nothing left to resume, and leaving the last
+                    # position behind would make the next run skip every
+                    # blob that sorts before it.
+                    _clear_checkpoint(self.checkpoint_path)
+                elif self.after != saved_after:
+                    self.save_checkpoint()
+
+    def save_checkpoint(self):
+        """
+        Write the current position to the checkpoint file, replacing it
+        atomically so that a crash never leaves a partial checkpoint behind.
+        """
+        if self.after is not None:
+            _write_checkpoint(self.checkpoint_path, self.after)
+
+    def __repr__(self):
+        return "<camlistore.blobclient.ResumableEnumeration after %s>" % (
+            self.after,
+        )
+
+
 class BlobMeta(object):
     """
     Metadata about a blob.
@@ -423,3 +1044,93 @@ class BlobMeta(object):
 
     def __repr__(self):
         return "<camlistore.blobclient.BlobMeta %s>" % self.blobref
+
+
+def _read_checkpoint(path):
+    """
+    Read an enumeration position saved by :py:func:`_write_checkpoint`,
+    returning ``None`` if there is no checkpoint.
+    """
+    try:
+        with open(path) as f:
+            after = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return after if after != "" else None
+
+
+def _write_checkpoint(path, after):
+    """
+    Atomically replace the checkpoint file at ``path`` with the given
+    enumeration position.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    (fd, temp_path) = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(after)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _clear_checkpoint(path):
+    """
+    Remove the checkpoint file at ``path``, if there is one.
+    """
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _shard_ranges(shards, hash_func_names):
+    """
+    Split the blobref keyspace into ``(after, before)`` ranges, as used by
+    :py:meth:`BlobClient.enumerate_sharded`.
+    """
+    # Enough leading hex digits to tell all of the shards apart.
+    digits = 1
+    while 16 ** digits < shards:
+        digits += 1
+
+    boundaries = []
+    for hash_func_name in sorted(hash_func_names):
+        prefix = hash_func_name + '-'
+        boundaries.append(prefix)
+        for i in range(1, shards):
+            boundaries.append(
+                prefix + '%0*x' % (digits, i * 16 ** digits // shards)
+            )
+
+    # No blobref is ever equal to one of the boundaries, since they are all
+    # prefixes of possible blobrefs, so using them as exclusive lower bounds
+    # doesn't skip anything.
+    afters = [None] + boundaries
+    befores = boundaries + [None]
+    return list(zip(afters, befores))
+
+
+def _chunks(items, size):
+    """
+    Split an iterable into lists of at most the given size.
+    """
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def _iter_args(args, item_type):
+    """
+    Normalize the arguments of the batch methods, which accept either
+    several items as separate arguments or a single iterable of items.
+    """
+    if len(args) == 1 and not isinstance(args[0], (item_type, str)):
+        return iter(args[0])
+    return iter(args)
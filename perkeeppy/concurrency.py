@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def bounded_map(func, items, max_workers, ordered=True, executor=None):
+    """
+    Call ``func`` on each of the given items using a pool of worker threads.
+
+    This is a generator yielding ``(item, future)`` pairs, where each
+    future has already completed. Callers decide whether to re-raise an
+    exception by calling ``future.result()``.
+
+    Unlike :py:meth:`concurrent.futures.Executor.map`, only a small window
+    of items is read from ``items`` ahead of the results being consumed,
+    so ``items`` may be an arbitrarily long generator. If ``ordered`` is
+    ``True`` the results are yielded in the same order as the items;
+    otherwise they are yielded as soon as each one completes.
+
+    If the caller stops iterating early, any work not yet started is
+    cancelled.
+
+    If ``executor`` is given, such as a
+    :py:class:`concurrent.futures.ProcessPoolExecutor`, the work is
+    submitted to it instead, and it is left running afterwards.
+    """
+    items = iter(items)
+    window = max_workers * 2
+    pending = collections.OrderedDict()
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < window:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(func, item)] = item
+
+            if len(pending) == 0:
+                return
+
+            if ordered:
+                future = next(iter(pending))
+                wait([future])
+                yield pending.pop(future), future
+            else:
+                done, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False)
+
+
+_ITEM = 'item'
+_DONE = 'done'
+_ERROR = 'error'
+
+
+def interleave(generator_funcs, max_workers, ordered=True, queue_size=2):
+    """
+    Run several generators concurrently, yielding all of their items.
+
+    Each of ``generator_funcs`` is called with no arguments on a pool of
+    ``max_workers`` threads, and must return an iterable. If ``ordered`` is
+    ``True``, all of the items from the first generator are yielded, then
+    all of the items from the second, and so on, while later generators
+    run ahead; otherwise items are yielded as soon as any generator
+    produces them.
+
+    Each generator can run at most ``queue_size`` items ahead of the
+    consumer before it is paused, so memory usage stays bounded. An
+    exception raised by any generator is re-raised to the consumer, and
+    if the consumer stops iterating early, the generators are abandoned.
+    """
+    generator_funcs = list(generator_funcs)
+    stop = threading.Event()
+
+    if ordered:
+        queues = [queue.Queue(queue_size) for _ in generator_funcs]
+    else:
+        shared_queue = queue.Queue(queue_size * max_workers)
+        queues = [shared_queue] * len(generator_funcs)
+
+    def run(index, generator_func):
+        if stop.is_set():
+            return
+        q = queues[index]
+        try:
+            for item in generator_func():
+                if not _put_unless_stopped(q, (_ITEM, item), stop):
+                    return
+        except BaseException as e:
+            _put_unless_stopped(q, (_ERROR, e), stop)
+        else:
+            _put_unless_stopped(q, (_DONE, None), stop)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for index, generator_func in enumerate(generator_funcs):
+            executor.submit(run, index, generator_func)
+
+        remaining = len(generator_funcs)
+        current = 0
+        while remaining > 0:
+            (kind, value) = queues[current].get()
+            if kind is _ITEM:
+                yield value
+            elif kind is _DONE:
+                remaining -= 1
+                if ordered:
+                    current += 1
+            else:
+                raise value
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
+
+
+def _put_unless_stopped(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+        except queue.Full:
+            continue
+        return True
+    return False
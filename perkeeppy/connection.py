@@ -7,6 +7,7 @@ from urllib.parse import urljoin
 import requests
 
 from perkeeppy.blobclient import BlobClient
+from perkeeppy.filewriter import FileWriter
 from perkeeppy.searchclient import SearchClient
 from perkeeppy.signing import Signer
 from perkeeppy.uploadhelper import UploadHelper
@@ -16,6 +17,10 @@ from perkeeppy.exceptions import NotPerkeepServerError
 from perkeeppy import __version__
 user_agent = "python-perkeeppy/%s" % __version__
 
+# The batch operations on the clients make concurrent requests from several
+# threads, so we keep enough pooled connections around for all of them.
+http_pool_size = 32
+
 
 class Connection(object):
     """
@@ -40,13 +45,21 @@ class Connection(object):
     #: :py:class:`perkeeppy.searchclient.SearchClient`.
     searcher = None
 
+    #: Writes files into the blob store, chunking them locally, via an
+    #: instance of :py:class:`perkeeppy.filewriter.FileWriter`.
+    filewriter = None
+
     def __init__(
         self,
         http_session=None,
         blob_root=None,
         search_root=None,
         sign_root=None,
-        uploadhelper_root=None
+        uploadhelper_root=None,
+        blob_cache=None,
+        presence_cache=None,
+        signer=None,
+        search_cache=None,
     ):
 
         self.http_session = http_session
@@ -58,14 +71,21 @@ class Connection(object):
         self.blobs = BlobClient(
             http_session=http_session,
             base_url=blob_root,
+            cache=blob_cache,
+            presence=presence_cache,
         )
 
+        self.filewriter = FileWriter(self.blobs)
+
         self.searcher = SearchClient(
             http_session=http_session,
             base_url=search_root,
+            cache=search_cache,
         )
 
-        if sign_root:
+        if signer is not None:
+            self.signer = signer
+        elif sign_root:
             self.signer = Signer(
                 http_session=http_session,
                 base_url=sign_root
@@ -84,10 +104,34 @@ class Connection(object):
 
 # Internals of the public "connect" function, split out so we can easily test
 # it with a mock http_session while not making the public interface look weird.
-def _connect(base_url, http_session):
-    config_url = urljoin(base_url, '?camli.mode=config')
+def _connect(
+    base_url,
+    http_session,
+    blob_cache=None,
+    presence_cache=None,
+    signer=None,
+    search_cache=None,
+):
+    config_url = _config_url(base_url)
     config_resp = http_session.get(config_url)
 
+    return Connection(
+        http_session=http_session,
+        blob_cache=blob_cache,
+        presence_cache=presence_cache,
+        signer=signer,
+        search_cache=search_cache,
+        **_roots_from_config_response(config_url, config_resp)
+    )
+
+
+def _config_url(base_url):
+    return urljoin(base_url, '?camli.mode=config')
+
+
+# Decodes the discovery document, returning the keyword arguments for the
+# roots of the Connection. This is shared with the asyncio connect function.
+def _roots_from_config_response(config_url, config_resp):
     if config_resp.status_code != 200:
         raise NotPerkeepServerError(
             "Configuration request returned %i %s" % (
@@ -131,16 +175,21 @@ def _connect(base_url, http_session):
     if "uploadHelper" in raw_config:
         uploadhelper_root = urljoin(config_url, raw_config["uploadHelper"])
 
-    return Connection(
-        http_session=http_session,
+    return dict(
         blob_root=blob_root,
         search_root=search_root,
         sign_root=sign_root,
-        uploadhelper_root=uploadhelper_root
+        uploadhelper_root=uploadhelper_root,
     )
 
 
-def connect(base_url):
+def connect(
+    base_url,
+    blob_cache=None,
+    presence_cache=None,
+    signer=None,
+    search_cache=None,
+):
     """
     Create a connection to the Perkeep instance at the given base URL.
 
@@ -151,10 +200,30 @@ def connect(base_url):
     For now we assume an unauthenticated connection, which is generally
     only possible when connecting via ``localhost``. In future this function
     will be extended with some options for configuring authentication.
+
+    If ``blob_cache`` is given, it is used as the
+    :py:attr:`perkeeppy.blobclient.BlobClient.cache` of the connection's blob
+    client; see :py:class:`perkeeppy.blobcache.DiskBlobCache`. Likewise,
+    ``presence_cache`` is used as its
+    :py:attr:`perkeeppy.blobclient.BlobClient.presence`; see
+    :py:class:`perkeeppy.presence.MemoryPresenceCache`.
+
+    ``signer`` can be given to sign documents with something other than the
+    server's signing helper, such as a
+    :py:class:`perkeeppy.signing.LocalSigner`; it then becomes the
+    connection's :py:attr:`Connection.signer`.
+
+    If ``search_cache`` is given, it is used as the
+    :py:attr:`perkeeppy.searchclient.SearchClient.cache` of the connection's
+    search client; see
+    :py:class:`perkeeppy.descriptioncache.DescriptionCache`.
     """
     http_session = requests.Session()
     http_session.trust_env = False
     http_session.headers["User-Agent"] = user_agent
+    http_adapter = requests.adapters.HTTPAdapter(pool_maxsize=http_pool_size)
+    http_session.mount("http://", http_adapter)
+    http_session.mount("https://", http_adapter)
     # TODO: let the caller pass in a trusted SSL cert and then turn
     # on SSL cert verification. Until we do that we're vulnerable to
     # certain types of MITM attack on our SSL connections.
@@ -162,4 +231,8 @@ def connect(base_url):
     return _connect(
         base_url,
         http_session=http_session,
+        blob_cache=blob_cache,
+        presence_cache=presence_cache,
+        signer=signer,
+        search_cache=search_cache,
     )
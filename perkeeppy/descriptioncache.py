@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import threading
+import time
+
+# The types of blob whose description never changes once it has been
+# indexed, since they are immutable and don't gain attributes from claims.
+IMMUTABLE_TYPES = frozenset([
+    'bytes',
+    'directory',
+    'fifo',
+    'file',
+    'socket',
+    'static-set',
+    'symlink',
+])
+
+# The default number of entries kept by a DescriptionCache.
+DEFAULT_MAX_ENTRIES = 10000
+
+# The default number of seconds for which a DescriptionCache keeps
+# descriptions of mutable blobs, such as permanodes, and claim lists.
+DEFAULT_TTL = 60.0
+
+
+class DescriptionCache(object):
+    """
+    Keeps recent blob descriptions and permanode claims in memory.
+
+    An instance can be assigned to
+    :py:attr:`perkeeppy.searchclient.SearchClient.cache` (or passed to
+    :py:func:`perkeeppy.connect` as ``search_cache``), after which the
+    search client answers
+    :py:meth:`perkeeppy.searchclient.SearchClient.describe_blob`,
+    :py:meth:`perkeeppy.searchclient.SearchClient.describe_many` and
+    :py:meth:`perkeeppy.searchclient.SearchClient.get_claims_for_permanode`
+    from the cache where it can.
+
+    Descriptions of blobs whose type is in :py:data:`IMMUTABLE_TYPES` are
+    kept until they are evicted, as long as the related descriptions
+    fetched with them are too. Descriptions of other blobs, such as
+    permanodes whose attributes change as claims are added, and claim lists
+    are only used for ``ttl`` seconds after they were fetched, so the
+    cache may return data up to that old. At most ``max_entries`` entries
+    are kept, discarding the least recently used first.
+    """
+
+    #: The number of lookups that were answered from the cache.
+    hits = 0
+
+    #: The number of lookups that were not in the cache, or had expired.
+    misses = 0
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        # Maps key to a tuple of value and expiry time, which is None for
+        # entries that never expire, least recently used first.
+        self._entries = collections.OrderedDict()
+
+    def get_description(self, blobref):
+        """
+        Return a tuple of the raw description of the given blob and the
+        pool of raw descriptions it was fetched with, or ``None`` if it is
+        not in the cache.
+        """
+        return self._get(('describe', blobref))
+
+    def add_description(self, blobref, raw_dict, other_raw_dicts):
+        """
+        Record the raw description of a blob, along with the pool of raw
+        descriptions of related blobs that it was fetched with.
+        """
+        # The related descriptions are served through describe_another, so
+        # a mutable one among them must expire along with the entry.
+        raw_dicts = [raw_dict]
+        raw_dicts.extend(other_raw_dicts.values())
+        if all(
+            raw.get('camliType') in IMMUTABLE_TYPES for raw in raw_dicts
+        ):
+            ttl = None
+        else:
+            ttl = self.ttl
+        self._put(('describe', blobref), (raw_dict, other_raw_dicts), ttl)
+
+    def get_claims(self, blobref):
+        """
+        Return the list of claims for the given permanode, or ``None`` if it
+        is not in the cache.
+        """
+        return self._get(('claims', blobref))
+
+    def add_claims(self, blobref, claims):
+        """
+        Record the list of claims for a permanode.
+        """
+        self._put(('claims', blobref), claims, self.ttl)
+
+    def clear(self):
+        """
+        Forget everything in the cache. The counters are not reset.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                (value, expires) = entry
+                if expires is not None and time.monotonic() >= expires:
+                    del self._entries[key]
+                    entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _put(self, key, value, ttl):
+        if ttl is None:
+            expires = None
+        else:
+            expires = time.monotonic() + ttl
+
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import collections
+import io
+import json
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from perkeeppy.blobclient import DEFAULT_MAX_WORKERS, STREAM_CHUNK_SIZE
+
+# The default number of bytes of chunk data that a FileReader keeps around
+# after it has been read, so that nearby seeks don't fetch chunks again.
+DEFAULT_CACHE_SIZE = 16 * 1024 * 1024
+
+
+class FileReader(io.RawIOBase):
+    """
+    A read-only, seekable binary stream over the contents of a ``file`` or
+    ``bytes`` schema blob.
+
+    ``fileref`` is the blobref of the schema blob, such as one returned by
+    :py:meth:`perkeeppy.uploadhelper.UploadHelper.upload_file` or
+    :py:meth:`perkeeppy.filewriter.FileWriter.upload_file`. Its ``parts``
+    tree is resolved as the file is read, fetching only the chunks and
+    nested ``bytes`` blobs that cover the position being read, so seeking
+    and then reading a small range of a large file is cheap.
+
+    While reading, the chunks following the current position are fetched
+    ahead of time on up to ``max_workers`` threads. Chunks that have been
+    read are kept in memory, up to ``cache_size`` bytes, most recently used
+    first.
+
+    Raises :py:class:`ValueError` if ``fileref`` does not refer to a file.
+    """
+
+    #: The blobref of the file being read.
+    fileref = None
+
+    #: The size of the file, in bytes.
+    size = None
+
+    def __init__(
+        self,
+        blob_client,
+        fileref,
+        max_workers=DEFAULT_MAX_WORKERS,
+        cache_size=DEFAULT_CACHE_SIZE,
+    ):
+        super(FileReader, self).__init__()
+        self.blob_client = blob_client
+        self.fileref = fileref
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+
+        schema = self._get_schema(fileref)
+        if schema.get('camliType') not in ('file', 'bytes'):
+            raise ValueError(f'{fileref} is not a file')
+
+        self._root = _PartList(schema.get('parts', []))
+        self.size = self._root.size
+        self._pos = 0
+
+        # Parsed bytes schema blobs, which are small and read repeatedly
+        # while walking the tree.
+        self._part_lists = {}
+
+        self._lock = threading.Lock()
+        # Maps blobref to chunk data, least recently used first.
+        self._cache = collections.OrderedDict()
+        self._cache_total = 0
+        # Maps blobref to the future of a prefetch that is in progress.
+        self._pending = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f'Invalid whence ({whence})')
+
+        if pos < 0:
+            raise ValueError(f'Negative seek position {pos}')
+        self._pos = pos
+        return pos
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        if len(view) == 0 or self._pos >= self.size:
+            return 0
+
+        leaves = self._leaves(self._pos)
+        (blobref, start, leaf_offset, leaf_size) = next(leaves)
+        self._prefetch(blobref, leaves)
+
+        n = min(len(view), leaf_size)
+        if blobref is None:
+            # A part with no blob is a run of zeroes
+            view[:n] = bytes(n)
+        else:
+            data = self._get_chunk(blobref)
+            view[:n] = data[leaf_offset:leaf_offset + n]
+
+        self._pos += n
+        return n
+
+    def read(self, size=-1):
+        # Unlike a plain raw stream, a read spanning several chunks returns
+        # all of the requested bytes rather than stopping at the first
+        # chunk boundary.
+        if size is None or size < 0:
+            return self.readall()
+
+        buf = bytearray(size)
+        view = memoryview(buf)
+        total = 0
+        while total < size:
+            n = self.readinto(view[total:])
+            if n == 0:
+                break
+            total += n
+        view.release()
+        del buf[total:]
+        return bytes(buf)
+
+    def read_range(self, offset, size):
+        """
+        Return up to ``size`` bytes starting at ``offset``, without
+        changing the current position.
+        """
+        pos = self._pos
+        try:
+            self.seek(offset)
+            return self.read(size)
+        finally:
+            self._pos = pos
+
+    def copy_to(self, fileobj, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Copy the rest of the file into the given binary file-like object,
+        returning the number of bytes copied.
+        """
+        buf = memoryview(bytearray(chunk_size))
+        total = 0
+        while True:
+            n = self.readinto(buf)
+            if n == 0:
+                return total
+            fileobj.write(buf[:n])
+            total += n
+
+    def close(self):
+        if not self.closed:
+            with self._lock:
+                for future in self._pending.values():
+                    future.cancel()
+                self._pending.clear()
+                self._cache.clear()
+                self._cache_total = 0
+            self._executor.shutdown(wait=False)
+        super(FileReader, self).close()
+
+    def _get_schema(self, blobref):
+        blob = self.blob_client.get(blobref)
+        return json.loads(blob.data.decode('utf8'))
+
+    def _get_part_list(self, bytesref):
+        part_list = self._part_lists.get(bytesref)
+        if part_list is None:
+            schema = self._get_schema(bytesref)
+            part_list = _PartList(schema.get('parts', []))
+            self._part_lists[bytesref] = part_list
+        return part_list
+
+    def _leaves(self, pos):
+        """
+        Generate ``(blobref, start, offset, size)`` tuples for the chunks
+        making up the file from ``pos`` onwards, where ``start`` is the
+        position in the file at which ``size`` bytes of the chunk, starting
+        at ``offset`` within it, appear. ``blobref`` is ``None`` for runs of
+        zeroes.
+        """
+        # Each stack entry is a part list, the index of the next part to
+        # visit within it, the file position corresponding to the start of
+        # the part list, and the range of file positions it is clipped to.
+        stack = [(self._root, self._root.index(pos), 0, 0, self.size)]
+
+        while len(stack) > 0:
+            (part_list, index, base, begin, end) = stack.pop()
+            if index >= len(part_list.parts):
+                continue
+
+            part_start = base + part_list.starts[index]
+            if part_start >= end:
+                continue
+            stack.append((part_list, index + 1, base, begin, end))
+
+            part_end = min(base + part_list.starts[index + 1], end)
+            if pos >= part_end:
+                continue
+            start = max(pos, part_start, begin)
+
+            part = part_list.parts[index]
+            offset = int(part.get('offset', 0))
+            skip = start - part_start
+
+            if 'bytesRef' in part:
+                # The part covers the nested bytes blob from its offset
+                # onwards, so that offset is found at part_start.
+                child = self._get_part_list(part['bytesRef'])
+                stack.append((
+                    child,
+                    child.index(offset + skip),
+                    part_start - offset,
+                    start,
+                    part_end,
+                ))
+            else:
+                yield (
+                    part.get('blobRef'),
+                    start,
+                    offset + skip,
+                    part_end - start,
+                )
+
+    def _prefetch(self, current, leaves):
+        upcoming = [
+            blobref
+            for (blobref, _, _, _) in _take(leaves, self.max_workers)
+            if blobref is not None
+        ]
+
+        with self._lock:
+            # Forget about prefetches that a seek has made irrelevant,
+            # keeping any data they already fetched. The prefetch of the
+            # chunk being read right now is kept for _get_chunk to wait on.
+            for blobref in list(self._pending):
+                if blobref == current or blobref in upcoming:
+                    continue
+                future = self._pending.pop(blobref)
+                if not future.cancel() and future.done():
+                    if future.exception() is None:
+                        self._add_to_cache(blobref, future.result().data)
+
+            for blobref in upcoming:
+                if blobref in self._cache or blobref in self._pending:
+                    continue
+                self._pending[blobref] = self._executor.submit(
+                    self.blob_client.get, blobref,
+                )
+
+    def _get_chunk(self, blobref):
+        with self._lock:
+            data = self._cache.get(blobref)
+            if data is not None:
+                self._cache.move_to_end(blobref)
+                return data
+            future = self._pending.pop(blobref, None)
+
+        if future is not None and not future.cancelled():
+            data = future.result().data
+        else:
+            data = self.blob_client.get(blobref).data
+
+        with self._lock:
+            self._add_to_cache(blobref, data)
+
+        return data
+
+    def _add_to_cache(self, blobref, data):
+        # Must be called with the lock held.
+        if blobref not in self._cache:
+            self._cache[blobref] = data
+            self._cache_total += len(data)
+        self._cache.move_to_end(blobref)
+        while self._cache_total > self.cache_size and len(self._cache) > 1:
+            (_, evicted) = self._cache.popitem(last=False)
+            self._cache_total -= len(evicted)
+
+    def __repr__(self):
+        return "<perkeeppy.filereader.FileReader %s>" % self.fileref
+
+
+class _PartList(object):
+    """
+    The ``parts`` of a file or bytes schema blob, indexed by the position
+    at which each part starts.
+    """
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.sizes = [int(part.get('size', 0)) for part in parts]
+        self.starts = [0]
+        for size in self.sizes:
+            self.starts.append(self.starts[-1] + size)
+        self.size = self.starts[-1]
+
+    def index(self, pos):
+        """
+        Return the index of the part containing ``pos``, or the number of
+        parts if ``pos`` is beyond the end.
+        """
+        return max(0, bisect.bisect_right(self.starts, pos) - 1)
+
+
+def _take(iterable, n):
+    for (_, item) in zip(range(n), iterable):
+        yield item
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+from perkeeppy.blobclient import Blob
+from perkeeppy.rollsum import RollSum
+from perkeeppy.schema import SchemaObject
+
+# These match the chunking parameters of Perkeep's own file writer
+# (pkg/schema/filewriter.go), so that files written by either client are
+# split at the same places and share their chunks.
+
+# No chunk is ever larger than this.
+MAX_BLOB_SIZE = 1024 * 1024
+
+# The first chunk of a file is always cut at exactly this size, if the file
+# is large enough, so that tools which only read the start of a file to
+# identify it need just one chunk. No checksum boundaries are used before
+# this point.
+FIRST_CHUNK_SIZE = 256 * 1024
+
+# The span tree weight given to the first chunk.
+FIRST_CHUNK_BITS = 18
+
+# Rolling checksum boundaries are ignored until a chunk is larger than this,
+# to avoid a flood of tiny chunks.
+TOO_SMALL_THRESHOLD = 64 * 1024
+
+# The span tree weight given to a chunk that was cut at MAX_BLOB_SIZE rather
+# than at a checksum boundary.
+MAX_BLOB_BITS = 20
+
+# How much of the file is read at once while looking for boundaries.
+READ_SIZE = 1024 * 1024
+
+
+class FileWriter(object):
+    """
+    Writes files into the blob store, chunking them locally.
+
+    This is an alternative to :py:class:`perkeeppy.uploadhelper.UploadHelper`
+    which splits each file at content-defined boundaries found with
+    Perkeep's rolling checksum, builds the ``bytes`` and ``file`` schema
+    blobs describing the chunks, and writes them all with
+    :py:meth:`perkeeppy.blobclient.BlobClient.put_multi`. Chunks are
+    stat'ed in batches and only those that the server lacks are uploaded,
+    so re-writing a large file that has changed slightly only sends the
+    chunks around the changes, and identical regions of different files are
+    stored once.
+
+    Callers should usually use :py:attr:`perkeeppy.Connection.filewriter`
+    rather than instantiating this class directly.
+    """
+
+    def __init__(self, blob_client):
+        self.blob_client = blob_client
+
+    def upload_file(self, filename, fileobj, mtime=None):
+        """
+        Write a single file.
+
+        ``filename`` is the desired file name to be stored in the blob store.
+        It cannot be blank. ``fileobj`` is a binary file-like object
+        containing the contents of the file to be stored, which is read
+        incrementally. Optionally, ``mtime`` can also be a string with a
+        valid file modification timestamp (meaning an ISO timestamp).
+
+        Returns a blobref pointing to the schema object for the file.
+        """
+        if not filename or not isinstance(filename, str):
+            raise ValueError(f'Invalid filename supplied: {filename}')
+
+        spans = []
+
+        def chunk_blobs():
+            for (data, bits) in split_chunks(fileobj):
+                blob = Blob(data)
+                _add_span(spans, _Span(blob.blobref, len(data), bits))
+                yield blob
+
+        self.blob_client.put_multi(chunk_blobs())
+
+        schema_blobs = []
+        parts = _bytes_parts(spans, schema_blobs)
+
+        data = {
+            'fileName': filename,
+            'parts': parts,
+        }
+        if mtime:
+            data['unixMtime'] = mtime
+        file_blob = SchemaObject('file', data=data).to_blob()
+
+        # The file's own schema blob goes last, so that it is never on the
+        # server without the blobs it refers to.
+        schema_blobs.append(file_blob)
+        self.blob_client.put_multi(schema_blobs)
+
+        return file_blob.blobref
+
+
+def split_chunks(fileobj):
+    """
+    Read ``fileobj`` to the end, generating ``(data, bits)`` tuples for the
+    chunks it is split into, where ``bits`` is the span tree weight of the
+    boundary that ended each chunk. The final chunk has a weight of zero.
+    """
+    rollsum = RollSum()
+    chunk = bytearray()
+    first = True
+
+    while True:
+        data = fileobj.read(READ_SIZE)
+        if not data:
+            break
+
+        pos = 0
+        end = len(data)
+        while pos < end:
+            if first:
+                stop = min(end, pos + FIRST_CHUNK_SIZE - len(chunk))
+                rollsum.roll_bytes(data, pos, stop)
+                chunk += data[pos:stop]
+                pos = stop
+                if len(chunk) == FIRST_CHUNK_SIZE:
+                    yield (bytes(chunk), FIRST_CHUNK_BITS)
+                    chunk = bytearray()
+                    first = False
+                continue
+
+            if len(chunk) < TOO_SMALL_THRESHOLD:
+                stop = min(end, pos + TOO_SMALL_THRESHOLD - len(chunk))
+                rollsum.roll_bytes(data, pos, stop)
+                chunk += data[pos:stop]
+                pos = stop
+                continue
+
+            stop = min(end, pos + MAX_BLOB_SIZE - len(chunk))
+            split = rollsum.roll_until_split(data, pos, stop)
+            found = split is not None
+            if not found:
+                split = stop
+            chunk += data[pos:split]
+            pos = split
+
+            if len(chunk) == MAX_BLOB_SIZE:
+                bits = MAX_BLOB_BITS
+            elif found:
+                bits = rollsum.bits()
+            else:
+                # Reached the end of what we've read without a boundary.
+                continue
+
+            yield (bytes(chunk), bits)
+            chunk = bytearray()
+
+    if len(chunk) > 0:
+        yield (bytes(chunk), 0)
+
+
+class _Span(object):
+    """
+    A chunk of a file, along with the preceding spans that were folded
+    under it because their boundaries had a lower weight.
+    """
+
+    __slots__ = ('blobref', 'size', 'bits', 'children')
+
+    def __init__(self, blobref, size, bits):
+        self.blobref = blobref
+        self.size = size
+        self.bits = bits
+        self.children = []
+
+    def total_size(self):
+        return self.size + sum(child.total_size() for child in self.children)
+
+
+def _add_span(spans, span):
+    # Spans at the end of the list whose weight is lower than the new one
+    # become its children, which gives a tree whose shape depends only on
+    # the content, like the chunk boundaries themselves.
+    children_from = len(spans)
+    while children_from > 0 and spans[children_from - 1].bits < span.bits:
+        children_from -= 1
+
+    span.children = spans[children_from:]
+    del spans[children_from:]
+    spans.append(span)
+
+
+def _bytes_parts(spans, schema_blobs):
+    """
+    Return the list of parts describing the given spans, appending any
+    ``bytes`` schema blobs needed for their children to ``schema_blobs``.
+    """
+    parts = []
+
+    for span in spans:
+        children = span.children
+        if len(children) == 1 and len(children[0].children) == 0:
+            # A bytes blob pointing at a single chunk would be a useless
+            # indirection, so refer to the chunk directly.
+            parts.append({
+                'blobRef': children[0].blobref,
+                'size': children[0].size,
+            })
+        elif len(children) > 0:
+            bytes_blob = SchemaObject(
+                'bytes',
+                data={'parts': _bytes_parts(children, schema_blobs)},
+            ).to_blob()
+            schema_blobs.append(bytes_blob)
+            parts.append({
+                'bytesRef': bytes_blob.blobref,
+                'size': sum(child.total_size() for child in children),
+            })
+
+        if span.size > 0:
+            parts.append({
+                'blobRef': span.blobref,
+                'size': span.size,
+            })
+
+    return parts
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+import threading
+
+# SQLite limits the number of parameters in a single statement, so lookups
+# of many blobrefs are split into chunks of this size.
+_SQLITE_CHUNK_SIZE = 500
+
+
+class MemoryPresenceCache(object):
+    """
+    Records, in memory, the blobs that a server is known to have.
+
+    An instance can be assigned to
+    :py:attr:`perkeeppy.blobclient.BlobClient.presence` (or passed to
+    :py:func:`perkeeppy.connect`), after which the blob client records every
+    blob that it sees confirmed by a stat, upload or enumeration, and only
+    asks the server about blobs not already recorded.
+
+    Presence caches assume that blobs are never removed from the server,
+    so a cache must only ever be used with a single server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sizes = {}
+
+    def get_sizes(self, blobrefs):
+        """
+        Return a mapping from each of the given blobrefs that is known to
+        be present to its size. Blobrefs that are not known are omitted.
+        """
+        with self._lock:
+            return {
+                blobref: self._sizes[blobref]
+                for blobref in blobrefs
+                if blobref in self._sizes
+            }
+
+    def add(self, sizes):
+        """
+        Record blobs as present, given a mapping from blobref to size.
+        """
+        with self._lock:
+            self._sizes.update(sizes)
+
+    def __contains__(self, blobref):
+        with self._lock:
+            return blobref in self._sizes
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sizes)
+
+
+class SqlitePresenceCache(object):
+    """
+    Records the blobs that a server is known to have in a SQLite database,
+    so that the knowledge persists between runs.
+
+    This has the same interface as :py:class:`MemoryPresenceCache`, and is
+    suitable for incremental backups where most blobs were already
+    uploaded by an earlier run. The database at ``path`` is created if it
+    does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS present ("
+                "blobref TEXT PRIMARY KEY, "
+                "size INTEGER NOT NULL"
+                ") WITHOUT ROWID"
+            )
+
+    def get_sizes(self, blobrefs):
+        """
+        Return a mapping from each of the given blobrefs that is known to
+        be present to its size. Blobrefs that are not known are omitted.
+        """
+        blobrefs = list(blobrefs)
+        ret = {}
+
+        with self._lock:
+            for i in range(0, len(blobrefs), _SQLITE_CHUNK_SIZE):
+                chunk = blobrefs[i:i + _SQLITE_CHUNK_SIZE]
+                rows = self._db.execute(
+                    "SELECT blobref, size FROM present WHERE blobref IN "
+                    "(%s)" % ", ".join("?" * len(chunk)),
+                    chunk,
+                )
+                ret.update(rows)
+
+        return ret
+
+    def add(self, sizes):
+        """
+        Record blobs as present, given a mapping from blobref to size.
+        """
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO present (blobref, size) "
+                    "VALUES (?, ?)",
+                    sizes.items(),
+                )
+
+    def close(self):
+        """
+        Close the underlying database.
+        """
+        with self._lock:
+            self._db.close()
+
+    def __contains__(self, blobref):
+        return len(self.get_sizes([blobref])) > 0
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM present"
+            ).fetchone()[0]
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+# This is a port of Perkeep's rolling checksum (pkg/rollsum), which is in
+# turn derived from bup's. Chunk boundaries are only useful for
+# deduplication if they fall in the same places as they would for other
+# Perkeep clients, so the arithmetic here must match it exactly, including
+# the 32-bit wrap-around.
+
+WINDOW_SIZE = 64
+CHAR_OFFSET = 31
+
+BLOB_BITS = 13
+BLOB_SIZE = 1 << BLOB_BITS
+
+_UINT32_MASK = 0xffffffff
+_SPLIT_MASK = BLOB_SIZE - 1
+
+
+class RollSum(object):
+    """
+    A rolling checksum over the last :py:data:`WINDOW_SIZE` bytes of a
+    stream, used to find content-defined chunk boundaries.
+
+    A boundary falls after any byte where the low :py:data:`BLOB_BITS` bits
+    of the checksum are all set, which happens on average once every
+    :py:data:`BLOB_SIZE` bytes. Since the checksum only depends on the most
+    recent bytes, an insertion or deletion early in a file only moves the
+    boundaries near it.
+    """
+
+    def __init__(self):
+        self.s1 = WINDOW_SIZE * CHAR_OFFSET
+        self.s2 = WINDOW_SIZE * (WINDOW_SIZE - 1) * CHAR_OFFSET
+        self.window = bytearray(WINDOW_SIZE)
+        self.wofs = 0
+
+    def roll(self, ch):
+        """
+        Add the byte ``ch`` (an integer) to the checksum.
+        """
+        self.roll_bytes(bytes((ch,)), 0, 1)
+
+    def roll_bytes(self, data, start, end):
+        """
+        Add ``data[start:end]`` to the checksum, without looking for
+        boundaries.
+        """
+        # The loop body is kept inline with local variables because it runs
+        # once per byte of every file written.
+        s1 = self.s1
+        s2 = self.s2
+        window = self.window
+        wofs = self.wofs
+
+        for i in range(start, end):
+            ch = data[i]
+            drop = window[wofs]
+            window[wofs] = ch
+            wofs = (wofs + 1) & (WINDOW_SIZE - 1)
+            s1 = (s1 + ch - drop) & _UINT32_MASK
+            s2 = (s2 + s1 - WINDOW_SIZE * (drop + CHAR_OFFSET)) & _UINT32_MASK
+
+        self.s1 = s1
+        self.s2 = s2
+        self.wofs = wofs
+
+    def roll_until_split(self, data, start, end):
+        """
+        Add bytes from ``data[start:end]`` to the checksum until a boundary
+        is found, returning the index just after the byte that completed
+        the boundary, or ``None`` if there was no boundary in the range.
+        """
+        s1 = self.s1
+        s2 = self.s2
+        window = self.window
+        wofs = self.wofs
+        ret = None
+
+        for i in range(start, end):
+            ch = data[i]
+            drop = window[wofs]
+            window[wofs] = ch
+            wofs = (wofs + 1) & (WINDOW_SIZE - 1)
+            s1 = (s1 + ch - drop) & _UINT32_MASK
+            s2 = (s2 + s1 - WINDOW_SIZE * (drop + CHAR_OFFSET)) & _UINT32_MASK
+            if s2 & _SPLIT_MASK == _SPLIT_MASK:
+                ret = i + 1
+                break
+
+        self.s1 = s1
+        self.s2 = s2
+        self.wofs = wofs
+        return ret
+
+    def on_split(self):
+        """
+        Return ``True`` if the most recent byte completed a boundary.
+        """
+        return self.s2 & _SPLIT_MASK == _SPLIT_MASK
+
+    def bits(self):
+        """
+        Return the "weight" of the current boundary: the number of
+        consecutive low bits of the checksum that are set, which is at least
+        :py:data:`BLOB_BITS` at a boundary. Rarer, heavier boundaries end up
+        higher in a file's span tree.
+        """
+        bits = BLOB_BITS
+        rsum = self.digest() >> BLOB_BITS
+        while (rsum >> 1) & 1 != 0:
+            rsum >>= 1
+            bits += 1
+        return bits
+
+    def digest(self):
+        """
+        Return the current checksum as a 32-bit integer.
+        """
+        return ((self.s1 << 16) | (self.s2 & 0xffff)) & _UINT32_MASK
@@ -4,7 +4,8 @@ import json
 import random
 import datetime
 
-from perkeeppy.blobclient import Blob
+from perkeeppy.blobclient import Blob, DEFAULT_MAX_WORKERS
+from perkeeppy.concurrency import bounded_map
 from perkeeppy.exceptions import SigningError
 
 CAMLI_VERSION = 1  # Schema version, per Perkeep
@@ -17,16 +18,53 @@ class SchemaObject(object):
     While at the lower level, Perkeep blobs are just raw data, Perkeep
     understands some blobs which contain JSON data. This class allows a
     higher-level access to these objects. It wraps a :class:`Blob` object
+
+    The serialized (and, if necessary, signed) data is kept after
+    :meth:`to_blob` is first called, and reused until :attr:`data` or
+    :attr:`needs_signing` is changed. Changes to :attr:`data` itself are
+    noticed, but changes inside the values it contains are not, so nested
+    lists and dictionaries should be replaced rather than modified in
+    place.
     """
 
     def __init__(self, camli_type, data=None, needs_signing=False):
+        self._needs_signing = needs_signing
         self.data = {'camliVersion': CAMLI_VERSION,
                      'camliType': camli_type}
 
         if data:
             self.data.update(data)
 
-        self.needs_signing = needs_signing
+    @property
+    def data(self):
+        """
+        The JSON data of the object, as a dictionary.
+        """
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        previous = getattr(self, '_data', None)
+        data = _TrackedDict(value)
+        if previous is not None and _same_json(previous, data):
+            # Nothing changed, so any cached blob is still current.
+            data.version = previous.version
+        else:
+            self._invalidate()
+        self._data = data
+
+    @property
+    def needs_signing(self):
+        """
+        Whether the object must be signed before it is stored.
+        """
+        return self._needs_signing
+
+    @needs_signing.setter
+    def needs_signing(self, value):
+        if value != self._needs_signing:
+            self._needs_signing = value
+            self._invalidate()
 
     def to_blob(self, signer=None):
         """
@@ -35,22 +73,250 @@ class SchemaObject(object):
         If :attr:`needs_signing` is set, a :class:`Signer` should be passed as
         ``signer``. If sigining is required, and this function is unable to
         sign the JSON, it will raise a :class:`SigningError`
+
+        Calling this again without changing the object returns an equal
+        blob without serializing or signing the data again, as long as the
+        same ``signer`` is used.
         """
 
-        # TODO: Keep a Blob in this object, and invalidate it when needed, so
-        # that we can return Blobs from other things.
+        if self.needs_signing:
+            if not signer:
+                raise SigningError(
+                    'A signer was needed, and none was passed to to_blob()')
+        else:
+            # The signer makes no difference to an unsigned blob
+            signer = None
+
+        if (
+            self._blob_data is None or
+            self._blob_signer is not signer or
+            self._blob_version != self.data.version
+        ):
+            if signer is None:
+                # Perkeep generally uses tabs for indentation for stored
+                # blobs. This should not matter, and our serialization is
+                # likely different, but we use tabs for consistency anyway
+                data = json.dumps(self.data, indent='\t').encode('utf8')
+            else:
+                # This may fill in fields of self.data, which invalidates
+                # the cache, so we only fill it in afterwards.
+                data = signer.sign_dict(self.data)
+
+            blob = Blob(data)
+            self._blob_data = data
+            self._blob_ref = blob.blobref
+            self._blob_signer = signer
+            self._blob_version = self.data.version
+            return blob
+
+        # Blob objects are mutable, so each caller gets its own, but the
+        # blobref doesn't need to be computed again.
+        blob = Blob(self._blob_data)
+        blob._blobref = self._blob_ref
+        return blob
+
+    def _invalidate(self):
+        self._blob_data = None
+        self._blob_ref = None
+        self._blob_signer = None
+        self._blob_version = None
+
+
+def _same_json(a, b):
+    # Values which are equal in Python, such as 1 and True, or dictionaries
+    # with their keys in a different order, still serialize differently.
+    if isinstance(a, dict) and isinstance(b, dict):
+        return list(a) == list(b) and all(
+            _same_json(a[key], b[key]) for key in a
+        )
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(map(_same_json, a, b))
+    return a == b
+
+
+class _TrackedDict(dict):
+    """
+    A dictionary that counts the changes to its contents in
+    :attr:`version`. Assigning a key the value it already has is not a
+    change.
+
+    The count belongs to the dictionary rather than calling back into its
+    owner, so that it survives pickling and copying.
+    """
+
+    #: The number of times the contents have changed.
+    version = 0
+
+    def __init__(self, *args, **kwargs):
+        super(_TrackedDict, self).__init__(*args, **kwargs)
+        self.version = 0
+
+    def __reduce__(self):
+        # The default would restore the items through __setitem__, so
+        # they are passed to the constructor instead.
+        return (_TrackedDict, (dict(self),), {'version': self.version})
+
+    def _changed(self):
+        self.version += 1
+
+    def __setitem__(self, key, value):
+        if key in self and _same_json(self[key], value):
+            return
+        super(_TrackedDict, self).__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super(_TrackedDict, self).__delitem__(key)
+        self._changed()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def pop(self, key, *args):
+        changed = key in self
+        value = super(_TrackedDict, self).pop(key, *args)
+        if changed:
+            self._changed()
+        return value
+
+    def popitem(self):
+        item = super(_TrackedDict, self).popitem()
+        self._changed()
+        return item
+
+    def clear(self):
+        if len(self) > 0:
+            super(_TrackedDict, self).clear()
+            self._changed()
+
+
+def to_blob_multi(schema_objects, signer=None,
+                  max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Convert many :class:`SchemaObject` objects to blobs, signing those that
+    need it concurrently.
+
+    This is a batch version of :meth:`SchemaObject.to_blob`, taking an
+    iterable of objects, which may be a generator of any length, and
+    generating their blobs in the same order. Up to ``max_workers`` objects
+    are signed at once, and only a few more than that are read from
+    ``schema_objects`` ahead of the blobs being consumed, so memory use
+    stays flat however many objects there are.
+    """
+    if signer is not None:
+        # Look up the signer's blobref once up front, rather than having
+        # every worker race to do it.
+        signer.camli_signer
+
+    results = bounded_map(
+        lambda schema_object: schema_object.to_blob(signer),
+        schema_objects,
+        max_workers=max_workers,
+    )
+    for (_, future) in results:
+        yield future.result()
+
+
+def put_schema_objects(blob_client, schema_objects, signer=None,
+                       max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Sign and upload many :class:`SchemaObject` objects, returning a list of
+    their blobrefs in the same order.
 
-        if not self.needs_signing:
-            # Perkeep generally uses tabs for indentation for stored blobs.
-            # This should not matter, and our serialization is likely
-            # different, but we use tabs for consistency anyway
-            return Blob(json.dumps(self.data, indent='\t').encode('utf8'))
+    The objects are converted with :func:`to_blob_multi` and streamed into
+    :meth:`perkeeppy.blobclient.BlobClient.put_multi`, so signing continues
+    while earlier batches are being uploaded.
+    """
+    return blob_client.put_multi(
+        to_blob_multi(schema_objects, signer=signer, max_workers=max_workers)
+    )
 
-        if not signer:
-            raise SigningError(
-                'A signer was needed, and none was passed to to_blob()')
 
-        return Blob(signer.sign_dict(self.data))
+def put_permanodes(blob_client, records, signer,
+                   max_workers=DEFAULT_MAX_WORKERS, claim_date=None):
+    """
+    Create a permanode for each of the given records, along with claims
+    setting its attributes, and upload them all.
+
+    ``records`` is an iterable, which may be a generator of any length, of
+    dictionaries mapping attribute names to values. A value that is a list
+    or tuple gives an attribute with several values, each added with its
+    own ``add`` claim; any other value is ``set``.
+
+    The claims are dated from ``claim_date`` (by default, the current time)
+    onwards, each a microsecond later than the one before, in the order of
+    the records and then of their attributes, so the order in which
+    Perkeep applies them is well defined.
+
+    The permanodes and claims are signed concurrently by ``signer`` using
+    up to ``max_workers`` threads, and uploaded in batches by
+    :meth:`perkeeppy.blobclient.BlobClient.put_multi` as they are signed.
+    Returns a list of the permanode blobrefs, in the same order as the
+    records.
+    """
+    if claim_date is None:
+        claim_date = datetime.datetime.now(datetime.timezone.utc)
+    elif claim_date.tzinfo is None:
+        claim_date = claim_date.replace(tzinfo=datetime.timezone.utc)
+    claim_step = datetime.timedelta(microseconds=1)
+
+    # As in to_blob_multi, look up the signer's blobref once up front.
+    signer.camli_signer
+
+    def sign(schema_object):
+        # Permanodes are signed first, because their claims refer to them,
+        # and are passed through as blobs.
+        if isinstance(schema_object, Blob):
+            return schema_object
+        return schema_object.to_blob(signer)
+
+    permanode_blobrefs = []
+
+    def permanodes_and_claims():
+        nonlocal claim_date
+
+        signed_permanodes = bounded_map(
+            lambda record: make_permanode().to_blob(signer),
+            records,
+            max_workers=max_workers,
+        )
+        for (record, future) in signed_permanodes:
+            permanode = future.result()
+            permanode_blobrefs.append(permanode.blobref)
+            yield permanode
+
+            for (key, value) in record.items():
+                if isinstance(value, (list, tuple)):
+                    claims = [(key, 'add', item) for item in value]
+                else:
+                    claims = [(key, 'set', value)]
+                for (key, action, item) in claims:
+                    yield make_claim(permanode.blobref, key, action, item,
+                                     date=claim_date)
+                    claim_date += claim_step
+
+    def blobs():
+        signed = bounded_map(
+            sign, permanodes_and_claims(), max_workers=max_workers,
+        )
+        for (_, future) in signed:
+            yield future.result()
+
+    blob_client.put_multi(blobs())
+    return permanode_blobrefs
 
 
 def make_permanode():
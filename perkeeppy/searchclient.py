@@ -2,11 +2,20 @@
 
 import json
 
+from concurrent.futures import ThreadPoolExecutor
+
+from perkeeppy.blobclient import DEFAULT_MAX_WORKERS
+from perkeeppy.concurrency import bounded_map
 from perkeeppy.exceptions import ServerFeatureUnavailableError, ServerError
 
 from dateutil.parser import parse
 from urllib.parse import urljoin
 
+# The number of blobs described per request by SearchClient.describe_many.
+# Each described blob can pull in descriptions of several related blobs, so
+# this is kept well below the batch sizes used for blob operations.
+DESCRIBE_BATCH_SIZE = 200
+
 
 class SearchClient(object):
     """
@@ -30,9 +39,17 @@ class SearchClient(object):
     object and access :py:attr:`perkeeppy.Connection.searcher`.
     """
 
-    def __init__(self, http_session, base_url):
+    #: An optional cache of descriptions and claims, such as a
+    #: :py:class:`perkeeppy.descriptioncache.DescriptionCache`. If set,
+    #: :py:meth:`describe_blob`, :py:meth:`describe_many` and
+    #: :py:meth:`get_claims_for_permanode` use it to avoid asking the server
+    #: again about blobs they have recently seen.
+    cache = None
+
+    def __init__(self, http_session, base_url, cache=None):
         self.http_session = http_session
         self.base_url = base_url
+        self.cache = cache
 
     def _make_url(self, path):
         if self.base_url is not None:
@@ -42,7 +59,14 @@ class SearchClient(object):
                 "Server does not support search interface"
             )
 
-    def query(self, q):
+    def query(
+        self,
+        q,
+        page_size=None,
+        limit=None,
+        prefetch=True,
+        describe=None,
+    ):
         """
         Run a query against the index, returning an iterable of
         :py:class:`SearchResult`.
@@ -51,8 +75,101 @@ class SearchClient(object):
         query interface.
 
         Query constraints are not yet supported.
+
+        The results are fetched lazily, one page at a time, following the
+        server's continuation token, so no request is made until iteration
+        begins and arbitrarily large result sets can be scanned without
+        holding them in memory. ``page_size`` sets the number of results
+        requested per page (the query's ``limit``, in the server's terms);
+        if it is not given, the server's default is used. ``limit`` stops
+        iteration after that many results in total.
+
+        If ``prefetch`` is ``True``, the request for each page is sent in
+        the background as soon as the previous page arrives.
+
+        If ``describe`` is given, the server also describes each result
+        in the same response, and it is available as
+        :py:attr:`SearchResult.description`, avoiding a separate call to
+        :py:meth:`describe_blob` per result. ``describe`` is a dict of
+        describe request options, such as ``depth`` and ``rules``, which
+        is passed on verbatim, or ``True`` to use the server's defaults.
+        """
+        data = self._query_request_data(q, page_size, describe)
+
+        count = 0
+        for results in self._query_pages(q, data, prefetch, limit):
+            for result in results:
+                if limit is not None and count >= limit:
+                    return
+                yield result
+                count += 1
+
+            if limit is not None and count >= limit:
+                return
+
+    def _query_pages(self, q, data, prefetch, limit=None):
+        """
+        Generate lists of :py:class:`SearchResult` for each page of the
+        results of a query, stopping once there are at least ``limit``
+        results in total.
         """
         req_url = self._make_url("camli/search/query")
+        count = 0
+
+        def get_page(data):
+            nonlocal count
+            (results, next_data) = self._get_query_page(q, req_url, data)
+            count += len(results)
+            if limit is not None and count >= limit:
+                # Don't fetch, or prefetch, a page nobody will look at.
+                next_data = None
+            return (results, next_data)
+
+        if not prefetch:
+            while data is not None:
+                (results, data) = get_page(data)
+                yield results
+            return
+
+        executor = None
+        next_page = None
+        try:
+            (results, data) = get_page(data)
+            while True:
+                if data is not None:
+                    if executor is None:
+                        executor = ThreadPoolExecutor(max_workers=1)
+                    next_page = executor.submit(get_page, data)
+                yield results
+
+                if next_page is None:
+                    return
+                (results, data) = next_page.result()
+                next_page = None
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    def _get_query_page(self, q, req_url, data):
+        """
+        Fetch one page of the results of a query, returning a list of
+        :py:class:`SearchResult` and the request data for the next page,
+        or ``None`` if this was the last page.
+        """
+        resp = self.http_session.post(req_url, data=json.dumps(data))
+        (results, continue_token) = self._page_from_response(q, resp)
+        return (results, self._next_query_data(data, results, continue_token))
+
+    def _next_query_data(self, data, results, continue_token):
+        if continue_token and len(results) > 0:
+            next_data = dict(data)
+            next_data["continue"] = continue_token
+            return next_data
+        return None
+
+    def _query_data(self, q):
         assert isinstance(q, (str, dict))
 
         if isinstance(q, str):
@@ -64,11 +181,24 @@ class SearchClient(object):
             #   https://perkeep.org/pkg/search#Constraint
             data = q
 
-        resp = self.http_session.post(
-            req_url,
-            data=json.dumps(data),
-        )
+        return data
+
+    def _query_request_data(self, q, page_size=None, describe=None):
+        data = dict(self._query_data(q))
+        if page_size is not None:
+            data["limit"] = page_size
+        if describe is True:
+            data["describe"] = {}
+        elif describe is not None:
+            data["describe"] = describe
+        return data
 
+    def _page_from_response(self, q, resp):
+        """
+        Decode one page of the results of a query, returning a list of
+        :py:class:`SearchResult` and the token to request the next page
+        with, or ``None`` if there are no more pages.
+        """
         if resp.status_code != 200:
             raise ServerError(
                 "Failed to search for %r: server returned %i %s" % (
@@ -78,14 +208,26 @@ class SearchClient(object):
                 )
             )
 
-        raw_data = json.loads(resp.content)
+        return self._page_from_data(json.loads(resp.content))
+
+    def _page_from_data(self, raw_data):
+        # All of the results on a page share one pool of descriptions, so
+        # that describe_another can find related blobs described for
+        # any of them.
+        meta = (raw_data.get("description") or {}).get("meta") or {}
 
-        if raw_data["blobs"] is not None:
-            return [
-                SearchResult(x["blob"]) for x in raw_data["blobs"]
+        if raw_data.get("blobs") is not None:
+            results = [
+                SearchResult(
+                    x["blob"],
+                    self._description_from_meta(x["blob"], meta),
+                )
+                for x in raw_data["blobs"]
             ]
         else:
-            return []
+            results = []
+
+        return (results, raw_data.get("continue"))
 
     def describe_blob(self, blobref):
         """
@@ -96,7 +238,16 @@ class SearchClient(object):
         so it contains only the subset of information retained by the
         indexer. The level of detail in the returned object will thus
         depend on what the indexer knows about the given object.
+
+        If :py:attr:`cache` is set, a recently-fetched description may be
+        returned instead of asking the server.
         """
+        if self.cache is not None:
+            cached = self.cache.get_description(blobref)
+            if cached is not None:
+                (raw_dict, other_raw_dicts) = cached
+                return BlobDescription(self, raw_dict, other_raw_dicts)
+
         req_url = self._make_url("camli/search/describe")
         resp = self.http_session.get(
             req_url,
@@ -104,7 +255,15 @@ class SearchClient(object):
                 "blobref": blobref,
             },
         )
+        descr = self._description_from_response(blobref, resp)
+
+        if self.cache is not None:
+            self.cache.add_description(
+                blobref, descr.raw_dict, descr.other_raw_dicts,
+            )
+        return descr
 
+    def _description_from_response(self, blobref, resp):
         if resp.status_code != 200:
             raise ServerError(
                 "Failed to describe %s: server returned %i %s" % (
@@ -123,6 +282,95 @@ class SearchClient(object):
             other_raw_dicts=other_raw,
         )
 
+    def describe_many(
+        self,
+        blobrefs,
+        max_workers=DEFAULT_MAX_WORKERS,
+        batch_size=DESCRIBE_BATCH_SIZE,
+    ):
+        """
+        Request descriptions of many blobs, returning a dict mapping each
+        blobref that the indexer knows about to a :py:class:`BlobDescription`.
+
+        The blobrefs are described in batches of up to ``batch_size`` per
+        request, with up to ``max_workers`` requests in flight at once. All
+        of the returned descriptions share the related blob descriptions
+        from every batch, so
+        :py:meth:`BlobDescription.describe_another` can find them without
+        making further requests.
+
+        If :py:attr:`cache` is set, only the blobs that are not in it are
+        requested from the server.
+        """
+        blobrefs = list(dict.fromkeys(blobrefs))
+        ret = {}
+
+        if self.cache is not None:
+            for blobref in blobrefs:
+                cached = self.cache.get_description(blobref)
+                if cached is not None:
+                    (raw_dict, other_raw_dicts) = cached
+                    ret[blobref] = BlobDescription(
+                        self, raw_dict, other_raw_dicts,
+                    )
+            blobrefs = [
+                blobref for blobref in blobrefs if blobref not in ret
+            ]
+
+        req_url = self._make_url("camli/search/describe")
+
+        def describe_batch(batch):
+            resp = self.http_session.post(
+                req_url,
+                data=json.dumps({"blobrefs": batch}),
+            )
+            return self._meta_from_response(batch, resp)
+
+        batches = (
+            blobrefs[i:i + batch_size]
+            for i in range(0, len(blobrefs), batch_size)
+        )
+        meta = {}
+        for batch, future in bounded_map(
+            describe_batch, batches, max_workers=max_workers,
+        ):
+            meta.update(future.result())
+
+        for blobref in blobrefs:
+            if blobref not in meta:
+                continue
+            ret[blobref] = BlobDescription(self, meta[blobref], meta)
+            if self.cache is not None:
+                # The pool is shared by a whole batch, so each entry only
+                # keeps the descriptions that its own blob refers to.
+                self.cache.add_description(
+                    blobref, meta[blobref], _referenced_meta(blobref, meta),
+                )
+
+        return ret
+
+    def _meta_from_response(self, blobrefs, resp):
+        if resp.status_code != 200:
+            raise ServerError(
+                "Failed to describe %i blobs: server returned %i %s" % (
+                    len(blobrefs),
+                    resp.status_code,
+                    resp.reason,
+                )
+            )
+
+        raw = json.loads(resp.content)
+        return raw.get("meta") or {}
+
+    def _description_from_meta(self, blobref, meta):
+        if blobref not in meta:
+            return None
+        return BlobDescription(
+            self,
+            meta[blobref],
+            other_raw_dicts=meta,
+        )
+
     def get_claims_for_permanode(self, blobref):
         """
         Get the claims for a particular permanode, as an iterable of
@@ -138,13 +386,27 @@ class SearchClient(object):
         since that returns the flattened result of processing all
         attributes, rather than requiring the client to process the claims
         itself.
+
+        If :py:attr:`cache` is set, a recently-fetched list of claims may be
+        returned instead of asking the server.
         """
+        if self.cache is not None:
+            cached = self.cache.get_claims(blobref)
+            if cached is not None:
+                return list(cached)
+
         req_url = self._make_url("camli/search/claims")
         resp = self.http_session.get(
             req_url,
             params={"permanode": blobref},
         )
+        claims = self._claims_from_response(blobref, resp)
+
+        if self.cache is not None:
+            self.cache.add_claims(blobref, list(claims))
+        return claims
 
+    def _claims_from_response(self, blobref, resp):
         if resp.status_code != 200:
             raise ServerError(
                 "Failed to get claims for %s: server returned %i %s" % (
@@ -168,8 +430,13 @@ class SearchResult(object):
     #: The blobref of the blob represented by this search result.
     blobref = None
 
-    def __init__(self, blobref):
+    #: The :py:class:`BlobDescription` of the blob, if the query asked for
+    #: descriptions, or ``None`` otherwise.
+    description = None
+
+    def __init__(self, blobref, description=None):
         self.blobref = blobref
+        self.description = description
 
     def __repr__(self):
         return "<perkeeppy.searchclient.SearchResult %s>" % self.blobref
@@ -339,3 +606,34 @@ class ClaimMeta(object):
         if target is not None:
             parts.append(target)
         return "<%s>" % " ".join(parts)
+
+
+def _referenced_meta(blobref, meta):
+    """
+    Return the subset of the raw description pool ``meta`` made up of the
+    given blob's description and those of the blobs it refers to, directly
+    or through other described blobs.
+    """
+    pool = {}
+    pending = [blobref]
+    while len(pending) > 0:
+        ref = pending.pop()
+        if ref in pool or ref not in meta:
+            continue
+        pool[ref] = meta[ref]
+        pending.extend(_strings_in(meta[ref]))
+    return pool
+
+
+def _strings_in(value):
+    # Blobrefs can appear anywhere in a description, such as in permanode
+    # attribute values or in the members of a directory, so we consider
+    # every string it contains.
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _strings_in(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _strings_in(item)
@@ -4,11 +4,24 @@
 from urllib.parse import urljoin
 import requests
 import json
+import os
+import threading
 
-from perkeeppy.exceptions import SigningError, ServerError
+from concurrent.futures import ProcessPoolExecutor
+
+from perkeeppy.blobclient import Blob, _chunks
+from perkeeppy.concurrency import bounded_map
+from perkeeppy.exceptions import NotFoundError, SigningError, ServerError
 
 CAMLI_VERSION = 1
 
+# Signed JSON ends with this separator, the signature and a closing brace.
+_CAMLI_SIG_SEPARATOR = ',"camliSig":"'
+
+# The number of documents sent to a worker process at once by
+# LocalVerifier.verify_many, to amortize the cost of the round trip.
+VERIFY_CHUNK_SIZE = 256
+
 
 class Signer(object):
     """
@@ -41,11 +54,15 @@ class Signer(object):
         if self._camli_signer:
             return self._camli_signer
 
-        self._camli_signer = (self.http_session.get(self.discovery_path)
-                                               .json()['publicKeyBlobRef'])
+        self._camli_signer = self._camli_signer_from_response(
+            self.http_session.get(self.discovery_path),
+        )
 
         return self._camli_signer
 
+    def _camli_signer_from_response(self, resp):
+        return resp.json()['publicKeyBlobRef']
+
     @camli_signer.setter
     def camli_signer(self, newval):
         self._camli_signer = newval
@@ -59,13 +76,18 @@ class Signer(object):
         ``camliSigner`` fetched from the API if not already cached.
         """
 
+        return self.sign_string(
+            self._prepare_dict(source, lambda: self.camli_signer),
+        )
+
+    def _prepare_dict(self, source, get_camli_signer):
         if 'camliVersion' not in source:
             source['camliVersion'] = CAMLI_VERSION
 
         if 'camliSigner' not in source:
-            source['camliSigner'] = self.camli_signer
+            source['camliSigner'] = get_camli_signer()
 
-        return self.sign_string(json.dumps(source))
+        return json.dumps(source)
 
     def sign_string(self, source):
         """
@@ -83,7 +105,9 @@ class Signer(object):
         """
 
         resp = self.http_session.post(self.sign_path, data={'json': source})
+        return self._signed_from_response(resp)
 
+    def _signed_from_response(self, resp):
         try:
             resp.raise_for_status()
         except requests.exceptions.HTTPError as e:
@@ -108,7 +132,9 @@ class Signer(object):
 
         resp = self.http_session.post(self.verify_path,
                                       data={'sjson': byte_str})
+        return self._verification_from_response(resp)
 
+    def _verification_from_response(self, resp):
         try:
             resp.raise_for_status()
         except requests.exceptions.HTTPError as e:
@@ -120,3 +146,369 @@ class Signer(object):
             return (True, None)
         else:
             return (False, resp_json['errorMessage'])
+
+
+class LocalSigner(object):
+    """
+    Signs JSON documents with a local OpenPGP key, without contacting the
+    server.
+
+    This has the same :py:meth:`sign_dict` and :py:meth:`sign_string`
+    interface as :py:class:`Signer`, and produces the same kind of
+    signatures as Perkeep's signing helper, so it can be passed to
+    :py:meth:`perkeeppy.SchemaObject.to_blob` or to
+    :py:func:`perkeeppy.connect` as ``signer``. It requires `PGPy`_
+    (``pip install perkeeppy[signing]``).
+
+    ``key`` is a secret :py:class:`pgpy.PGPKey`; most callers will instead
+    use :py:meth:`from_file`. If the key is protected, ``passphrase`` is
+    used to unlock it.
+
+    The server can only verify signatures if it has the signer's public key,
+    so :py:attr:`public_key_blob` should be uploaded to it before any
+    signed blobs. ``camli_signer`` can be given to refer to a public key
+    blob that is already on the server, if it was armored differently.
+
+    .. _`PGPy`: https://pgpy.readthedocs.io/
+    """
+
+    _prepare_dict = Signer._prepare_dict
+
+    def __init__(self, key, passphrase=None, camli_signer=None):
+        if key.is_public:
+            raise SigningError('A secret key is needed for signing')
+        if key.is_protected and passphrase is None:
+            raise SigningError('The signing key needs a passphrase')
+
+        self.key = key
+        self._passphrase = passphrase
+        self._lock = threading.Lock()
+        self._public_key_blob = Blob(str(key.pubkey).encode('utf8'))
+        self._camli_signer = camli_signer
+
+    @classmethod
+    def from_file(cls, path, passphrase=None, camli_signer=None):
+        """
+        Create a signer from the secret key in the file at ``path``, which
+        may be armored or binary, such as the ``identity-secring.gpg`` file
+        in Perkeep's configuration directory.
+        """
+        pgpy = _import_pgpy()
+        (key, _) = pgpy.PGPKey.from_file(path)
+        return cls(key, passphrase=passphrase, camli_signer=camli_signer)
+
+    @property
+    def public_key_blob(self):
+        """
+        A :py:class:`perkeeppy.Blob` containing the armored public key,
+        which the server needs in order to verify signatures.
+        """
+        return self._public_key_blob
+
+    @property
+    def camli_signer(self):
+        """
+        The blobref of the public key, used as the ``camliSigner`` of
+        signed documents.
+        """
+        if self._camli_signer:
+            return self._camli_signer
+        return self._public_key_blob.blobref
+
+    @camli_signer.setter
+    def camli_signer(self, newval):
+        self._camli_signer = newval
+
+    def sign_dict(self, source):
+        """
+        Produce a signed :class:`bytes` version of the ``source``.
+
+        ``source`` does not have to have either a ``camliVersion``, nor a
+        ``camliSigner`` field. They will be filled out as needed.
+        """
+        return self.sign_string(
+            self._prepare_dict(source, lambda: self.camli_signer),
+        )
+
+    def sign_string(self, source):
+        """
+        Produce a signed :class:`bytes` version of the JSON string in
+        ``source``.
+
+        Raises :class:`perkeeppy.exceptions.SigningError` if ``source`` is
+        not a JSON object whose ``camliSigner`` is this signer's
+        :py:attr:`camli_signer`.
+
+        Returns a :class:`bytes` object with the signed JSON
+        """
+        trimmed = source.rstrip()
+        try:
+            data = json.loads(trimmed)
+        except ValueError as e:
+            raise SigningError('Input is not valid JSON') from e
+
+        if not isinstance(data, dict) or not trimmed.endswith('}'):
+            raise SigningError('Input is not a JSON object')
+        if data.get('camliSigner') != self.camli_signer:
+            raise SigningError(
+                'camliSigner does not match the signing key: %r' % (
+                    data.get('camliSigner'),
+                )
+            )
+
+        # As in Perkeep's jsonsign package, the signature covers the
+        # trimmed JSON, and is inserted before its closing brace with the
+        # armor and line breaks stripped.
+        signature = self._sign(trimmed.encode('utf8'))
+        signed = trimmed[:-1] + ',"camliSig":"' + signature + '"}\n'
+        return signed.encode('utf8')
+
+    def _sign(self, data):
+        """
+        Return the armored body of a detached signature of ``data``, with
+        line breaks removed.
+        """
+        with self._unlocked():
+            armored = str(self.key.sign(data))
+
+        start = armored.find('\n\n')
+        end = armored.find('\n-----', start)
+        if start == -1 or end == -1:
+            raise SigningError('Unexpected signature armor')
+        return armored[start + 2:end].replace('\n', '')
+
+    def _unlocked(self):
+        if not self.key.is_protected:
+            return _NullContext()
+        if self._passphrase is None:
+            raise SigningError('The signing key needs a passphrase')
+        return _UnlockContext(self._lock, self.key, self._passphrase)
+
+    def __repr__(self):
+        return "<perkeeppy.signing.LocalSigner %s>" % self.camli_signer
+
+
+class LocalVerifier(object):
+    """
+    Verifies signed JSON documents locally, without contacting the server.
+
+    This has the same :py:meth:`verify_bytes` interface as
+    :py:class:`Signer`, and checks signatures the way Perkeep does, using
+    the public key blob named by each document's ``camliSigner``. Public
+    keys are fetched from ``blob_client`` the first time they are needed
+    and then cached. It requires `PGPy`_, like :py:class:`LocalSigner`.
+
+    .. _`PGPy`: https://pgpy.readthedocs.io/
+    """
+
+    def __init__(self, blob_client):
+        self.blob_client = blob_client
+
+        self._lock = threading.Lock()
+        # Maps the blobref of each public key blob to its armored text.
+        self._public_keys = {}
+
+    def verify_bytes(self, byte_str):
+        """
+        Verify a cryptographically signed JSON document.
+
+        The ``byte_str`` should be of the :class:`bytes` type.
+
+        The function will return a tuple: the first member will be either
+        ``True`` or ``False``, depending on whether the signature was valid; if
+        verification failed, the second member will be a string explaining why.
+        """
+        job = self._verify_job(byte_str)
+        if job[0] is None:
+            return (False, job[1])
+        return _verify_signature(*job)
+
+    def verify_many(self, byte_strs, max_workers=None):
+        """
+        Verify many signed JSON documents in parallel, using a pool of up
+        to ``max_workers`` processes (by default, one per CPU).
+
+        ``byte_strs`` is an iterable of :class:`bytes`, which may be a
+        generator of any length. This is a generator yielding a
+        ``(byte_str, result)`` pair for each document, in the order they
+        were given, where ``result`` is a tuple as returned by
+        :py:meth:`verify_bytes`.
+        """
+        _import_pgpy()
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+
+        def job_chunks():
+            for chunk in _chunks(iter(byte_strs), VERIFY_CHUNK_SIZE):
+                yield [(byte_str, self._verify_job(byte_str))
+                       for byte_str in chunk]
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = bounded_map(
+                _verify_chunk, job_chunks(),
+                max_workers=max_workers,
+                executor=executor,
+            )
+            for (chunk, future) in results:
+                for ((byte_str, _), result) in zip(chunk, future.result()):
+                    yield (byte_str, result)
+
+    def _verify_job(self, byte_str):
+        """
+        Parse a signed document, returning the arguments for
+        :py:func:`_verify_signature`, or ``(None, reason)`` if it can't be
+        verified.
+        """
+        try:
+            (payload, data, camli_sig) = _parse_signed_json(byte_str)
+        except ValueError as e:
+            return (None, str(e))
+
+        camli_signer = data.get('camliSigner')
+        if not isinstance(camli_signer, str):
+            return (None, 'Missing camliSigner')
+
+        try:
+            public_key = self._get_public_key(camli_signer)
+        except NotFoundError:
+            return (None, f'Public key {camli_signer} not found')
+
+        return (public_key, payload, camli_sig)
+
+    def _get_public_key(self, blobref):
+        with self._lock:
+            public_key = self._public_keys.get(blobref)
+        if public_key is None:
+            blob = self.blob_client.get(blobref)
+            public_key = blob.data.decode('utf8')
+            with self._lock:
+                self._public_keys[blobref] = public_key
+        return public_key
+
+
+def _parse_signed_json(byte_str):
+    """
+    Split a signed JSON document into the JSON that was signed, its decoded
+    form and the camliSig value, raising :py:class:`ValueError` if it is
+    malformed.
+    """
+    try:
+        signed = byte_str.decode('utf8')
+    except UnicodeDecodeError:
+        raise ValueError('Signed JSON is not valid UTF-8')
+
+    sig_index = signed.rfind(_CAMLI_SIG_SEPARATOR)
+    if sig_index == -1:
+        raise ValueError('No camliSig footer found')
+
+    # The signature covers the JSON as it was before the camliSig field
+    # was inserted.
+    payload = signed[:sig_index] + '}'
+    sig_tail = signed[sig_index + len(_CAMLI_SIG_SEPARATOR):]
+    close_quote = sig_tail.find('"')
+    if close_quote == -1 or sig_tail[close_quote + 1:].strip() != '}':
+        raise ValueError('Malformed camliSig footer')
+
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        raise ValueError('Signed JSON is not valid JSON')
+    if not isinstance(data, dict):
+        raise ValueError('Signed JSON is not a JSON object')
+
+    return (payload, data, sig_tail[:close_quote])
+
+
+def _verify_chunk(jobs):
+    """
+    Verify a list of ``(byte_str, job)`` pairs in a worker process.
+    """
+    return [
+        (False, job[1]) if job[0] is None else _verify_signature(*job)
+        for (_, job) in jobs
+    ]
+
+
+# Parsed public keys, kept between calls in each worker process.
+_parsed_public_keys = {}
+
+
+def _verify_signature(public_key, payload, camli_sig):
+    """
+    Check the camliSig of a signed document, given the armored public key
+    and the JSON that was signed, returning a result tuple as for
+    :py:meth:`Signer.verify_bytes`.
+    """
+    pgpy = _import_pgpy()
+
+    key = _parsed_public_keys.get(public_key)
+    if key is None:
+        try:
+            (key, _) = pgpy.PGPKey.from_blob(public_key)
+        except Exception:
+            return (False, 'Invalid public key')
+        _parsed_public_keys[public_key] = key
+
+    try:
+        signature = pgpy.PGPSignature.from_blob(_rearmor(camli_sig))
+        verified = key.verify(payload.encode('utf8'), signature)
+    except Exception as e:
+        return (False, f'Invalid signature: {e}')
+
+    if not verified:
+        return (False, 'Signature does not match')
+    return (True, None)
+
+
+def _rearmor(camli_sig):
+    # The CRC is the part after the last "=", since base64 padding can
+    # only appear at the end of the body.
+    eq_index = camli_sig.rfind('=')
+    if eq_index == -1:
+        raise ValueError('No checksum in camliSig')
+    body = camli_sig[:eq_index]
+    lines = [body[i:i + 64] for i in range(0, len(body), 64)]
+    return (
+        '-----BEGIN PGP SIGNATURE-----\n\n' +
+        '\n'.join(lines) + '\n' + camli_sig[eq_index:] +
+        '\n-----END PGP SIGNATURE-----\n'
+    )
+
+
+class _NullContext(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _UnlockContext(object):
+    # PGPy unlocks keys in place, so unlocking must be serialized.
+    def __init__(self, lock, key, passphrase):
+        self._lock = lock
+        self._unlock = key.unlock(passphrase)
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            return self._unlock.__enter__()
+        except BaseException:
+            self._lock.release()
+            raise
+
+    def __exit__(self, *exc_info):
+        try:
+            return self._unlock.__exit__(*exc_info)
+        finally:
+            self._lock.release()
+
+
+def _import_pgpy():
+    try:
+        import pgpy
+    except ImportError as e:
+        raise ImportError(
+            'Local signing requires PGPy (pip install perkeeppy[signing])'
+        ) from e
+    return pgpy
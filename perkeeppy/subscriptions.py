@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import inspect
+import itertools
+import json
+import logging
+
+import aiohttp
+
+from perkeeppy.exceptions import ServerError
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriptions(object):
+    """
+    Live search queries, delivered over the search interface's websocket.
+
+    Rather than running a query repeatedly to notice changes, a caller can
+    subscribe to it, after which the server runs the query again whenever
+    the index changes and sends the new results if they differ. Any number
+    of queries are multiplexed over a single websocket, each identified by
+    a tag.
+
+    ``searcher`` is an :py:class:`perkeeppy.aio.AsyncSearchClient`, whose
+    :py:class:`aiohttp.ClientSession` is used to open the websocket.
+    Callers should usually use
+    :py:meth:`perkeeppy.aio.AsyncSearchClient.subscriptions` rather than
+    instantiating this class directly, and should call :py:meth:`close`
+    when done, or use the object as an asynchronous context manager.
+    """
+
+    def __init__(self, searcher):
+        self.searcher = searcher
+
+        self._ws = None
+        self._reader = None
+        self._tags = itertools.count(1)
+        # Maps tag to the Subscription it identifies.
+        self._subscriptions = {}
+        # The tasks running the callbacks of subscriptions.
+        self._callback_tasks = set()
+
+    async def open(self):
+        """
+        Open the websocket, if it is not already open. This is done
+        automatically by the first call to :py:meth:`subscribe`.
+        """
+        if self._ws is not None:
+            return
+
+        ws_url = self.searcher._make_url("camli/search/ws")
+        try:
+            self._ws = await self.searcher.http_session.ws_connect(ws_url)
+        except aiohttp.WSServerHandshakeError as e:
+            raise ServerError(
+                "Failed to open search websocket: server returned %i %s" % (
+                    e.status,
+                    e.message,
+                )
+            )
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def subscribe(self, q, callback=None, describe=None):
+        """
+        Subscribe to the results of a query, returning a
+        :py:class:`Subscription`.
+
+        ``q`` and ``describe`` are interpreted as for
+        :py:meth:`perkeeppy.searchclient.SearchClient.query`. The server
+        sends the current results straight away, and again each time they
+        change, and each of these is delivered as a :py:class:`QueryUpdate`.
+
+        If ``callback`` is given, it is called with each update, and may be
+        a coroutine function. Each subscription's callback runs in its own
+        task, so a slow callback only delays the updates of its own
+        subscription, which are merged while it catches up. An exception
+        raised by a callback is logged, and doesn't affect any other
+        subscription. Otherwise, the updates are obtained by iterating over
+        the returned subscription with ``async for``.
+        """
+        await self.open()
+
+        tag = str(next(self._tags))
+        subscription = Subscription(self, tag, q, callback)
+        self._subscriptions[tag] = subscription
+
+        if callback is not None:
+            task = asyncio.ensure_future(subscription._run_callback())
+            self._callback_tasks.add(task)
+            task.add_done_callback(self._callback_tasks.discard)
+
+        await self._ws.send_str(json.dumps({
+            "tag": tag,
+            "query": self.searcher._query_request_data(q, describe=describe),
+        }))
+        return subscription
+
+    async def close(self):
+        """
+        Close the websocket, ending all of the subscriptions, and wait for
+        any callbacks that are still running.
+        """
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            await self._reader
+        if len(self._callback_tasks) > 0:
+            await asyncio.gather(*self._callback_tasks)
+
+    async def _unsubscribe(self, subscription):
+        if self._subscriptions.pop(subscription.tag, None) is None:
+            return
+
+        subscription._finish()
+        if not self._ws.closed:
+            # A null query tells the server to stop running it.
+            await self._ws.send_str(json.dumps({
+                "tag": subscription.tag,
+                "query": None,
+            }))
+
+    async def _read(self):
+        # Errors end the subscriptions, which pass them on to their
+        # consumers, rather than being raised from here.
+        error = None
+        try:
+            async for msg in self._ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    self._dispatch(json.loads(msg.data))
+                elif msg.type == aiohttp.WSMsgType.ERROR:
+                    error = ServerError(
+                        "Search websocket failed: %s" % self._ws.exception()
+                    )
+                    break
+        except Exception as e:
+            error = e
+        finally:
+            for subscription in self._subscriptions.values():
+                subscription._finish(error)
+            self._subscriptions.clear()
+
+    def _dispatch(self, raw):
+        subscription = self._subscriptions.get(raw.get("tag"))
+        if subscription is None:
+            # Results may still arrive for a query we've just unsubscribed
+            # from.
+            return
+
+        (results, _) = self.searcher._page_from_data(raw.get("result") or {})
+        subscription._deliver(results)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+class Subscription(object):
+    """
+    A query subscribed to with :py:meth:`Subscriptions.subscribe`.
+
+    Unless it was created with a callback, a subscription is an
+    asynchronous iterator of :py:class:`QueryUpdate` objects, which ends
+    when the subscription is cancelled or the websocket is closed. If the
+    consumer falls behind, intermediate updates are merged, so that each
+    update describes the changes since the one before it.
+    """
+
+    #: The tag identifying this query on the websocket.
+    tag = None
+
+    #: The query, as given to :py:meth:`Subscriptions.subscribe`.
+    query = None
+
+    #: The most recently delivered list of
+    #: :py:class:`perkeeppy.searchclient.SearchResult`, or ``None`` if no
+    #: results have been delivered yet.
+    results = None
+
+    def __init__(self, subscriptions, tag, query, callback=None):
+        self.subscriptions = subscriptions
+        self.tag = tag
+        self.query = query
+        self.callback = callback
+
+        # The results received but not yet delivered to an iterator.
+        self._latest = None
+        self._changed = asyncio.Event()
+        self._finished = False
+        self._error = None
+
+    async def unsubscribe(self):
+        """
+        Ask the server to stop running the query, and end the iteration.
+        """
+        await self.subscriptions._unsubscribe(self)
+
+    def _deliver(self, results):
+        self._latest = results
+        self._changed.set()
+
+    async def _run_callback(self):
+        while True:
+            try:
+                update = await self._next_update()
+            except StopAsyncIteration:
+                return
+            except Exception:
+                logger.exception("Subscription %s ended with an error", self)
+                return
+
+            try:
+                ret = self.callback(update)
+                if inspect.isawaitable(ret):
+                    await ret
+            except Exception:
+                logger.exception("Callback for subscription %s failed", self)
+
+    def _finish(self, error=None):
+        self._finished = True
+        self._error = error
+        self._changed.set()
+
+    def _update(self, results):
+        previous = self.results or []
+        previous_blobrefs = set(result.blobref for result in previous)
+        blobrefs = set(result.blobref for result in results)
+
+        update = QueryUpdate(
+            results,
+            added=[
+                result for result in results
+                if result.blobref not in previous_blobrefs
+            ],
+            removed=[
+                result.blobref for result in previous
+                if result.blobref not in blobrefs
+            ],
+        )
+        self.results = results
+        return update
+
+    def __aiter__(self):
+        if self.callback is not None:
+            raise TypeError("Can't iterate a subscription with a callback")
+        return self
+
+    async def __anext__(self):
+        return await self._next_update()
+
+    async def _next_update(self):
+        while True:
+            if self._latest is not None:
+                results = self._latest
+                self._latest = None
+                return self._update(results)
+
+            if self._finished:
+                if self._error is not None:
+                    raise self._error
+                raise StopAsyncIteration
+
+            self._changed.clear()
+            await self._changed.wait()
+
+    def __repr__(self):
+        return "<perkeeppy.subscriptions.Subscription %s %r>" % (
+            self.tag,
+            self.query,
+        )
+
+
+class QueryUpdate(object):
+    """
+    A change to the results of a :py:class:`Subscription`.
+    """
+
+    #: The complete current list of
+    #: :py:class:`perkeeppy.searchclient.SearchResult`.
+    results = None
+
+    #: The results that were not in the previous update.
+    added = None
+
+    #: The blobrefs of the results of the previous update that are no
+    #: longer present.
+    removed = None
+
+    def __init__(self, results, added, removed):
+        self.results = results
+        self.added = added
+        self.removed = removed
+
+    def __repr__(self):
+        return (
+            "<perkeeppy.subscriptions.QueryUpdate %i results "
+            "(+%i -%i)>" % (
+                len(self.results),
+                len(self.added),
+                len(self.removed),
+            )
+        )
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from perkeeppy.blobclient import (
+    DEFAULT_MAX_WORKERS,
+    _clear_checkpoint,
+    _read_checkpoint,
+    _write_checkpoint,
+)
+from perkeeppy.concurrency import bounded_map
+from perkeeppy.exceptions import (
+    HashMismatchError,
+    NotFoundError,
+    ServerError,
+)
+
+
+class BlobSync(object):
+    """
+    Copies the blobs that one Perkeep server has and another lacks.
+
+    ``source`` and ``destination`` are
+    :py:class:`perkeeppy.blobclient.BlobClient` instances, typically the
+    :py:attr:`perkeeppy.Connection.blobs` of two connections.
+
+    Both servers enumerate their blobs in blobref order, so the set of
+    blobs missing from the destination is found by walking the two
+    enumerations side by side, without holding either in memory. Missing
+    blobs are fetched from the source with up to ``get_workers`` concurrent
+    requests, and written to the destination in batches of the size used by
+    :py:meth:`perkeeppy.blobclient.BlobClient.put_multi`, with up to
+    ``upload_workers`` batches in flight.
+    """
+
+    def __init__(
+        self,
+        source,
+        destination,
+        get_workers=DEFAULT_MAX_WORKERS,
+        upload_workers=2,
+    ):
+        self.source = source
+        self.destination = destination
+        self.get_workers = get_workers
+        self.upload_workers = upload_workers
+
+    def missing(self, after=None, report=None):
+        """
+        Generate :py:class:`perkeeppy.blobclient.BlobMeta` objects for the
+        blobs that the source has and the destination lacks, in blobref
+        order, optionally starting after the given blobref.
+
+        If ``report`` is given, it is a :py:class:`SyncReport` whose
+        :py:attr:`SyncReport.skipped` count is incremented for each blob
+        that both servers have.
+        """
+        destination_metas = self.destination.enumerate(
+            prefetch=True, after=after,
+        )
+        destination_meta = next(destination_metas, None)
+
+        for source_meta in self.source.enumerate(prefetch=True, after=after):
+            blobref = source_meta.blobref
+
+            while (
+                destination_meta is not None and
+                destination_meta.blobref < blobref
+            ):
+                destination_meta = next(destination_metas, None)
+
+            if (
+                destination_meta is not None and
+                destination_meta.blobref == blobref
+            ):
+                if report is not None:
+                    report.skipped += 1
+                continue
+
+            yield source_meta
+
+    def run(
+        self,
+        dry_run=False,
+        checkpoint_path=None,
+        checkpoint_interval=10.0,
+        progress=None,
+    ):
+        """
+        Copy every blob that is missing from the destination, returning a
+        :py:class:`SyncReport`.
+
+        If ``dry_run`` is ``True``, the missing blobs are counted but not
+        copied.
+
+        If ``checkpoint_path`` is given, the blobref up to which every blob
+        is known to be on the destination is saved to that file at most
+        every ``checkpoint_interval`` seconds and when the run stops, and a
+        later run continues from that point. Once a run has dealt with
+        every blob without any failure that a later run could retry, the
+        checkpoint file is removed, so that the next run checks all of the
+        source's blobs again. Checkpoints are not written during a dry run.
+
+        A blob that cannot be fetched from the source or written to the
+        destination is recorded in the report's :py:attr:`SyncReport.failed`
+        and :py:attr:`SyncReport.errors` rather than stopping the run.
+
+        If ``progress`` is given, it is called with the in-progress
+        :py:class:`SyncReport` each time a batch is written.
+        """
+        after = None
+        if checkpoint_path is not None:
+            after = _read_checkpoint(checkpoint_path)
+
+        report = SyncReport()
+        missing_metas = self.missing(after=after, report=report)
+
+        if dry_run:
+            for blob_meta in missing_metas:
+                report.copied += 1
+                report.copied_bytes += blob_meta.size
+            report.finish()
+            return report
+
+        # Set once a blob has failed in a way that a later run might not
+        # repeat, after which the checkpoint must not move past it.
+        retry_needed = False
+
+        def fetch_blobs():
+            nonlocal retry_needed
+
+            missing_blobrefs = (
+                blob_meta.blobref for blob_meta in missing_metas
+            )
+            results = bounded_map(
+                self.source.get, missing_blobrefs,
+                max_workers=self.get_workers,
+            )
+            for blobref, future in results:
+                try:
+                    blob = future.result()
+                except NotFoundError as e:
+                    # The source no longer has it, so there's nothing
+                    # we can copy.
+                    report.failed.append(blobref)
+                    report.errors[blobref] = e
+                except (ServerError, HashMismatchError) as e:
+                    report.failed.append(blobref)
+                    report.errors[blobref] = e
+                    retry_needed = True
+                else:
+                    yield blob
+
+        def upload_batch(batch):
+            self.destination._upload_blobs(batch)
+
+        batches = self.destination._batch_blobs(fetch_blobs())
+        results = bounded_map(
+            upload_batch, batches,
+            max_workers=self.upload_workers,
+        )
+
+        checkpointed = after
+        last_checkpoint = time.monotonic()
+        finished = False
+        try:
+            for batch, future in results:
+                try:
+                    future.result()
+                except Exception as e:
+                    for blob in batch:
+                        report.failed.append(blob.blobref)
+                        report.errors[blob.blobref] = e
+                    # Stop advancing the checkpoint so that a later run
+                    # retries this batch.
+                    retry_needed = True
+                else:
+                    report.copied += len(batch)
+                    report.copied_bytes += sum(blob.size for blob in batch)
+
+                # Batches complete in blobref order, so everything up to
+                # the end of this batch has now been dealt with.
+                if not retry_needed:
+                    after = batch[-1].blobref
+
+                # Nothing may have been dealt with yet, if the first batch
+                # already needs a retry.
+                if checkpoint_path is not None and after is not None and (
+                    time.monotonic() - last_checkpoint >= checkpoint_interval
+                ):
+                    _write_checkpoint(checkpoint_path, after)
+                    checkpointed = after
+                    last_checkpoint = time.monotonic()
+
+                if progress is not None:
+                    progress(report)
+            finished = True
+        finally:
+            if checkpoint_path is not None:
+                if finished and not retry_needed:
+                    # Everything has been copied, so the next run must
+                    # start from the beginning to find blobs added since,
+                    # which can sort anywhere.
+                    _clear_checkpoint(checkpoint_path)
+                elif after is not None and after != checkpointed:
+                    _write_checkpoint(checkpoint_path, after)
+
+        report.finish()
+        return report
+
+
+class SyncReport(object):
+    """
+    The outcome of a :py:meth:`BlobSync.run`.
+    """
+
+    #: The number of blobs copied to the destination, or that would have
+    #: been copied in a dry run.
+    copied = 0
+
+    #: The total size in bytes of the blobs counted in :py:attr:`copied`.
+    copied_bytes = 0
+
+    #: The number of blobs that the destination already had.
+    skipped = 0
+
+    #: The blobrefs of the blobs that could not be copied.
+    failed = None
+
+    #: A mapping from each blobref in :py:attr:`failed` to the exception
+    #: that prevented it from being copied.
+    errors = None
+
+    def __init__(self):
+        self.failed = []
+        self.errors = {}
+        self.start_time = time.monotonic()
+        self.end_time = None
+
+    def finish(self):
+        self.end_time = time.monotonic()
+
+    @property
+    def elapsed(self):
+        """
+        The duration of the run so far, in seconds.
+        """
+        end_time = self.end_time
+        if end_time is None:
+            end_time = time.monotonic()
+        return end_time - self.start_time
+
+    @property
+    def blobs_per_second(self):
+        """
+        The average number of blobs copied per second.
+        """
+        elapsed = self.elapsed
+        return self.copied / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def bytes_per_second(self):
+        """
+        The average number of bytes copied per second.
+        """
+        elapsed = self.elapsed
+        return self.copied_bytes / elapsed if elapsed > 0 else 0.0
+
+    def __repr__(self):
+        return (
+            "<perkeeppy.sync.SyncReport copied=%i (%i bytes) skipped=%i "
+            "failed=%i in %.1fs>" % (
+                self.copied,
+                self.copied_bytes,
+                self.skipped,
+                len(self.failed),
+                self.elapsed,
+            )
+        )
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+
+
+class PipelinedUploader(object):
+    """
+    Uploads a stream of blobs while keeping several requests in flight.
+
+    :py:meth:`perkeeppy.blobclient.BlobClient.put_multi` waits for each
+    ``camli/stat`` request to complete before it sends the corresponding
+    ``camli/upload``, and waits for that before it reads the next batch.
+    This class instead runs the two stages on separate thread pools, so that
+    up to ``stat_workers`` stat batches and ``upload_workers`` upload batches
+    are outstanding at once.
+
+    Batches are formed in the same way as for
+    :py:meth:`perkeeppy.blobclient.BlobClient.put_multi`, so each request
+    stays within the protocol limits. At most ``max_pending`` batches may
+    wait for each stage beyond the ones being worked on; once that limit is
+    reached, submitting another batch blocks until one completes, keeping
+    memory usage bounded no matter how fast blobs are produced.
+
+    Instances can be used as context managers, which calls :py:meth:`close`
+    on exit.
+    """
+
+    def __init__(
+        self,
+        blob_client,
+        stat_workers=2,
+        upload_workers=4,
+        max_pending=2,
+    ):
+        self.blob_client = blob_client
+
+        self._stat_executor = ThreadPoolExecutor(max_workers=stat_workers)
+        self._upload_executor = ThreadPoolExecutor(max_workers=upload_workers)
+
+        # These semaphores are what bound our queues: a slot is taken when
+        # a batch is queued for a stage and released when that stage is done
+        # with it.
+        self._stat_slots = threading.BoundedSemaphore(
+            stat_workers + max_pending,
+        )
+        self._upload_slots = threading.BoundedSemaphore(
+            upload_workers + max_pending,
+        )
+
+    def submit_batch(self, blobs):
+        """
+        Queue a single batch of blobs for upload.
+
+        ``blobs`` must be a list of :py:class:`perkeeppy.Blob` objects that
+        fits in a single upload request. Returns a
+        :py:class:`concurrent.futures.Future` whose result is a
+        :py:class:`UploadReport` for just this batch. Failed requests are
+        recorded in the report rather than raised; the future only raises
+        if the batch could not be handled at all, such as when the
+        uploader has been closed.
+
+        If the stat stage is already saturated, this call blocks until
+        there is room for the batch.
+        """
+        batch_future = Future()
+        self._stat_slots.acquire()
+        try:
+            self._stat_executor.submit(self._stat_batch, blobs, batch_future)
+        except BaseException:
+            self._stat_slots.release()
+            raise
+        return batch_future
+
+    def upload(self, blobs, callback=None):
+        """
+        Upload all of the blobs from the given iterable, which may be
+        a generator of any length.
+
+        If ``callback`` is given, it is called with the
+        :py:class:`concurrent.futures.Future` of each batch as soon as that
+        batch is submitted, which allows callers to track progress.
+
+        Returns an :py:class:`UploadReport` covering all of the given blobs
+        once every batch has completed.
+        """
+        report = UploadReport()
+        batch_futures = []
+
+        for batch in self.blob_client._batch_blobs(iter(blobs)):
+            batch_future = self.submit_batch(batch)
+            if callback is not None:
+                callback(batch_future)
+
+            # Fold finished batches into the report as we go, so that the
+            # list of outstanding futures stays short.
+            batch_futures.append(batch_future)
+            while len(batch_futures) > 0 and batch_futures[0].done():
+                report.merge(batch_futures.pop(0).result())
+
+        for batch_future in batch_futures:
+            report.merge(batch_future.result())
+
+        return report
+
+    def close(self):
+        """
+        Wait for all outstanding batches to finish and then release the
+        worker threads.
+        """
+        # Stat workers hand off to the upload pool, so they must be
+        # drained first.
+        self._stat_executor.shutdown(wait=True)
+        self._upload_executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _stat_batch(self, blobs, batch_future):
+        # Whatever happens, batch_future must be resolved, or upload()
+        # would wait for it forever.
+        try:
+            try:
+                missing = self.blob_client._find_missing(blobs)
+            except Exception as e:
+                report = UploadReport()
+                report.add_failed([blob.blobref for blob in blobs], e)
+                batch_future.set_result(report)
+                return
+
+            missing_blobrefs = set(blob.blobref for blob in missing)
+            skipped = [
+                blob.blobref for blob in blobs
+                if blob.blobref not in missing_blobrefs
+            ]
+
+            if len(missing) == 0:
+                report = UploadReport()
+                report.skipped.extend(skipped)
+                batch_future.set_result(report)
+                return
+
+            # Blocking here while the upload stage is saturated is what
+            # pushes back on the stat stage.
+            self._upload_slots.acquire()
+            try:
+                self._upload_executor.submit(
+                    self._upload_batch, missing, skipped, batch_future,
+                )
+            except BaseException:
+                self._upload_slots.release()
+                raise
+        except BaseException as e:
+            if not batch_future.done():
+                batch_future.set_exception(e)
+        finally:
+            self._stat_slots.release()
+
+    def _upload_batch(self, missing, skipped, batch_future):
+        report = UploadReport()
+        report.skipped.extend(skipped)
+        try:
+            self.blob_client._upload_blobs(missing)
+        except Exception as e:
+            report.add_failed([blob.blobref for blob in missing], e)
+        else:
+            report.uploaded.extend(blob.blobref for blob in missing)
+        finally:
+            self._upload_slots.release()
+
+        batch_future.set_result(report)
+
+
+class UploadReport(object):
+    """
+    The outcome of uploading blobs with :py:class:`PipelinedUploader`.
+    """
+
+    #: The blobrefs of the blobs that were sent to the server.
+    uploaded = None
+
+    #: The blobrefs of the blobs that the server already had.
+    skipped = None
+
+    #: The blobrefs of the blobs that could not be uploaded.
+    failed = None
+
+    #: A mapping from each blobref in :py:attr:`failed` to the exception
+    #: that caused its batch to fail.
+    errors = None
+
+    def __init__(self):
+        self.uploaded = []
+        self.skipped = []
+        self.failed = []
+        self.errors = {}
+
+    def add_failed(self, blobrefs, error):
+        for blobref in blobrefs:
+            self.failed.append(blobref)
+            self.errors[blobref] = error
+
+    def merge(self, other):
+        """
+        Add the results from another report to this one.
+        """
+        self.uploaded.extend(other.uploaded)
+        self.skipped.extend(other.skipped)
+        self.failed.extend(other.failed)
+        self.errors.update(other.errors)
+
+    def __repr__(self):
+        return (
+            "<perkeeppy.uploader.UploadReport uploaded=%i skipped=%i "
+            "failed=%i>" % (
+                len(self.uploaded),
+                len(self.skipped),
+                len(self.failed),
+            )
+        )
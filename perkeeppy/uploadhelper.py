@@ -1,9 +1,27 @@
 # -*- coding: utf-8 -*-
 
+import binascii
+import collections
+import io
+import os
+import re
+import time
+
 import requests
 
+from perkeeppy.blobclient import (
+    DEFAULT_MAX_WORKERS,
+    MAX_BATCH_BLOBS,
+    MAX_UPLOAD_SIZE,
+    STREAM_CHUNK_SIZE,
+)
+from perkeeppy.concurrency import bounded_map
 from perkeeppy.exceptions import ServerError
 
+# Characters that must be escaped in multipart header parameters, following
+# the HTML5 form encoding rules that browsers (and requests) use.
+_header_param_escape_re = re.compile(r'["\\\x00-\x1a\x1c-\x1f]')
+
 
 class UploadHelper(object):
     """
@@ -15,11 +33,19 @@ class UploadHelper(object):
     locally.
     """
 
+    #: The largest total size of the files that :py:meth:`upload_files`
+    #: will send in a single request.
+    max_request_size = MAX_UPLOAD_SIZE
+
+    #: The largest number of files that :py:meth:`upload_files` will send
+    #: in a single request.
+    max_request_files = MAX_BATCH_BLOBS
+
     def __init__(self, http_session, base_url):
         self.http_session = http_session
         self.base_url = base_url
 
-    def upload_file(self, filename, fileobj, mtime=None):
+    def upload_file(self, filename, fileobj, mtime=None, progress=None):
         """
         Upload a single file.
 
@@ -29,25 +55,319 @@ class UploadHelper(object):
         string with a valid file modification timestamp (meaning an ISO
         timestamp).
 
+        The file is streamed to the server as it is read, so files of any
+        size can be uploaded without holding them in memory. If ``progress``
+        is given, it is called as the request body is sent; see
+        :py:class:`MultipartEncoder`.
+
         Returns a blobref pointing to the schema object for the file.
         """
 
+        payload = self._upload_payload(filename, fileobj, mtime)
+        encoder = MultipartEncoder(payload, progress=progress)
+
+        if encoder.size is not None:
+            data = encoder
+        else:
+            # Without a length, requests falls back on a chunked upload
+            # when given an iterator.
+            data = iter(encoder)
+
+        result = self.http_session.post(
+            self.base_url,
+            data=data,
+            headers={'Content-Type': encoder.content_type},
+        )
+        return self._fileref_from_response(result)
+
+    def upload_files(self, files, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Upload many files, several to a request.
+
+        ``files`` is an iterable, which may be a generator of any length, of
+        ``(filename, fileobj)`` or ``(filename, fileobj, mtime)`` tuples
+        with the same meanings as the arguments of :py:meth:`upload_file`.
+        ``fileobj`` may also be the path of a local file, which is then
+        only opened while it is being sent, so that large directories can be
+        imported without holding all of their files open.
+
+        Files are packed into requests of at most
+        :py:attr:`max_request_files` files and
+        :py:attr:`max_request_size` bytes (a file of unknown size is sent on
+        its own), and up to ``max_workers`` requests are sent at once.
+
+        This is a generator yielding a ``(file, fileref)`` pair for each of
+        the given tuples, in the order they were given, where ``fileref``
+        is the blobref of the schema object for that file.
+        """
+        batches = self._batch_files(_iter_upload_files(files))
+        results = bounded_map(
+            self._upload_batch, batches, max_workers=max_workers,
+        )
+        for (batch, future) in results:
+            filerefs = future.result()
+            for (upload_file, fileref) in zip(batch, filerefs):
+                yield (upload_file.item, fileref)
+
+    def _batch_files(self, upload_files):
+        batch = []
+        batch_size = 0
+
+        for upload_file in upload_files:
+            size = upload_file.size
+            if size is None:
+                size = self.max_request_size
+
+            if len(batch) > 0 and (
+                len(batch) >= self.max_request_files or
+                batch_size + size > self.max_request_size
+            ):
+                yield batch
+                batch = []
+                batch_size = 0
+
+            batch.append(upload_file)
+            batch_size += size
+
+        if len(batch) > 0:
+            yield batch
+
+    def _upload_batch(self, batch):
+        """
+        Upload the given files in a single request, returning a list of
+        their filerefs in the same order.
+        """
+        payload = []
+        opened = []
+        current_mtime = ''
+        try:
+            for (i, upload_file) in enumerate(batch):
+                fileobj = upload_file.fileobj
+                if isinstance(fileobj, (str, os.PathLike)):
+                    fileobj = open(fileobj, 'rb')
+                    opened.append(fileobj)
+
+                # The server applies a modtime field to all of the files
+                # after it, and an empty one clears it again.
+                mtime = upload_file.mtime or ''
+                if mtime != current_mtime:
+                    payload.append(('modtime', (None, mtime)))
+                    current_mtime = mtime
+
+                # Unique form names let us match up the response.
+                payload.append(
+                    ('file%i' % i, (upload_file.filename, fileobj))
+                )
+
+            encoder = MultipartEncoder(payload)
+            result = self.http_session.post(
+                self.base_url,
+                data=encoder if encoder.size is not None else iter(encoder),
+                headers={'Content-Type': encoder.content_type},
+            )
+        finally:
+            for fileobj in opened:
+                fileobj.close()
+
+        got = self._got_from_response(result)
+        filerefs = {entry.get('formName'): entry['fileref'] for entry in got}
+        try:
+            return [filerefs['file%i' % i] for i in range(len(batch))]
+        except KeyError as e:
+            raise ServerError(
+                'Server did not return a fileref for every file.'
+            ) from e
+
+    def _upload_payload(self, filename, fileobj, mtime):
         if not filename or not isinstance(filename, str):
             raise ValueError(f'Invalid filename supplied: {filename}')
 
         # Perkeep does not actually (currently; 2018-04) care about the name
-        # field, other than when it's 'modtime'
-        payload = [('file', (filename, fileobj))]
+        # field, other than when it's 'modtime', which applies to the files
+        # after it, as in _upload_batch.
+        payload = []
 
         if mtime:
             # Requests wants a file-like object
             payload.append(('modtime', (None, mtime)))
 
-        result = self.http_session.post(self.base_url, files=payload)
+        payload.append(('file', (filename, fileobj)))
+        return payload
 
+    def _fileref_from_response(self, result):
+        return self._got_from_response(result)[0]['fileref']
+
+    def _got_from_response(self, result):
         try:
             result.raise_for_status()
         except requests.exceptions.HTTPError as e:
             raise ServerError('Server returned a non-200 result.') from e
 
-        return result.json()['got'][0]['fileref']
+        return result.json()['got']
+
+
+class _UploadFile(object):
+    """
+    One of the files given to :py:meth:`UploadHelper.upload_files`.
+    """
+
+    __slots__ = ('item', 'filename', 'fileobj', 'mtime', 'size')
+
+    def __init__(self, item):
+        if len(item) == 2:
+            (filename, fileobj) = item
+            mtime = None
+        else:
+            (filename, fileobj, mtime) = item
+
+        if not filename or not isinstance(filename, str):
+            raise ValueError(f'Invalid filename supplied: {filename}')
+
+        self.item = item
+        self.filename = filename
+        self.fileobj = fileobj
+        self.mtime = mtime
+
+        if isinstance(fileobj, (str, os.PathLike)):
+            self.size = os.path.getsize(fileobj)
+        else:
+            self.size = _remaining_size(fileobj)
+
+
+def _iter_upload_files(files):
+    for item in files:
+        yield _UploadFile(item)
+
+
+class MultipartEncoder(object):
+    """
+    A ``multipart/form-data`` request body that is produced as it is read,
+    so that file contents are streamed rather than buffered in memory.
+
+    ``fields`` is a list of ``(name, (filename, value))`` tuples, in the
+    form accepted by the ``files`` argument of :py:mod:`requests`, where
+    ``value`` is a string, bytes, or a binary file-like object.
+
+    If ``progress`` is given, it is called after each read with three
+    arguments: the number of bytes of the body read so far, the total size
+    of the body (or ``None`` if it could not be determined), and the average
+    throughput since the first read in bytes per second.
+
+    The encoder is a read-only file-like object. Its length is the size of
+    the whole body, which is only known if every file-like value can
+    report its size; otherwise :py:attr:`size` is ``None`` and the encoder
+    must be sent by iterating over it.
+    """
+
+    #: The size of the encoded body in bytes, or ``None`` if unknown.
+    size = None
+
+    def __init__(self, fields, boundary=None, progress=None):
+        if boundary is None:
+            boundary = binascii.hexlify(os.urandom(16)).decode('ascii')
+
+        self.boundary = boundary
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        self.progress = progress
+        self.bytes_read = 0
+
+        self._start_time = None
+        self._segments = collections.deque()
+        self.size = 0
+
+        for (name, (filename, value)) in fields:
+            header = f'--{boundary}\r\n'
+            header += 'Content-Disposition: form-data; '
+            header += _format_header_param('name', name)
+            if filename is not None:
+                header += '; ' + _format_header_param('filename', filename)
+            header += '\r\n\r\n'
+            self._add_segment(header.encode('utf8'))
+
+            if isinstance(value, str):
+                value = value.encode('utf8')
+            self._add_segment(value)
+            self._add_segment(b'\r\n')
+
+        self._add_segment(f'--{boundary}--\r\n'.encode('utf8'))
+
+    def __len__(self):
+        if self.size is None:
+            raise TypeError('Size of multipart body is unknown')
+        return self.size
+
+    def read(self, size=-1):
+        """
+        Read up to ``size`` bytes of the body, or all of the rest of it if
+        ``size`` is negative.
+        """
+        if size is None or size < 0:
+            return b''.join(iter(lambda: self.read(STREAM_CHUNK_SIZE), b''))
+
+        if self._start_time is None:
+            self._start_time = time.monotonic()
+
+        ret = bytearray()
+        while len(ret) < size and len(self._segments) > 0:
+            segment = self._segments[0]
+            if isinstance(segment, bytes):
+                chunk = segment[:size - len(ret)]
+                if len(chunk) == len(segment):
+                    self._segments.popleft()
+                else:
+                    self._segments[0] = segment[len(chunk):]
+            else:
+                chunk = segment.read(size - len(ret))
+                if not chunk:
+                    self._segments.popleft()
+            ret += chunk
+
+        self.bytes_read += len(ret)
+        if self.progress is not None and len(ret) > 0:
+            elapsed = time.monotonic() - self._start_time
+            rate = self.bytes_read / elapsed if elapsed > 0 else 0.0
+            self.progress(self.bytes_read, self.size, rate)
+
+        return bytes(ret)
+
+    def __iter__(self):
+        return iter(lambda: self.read(STREAM_CHUNK_SIZE), b'')
+
+    def _add_segment(self, segment):
+        self._segments.append(segment)
+
+        if self.size is None:
+            return
+        if isinstance(segment, bytes):
+            self.size += len(segment)
+            return
+
+        remaining = _remaining_size(segment)
+        if remaining is None:
+            self.size = None
+        else:
+            self.size += remaining
+
+
+def _format_header_param(name, value):
+    value = _header_param_escape_re.sub(
+        lambda m: '\\\\' if m.group(0) == '\\' else '%%%02X' % ord(m.group(0)),
+        value,
+    )
+    return f'{name}="{value}"'
+
+
+def _remaining_size(fileobj):
+    """
+    Return the number of bytes left to read from a file-like object, or
+    ``None`` if that can't be determined without reading it.
+    """
+    try:
+        if not fileobj.seekable():
+            return None
+        pos = fileobj.tell()
+        end = fileobj.seek(0, io.SEEK_END)
+        fileobj.seek(pos)
+    except (AttributeError, OSError):
+        return None
+    return end - pos
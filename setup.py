@@ -19,6 +19,8 @@ setup(
         'sphinx>=1.7.0'
     ],
     tests_require=[
+        'aiohttp',
+        'pgpy',
         'pycodestyle',
         'requests_mock',
         'requests_toolbelt'
@@ -27,6 +29,10 @@ setup(
         "requests",
         "python-dateutil",
     ],
+    extras_require={
+        "aio": ["aiohttp"],
+        "signing": ["pgpy"],
+    },
     classifiers=[
         "License :: OSI Approved :: MIT License",
         "Intended Audience :: Developers",
@@ -0,0 +1,446 @@
+import asyncio
+import io
+import json
+import unittest
+from unittest.mock import patch
+
+from perkeeppy.aio import (
+    connect,
+    AsyncBlobClient,
+    AsyncSearchClient,
+    AsyncSigner,
+    AsyncUploadHelper,
+)
+from perkeeppy.blobclient import Blob, BlobMeta
+from perkeeppy.exceptions import (
+    NotFoundError,
+    NotPerkeepServerError,
+    ServerError,
+    SigningError,
+)
+from perkeeppy.searchclient import SearchResult
+
+
+class MockResponse(object):
+
+    def __init__(self, status=200, content=b'', headers=None, url=None,
+                 reason='OK'):
+        self.status = status
+        self.reason = reason
+        self.headers = headers or {}
+        self.url = url
+        self.content = content
+
+    async def read(self):
+        return self.content
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class MockSession(object):
+    """
+    Stands in for an aiohttp.ClientSession, answering requests from a
+    mapping of (method, url) to MockResponse, or to a list of them to be
+    returned in turn.
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+        self.closed = False
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url, kwargs))
+        resp = self.responses[(method, url)]
+        if isinstance(resp, list):
+            resp = resp.pop(0)
+        if resp.url is None:
+            resp.url = url
+        return resp
+
+    async def close(self):
+        self.closed = True
+
+
+async def collect(async_iterable):
+    return [item async for item in async_iterable]
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class TestAsyncConnect(unittest.TestCase):
+
+    def test_success(self):
+        session = MockSession({
+            ('GET', 'http://example.com/?camli.mode=config'): MockResponse(
+                content=b'{"blobRoot": "/mock-blobs/",'
+                        b' "searchRoot": "/mock-search/"}',
+                url='http://example.net/?camli.mode=config',
+            ),
+        })
+
+        conn = run(connect('http://example.com/', http_session=session))
+
+        self.assertEqual(conn.blob_root, 'http://example.net/mock-blobs/')
+        self.assertEqual(conn.search_root, 'http://example.net/mock-search/')
+        self.assertIsInstance(conn.blobs, AsyncBlobClient)
+        self.assertIsInstance(conn.searcher, AsyncSearchClient)
+        self.assertIsNone(conn.signer)
+
+    def test_not_found(self):
+        session = MockSession({
+            ('GET', 'http://example.com/?camli.mode=config'): MockResponse(
+                status=404,
+            ),
+        })
+
+        self.assertRaises(
+            NotPerkeepServerError,
+            lambda: run(connect('http://example.com/', http_session=session)),
+        )
+        # The caller's session is left for the caller to close
+        self.assertFalse(session.closed)
+
+    def test_failure_closes_own_session(self):
+        session = MockSession({
+            ('GET', 'http://example.com/?camli.mode=config'): MockResponse(
+                status=404,
+            ),
+        })
+
+        with patch('perkeeppy.aio.aiohttp.ClientSession') as make_session:
+            make_session.return_value = session
+            self.assertRaises(
+                NotPerkeepServerError,
+                lambda: run(connect('http://example.com/')),
+            )
+
+        self.assertTrue(session.closed)
+
+
+class TestAsyncBlobClient(unittest.TestCase):
+
+    blobref = 'sha1-7928f34bd3263b86e67d11efff30d67fe7f3d176'
+
+    def test_get(self):
+        session = MockSession({
+            ('GET', 'http://example.com/camli/' + self.blobref): MockResponse(
+                content=b'dummy blob',
+            ),
+            ('GET', 'http://example.com/camli/sha1-missing'): MockResponse(
+                status=404,
+            ),
+            ('GET', 'http://example.com/camli/sha1-broken'): MockResponse(
+                status=500,
+            ),
+        })
+        blobs = AsyncBlobClient(session, 'http://example.com/')
+
+        async def get_all():
+            return await asyncio.gather(
+                blobs.get(self.blobref),
+                blobs.get('sha1-missing'),
+                blobs.get('sha1-broken'),
+                return_exceptions=True,
+            )
+
+        (found, missing, broken) = run(get_all())
+
+        self.assertIsInstance(found, Blob)
+        self.assertEqual(found.data, b'dummy blob')
+        self.assertIsInstance(missing, NotFoundError)
+        self.assertIsInstance(broken, ServerError)
+
+    def test_get_size(self):
+        session = MockSession({
+            ('HEAD', 'http://example.com/camli/dummy'): MockResponse(
+                headers={'Content-Length': '5'},
+            ),
+            ('HEAD', 'http://example.com/camli/missing'): MockResponse(
+                status=404,
+            ),
+        })
+        blobs = AsyncBlobClient(session, 'http://example.com/')
+
+        self.assertEqual(run(blobs.get_size('dummy')), 5)
+        self.assertTrue(run(blobs.blob_exists('dummy')))
+        self.assertFalse(run(blobs.blob_exists('missing')))
+
+    def test_enumerate(self):
+        session = MockSession({
+            ('GET', 'http://example.com/camli/enumerate-blobs'): MockResponse(
+                content=b'{"blobs": [{"blobRef": "dummy1", "size": 5}],'
+                        b' "continueAfter": "dummy1"}',
+            ),
+            (
+                'GET',
+                'http://example.com/camli/enumerate-blobs?after=dummy1',
+            ): MockResponse(
+                content=b'{"blobs": [{"blobRef": "dummy2", "size": 9}]}',
+            ),
+        })
+        blobs = AsyncBlobClient(session, 'http://example.com/')
+
+        blob_metas = run(collect(blobs.enumerate()))
+
+        self.assertEqual(
+            [type(x) for x in blob_metas],
+            [BlobMeta, BlobMeta],
+        )
+        self.assertEqual(
+            [(x.blobref, x.size) for x in blob_metas],
+            [("dummy1", 5), ("dummy2", 9)],
+        )
+
+    def test_get_size_multi(self):
+        session = MockSession({
+            ('POST', 'http://example.com/camli/stat'): MockResponse(
+                content=(
+                    b'{"stat": [{"blobRef": "dummy1", "size": 5},'
+                    b' {"blobRef": "dummy4", "size": 9}]}'
+                ),
+            ),
+        })
+        blobs = AsyncBlobClient(session, 'http://example.com/')
+        blobs.max_batch_blobs = 2
+
+        blobrefs = ['dummy%i' % i for i in range(1, 6)]
+        result = run(blobs.get_size_multi(blobrefs))
+
+        self.assertEqual(result, {
+            'dummy1': 5,
+            'dummy2': None,
+            'dummy3': None,
+            'dummy4': 9,
+            'dummy5': None,
+        })
+        self.assertEqual(
+            [kwargs['data'] for (_, _, kwargs) in session.requests],
+            [
+                {'camliversion': '1', 'blob1': 'dummy1', 'blob2': 'dummy2'},
+                {'camliversion': '1', 'blob1': 'dummy3', 'blob2': 'dummy4'},
+                {'camliversion': '1', 'blob1': 'dummy5'},
+            ],
+        )
+
+    def test_put_multi(self):
+        existing = Blob(b'dummy1')
+        new = Blob(b'dummy2')
+
+        session = MockSession({
+            ('POST', 'http://example.com/camli/stat'): MockResponse(
+                content=(
+                    '{"stat": [{"blobRef": "%s", "size": 6}]}' %
+                    existing.blobref
+                ).encode('utf8'),
+            ),
+            ('POST', 'http://example.com/camli/upload'): MockResponse(),
+        })
+        blobs = AsyncBlobClient(session, 'http://example.com/')
+
+        result = run(blobs.put_multi(existing, new))
+
+        self.assertEqual(result, [existing.blobref, new.blobref])
+        self.assertEqual(
+            session.requests[0][2]['data'],
+            {
+                'camliversion': '1',
+                'blob1': existing.blobref,
+                'blob2': new.blobref,
+            },
+        )
+        upload_form = session.requests[1][2]['data']
+        self.assertEqual(
+            [field[0]['name'] for field in upload_form._fields],
+            [new.blobref],
+        )
+
+
+class TestAsyncSearchClient(unittest.TestCase):
+
+    def test_query(self):
+        session = MockSession({
+            ('POST', 'http://example.com/s/camli/search/query'): MockResponse(
+                content=b'{"blobs": [{"blob": "dummy-1"},'
+                        b' {"blob": "dummy-2"}]}',
+            ),
+        })
+        searcher = AsyncSearchClient(session, 'http://example.com/s/')
+
+        results = run(collect(searcher.query('dummyquery')))
+
+        self.assertEqual(
+            session.requests[0][2]['data'],
+            '{"expression": "dummyquery"}',
+        )
+        self.assertEqual(
+            [type(result) for result in results],
+            [SearchResult, SearchResult],
+        )
+        self.assertEqual(
+            [result.blobref for result in results],
+            ["dummy-1", "dummy-2"],
+        )
+
+    def test_query_pages(self):
+        def page(blobrefs, continue_token):
+            return MockResponse(content=json.dumps({
+                "blobs": [{"blob": blobref} for blobref in blobrefs],
+                "continue": continue_token,
+            }).encode('utf8'))
+
+        def make_session():
+            return MockSession({
+                ('POST', 'http://example.com/s/camli/search/query'): [
+                    page(["dummy-1", "dummy-2"], "token-1"),
+                    page(["dummy-3", "dummy-4"], "token-2"),
+                    page(["dummy-5"], None),
+                ],
+            })
+
+        session = make_session()
+        searcher = AsyncSearchClient(session, 'http://example.com/s/')
+        results = run(collect(searcher.query('dummyquery', page_size=2)))
+
+        self.assertEqual(
+            [result.blobref for result in results],
+            ["dummy-1", "dummy-2", "dummy-3", "dummy-4", "dummy-5"],
+        )
+        self.assertEqual(
+            [json.loads(kwargs['data']) for (_, _, kwargs) in
+             session.requests],
+            [
+                {"expression": "dummyquery", "limit": 2},
+                {"expression": "dummyquery", "limit": 2,
+                 "continue": "token-1"},
+                {"expression": "dummyquery", "limit": 2,
+                 "continue": "token-2"},
+            ],
+        )
+
+        # No page is requested beyond the limit
+        session = make_session()
+        searcher = AsyncSearchClient(session, 'http://example.com/s/')
+        results = run(collect(
+            searcher.query('dummyquery', page_size=2, limit=4),
+        ))
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(session.requests), 2)
+
+    def test_describe_blob(self):
+        session = MockSession({
+            (
+                'GET',
+                'http://example.com/s/camli/search/describe',
+            ): MockResponse(
+                content=b'{"meta": {"dummy1": {"blobRef": "dummy1"}}}',
+            ),
+        })
+        searcher = AsyncSearchClient(session, 'http://example.com/s/')
+
+        result = run(searcher.describe_blob('dummy1'))
+
+        self.assertEqual(
+            session.requests[0][2]['params'],
+            {'blobref': 'dummy1'},
+        )
+        self.assertEqual(result.blobref, 'dummy1')
+
+
+class TestAsyncSigner(unittest.TestCase):
+
+    def test_sign_dict(self):
+        session = MockSession({
+            (
+                'GET',
+                'https://example.com/perkeep/camli/sig/discovery',
+            ): MockResponse(
+                content=b'{"publicKeyBlobRef": "sha1-aaaabbbbccccdddd"}',
+            ),
+            (
+                'POST',
+                'https://example.com/perkeep/camli/sig/sign',
+            ): MockResponse(
+                content=b'SIGNED',
+            ),
+        })
+        signer = AsyncSigner(session, 'https://example.com/perkeep/')
+
+        result = run(signer.sign_dict({'someOtherData': 'Hello'}))
+
+        self.assertEqual(result, b'SIGNED')
+        self.assertEqual(signer.camli_signer, 'sha1-aaaabbbbccccdddd')
+        self.assertEqual(
+            session.requests[1][2]['data'],
+            {
+                'json': '{"someOtherData": "Hello", "camliVersion": 1, '
+                        '"camliSigner": "sha1-aaaabbbbccccdddd"}',
+            },
+        )
+
+    def test_signing_throw_error(self):
+        session = MockSession({
+            (
+                'POST',
+                'https://example.com/perkeep/camli/sig/sign',
+            ): MockResponse(
+                status=400,
+            ),
+        })
+        signer = AsyncSigner(session, 'https://example.com/perkeep/')
+
+        self.assertRaises(
+            SigningError,
+            lambda: run(signer.sign_string('obviously wrong')),
+        )
+
+
+class TestAsyncUploadHelper(unittest.TestCase):
+
+    def test_upload_file(self):
+        session = MockSession({
+            ('POST', 'http://example.com/upload/'): MockResponse(
+                content=b'{"got": [{"fileref": "sha224-dummy",'
+                        b' "size": 5}]}',
+            ),
+        })
+        helper = AsyncUploadHelper(session, 'http://example.com/upload/')
+
+        fileref = run(helper.upload_file(
+            'afile', io.BytesIO(b'hello'), '2010-01-02T10:20:30Z',
+        ))
+
+        self.assertEqual(fileref, 'sha224-dummy')
+        form = session.requests[0][2]['data']
+        self.assertEqual(
+            [
+                (field[0]['name'], field[0].get('filename'))
+                for field in form._fields
+            ],
+            [('modtime', None), ('file', 'afile')],
+        )
+
+    def test_upload_file_error(self):
+        session = MockSession({
+            ('POST', 'http://example.com/upload/'): MockResponse(
+                status=500,
+                reason='Internal Server Error',
+            ),
+        })
+        helper = AsyncUploadHelper(session, 'http://example.com/upload/')
+
+        self.assertRaises(
+            ServerError,
+            lambda: run(helper.upload_file('afile', io.BytesIO(b'hello'))),
+        )
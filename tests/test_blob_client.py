@@ -125,6 +125,64 @@ class TestBlobClient(unittest.TestCase):
             "http://example.com/blerbs/camli/dummy-blobref"
         )
 
+    def test_get_multi(self):
+        http_session = MagicMock()
+
+        def get(url):
+            response = MagicMock()
+            if url.endswith('missing'):
+                response.status_code = 404
+            else:
+                response.status_code = 200
+                response.content = b'dummy blob'
+            return response
+
+        http_session.get.side_effect = get
+
+        blobs = BlobClient(http_session, 'http://example.com/blerbs/')
+        blobref = 'sha1-7928f34bd3263b86e67d11efff30d67fe7f3d176'
+
+        results = list(blobs.get_multi(
+            iter([blobref, 'sha1-missing', blobref]),
+            max_workers=2,
+        ))
+
+        from perkeeppy.exceptions import NotFoundError
+        self.assertEqual(
+            [x[0] for x in results],
+            [blobref, 'sha1-missing', blobref],
+        )
+        self.assertEqual(
+            [type(x[1]) for x in results],
+            [Blob, NotFoundError, Blob],
+        )
+        self.assertEqual(results[0][1].data, b'dummy blob')
+
+        unordered = list(blobs.get_multi(
+            [blobref, 'sha1-missing'],
+            ordered=False,
+        ))
+        self.assertEqual(
+            sorted(x[0] for x in unordered),
+            sorted([blobref, 'sha1-missing']),
+        )
+
+    def test_get_multi_hash_mismatch(self):
+        http_session = MagicMock()
+        response = MagicMock()
+        http_session.get.return_value = response
+
+        response.status_code = 200
+        response.content = b'dummy blob'
+
+        blobs = BlobClient(http_session, 'http://example.com/blerbs/')
+
+        from perkeeppy.exceptions import HashMismatchError
+        self.assertRaises(
+            HashMismatchError,
+            lambda: list(blobs.get_multi(['sha1-dummyblobref'])),
+        )
+
     def test_get_size_success(self):
         http_session = MagicMock()
         http_session.request = MagicMock()
@@ -250,6 +308,150 @@ class TestBlobClient(unittest.TestCase):
             [5, 9, 17],
         )
 
+    def make_enumerate_session(self, blobrefs, page_size=2):
+        """
+        Returns a mock session that serves enumerate-blobs pages for the
+        given blobrefs, honoring the "after" parameter as a server would.
+        """
+        import json
+        from urllib.parse import urlparse, parse_qs
+
+        blobrefs = sorted(blobrefs)
+        http_session = MagicMock()
+
+        def get(url):
+            query = parse_qs(urlparse(url).query)
+            after = query.get("after", [""])[0]
+            page = [x for x in blobrefs if x > after][:page_size]
+
+            data = {
+                "blobs": [
+                    {"blobRef": blobref, "size": len(blobref)}
+                    for blobref in page
+                ],
+            }
+            if len(page) > 0 and page[-1] != blobrefs[-1]:
+                data["continueAfter"] = page[-1]
+
+            response = MagicMock()
+            response.status_code = 200
+            response.content = json.dumps(data)
+            return response
+
+        http_session.get.side_effect = get
+        return http_session
+
+    def test_enumerate_prefetch(self):
+        blobrefs = ["sha1-%02x" % i for i in range(7)]
+        http_session = self.make_enumerate_session(blobrefs)
+
+        blobs = BlobClient(http_session, 'http://example.com/')
+        result = [x.blobref for x in blobs.enumerate(prefetch=True)]
+
+        self.assertEqual(result, blobrefs)
+        self.assertEqual(http_session.get.call_count, 4)
+
+    def test_enumerate_sharded(self):
+        blobrefs = [
+            Blob(str(i).encode('utf8'), hash_func_name=hash_func_name).blobref
+            for i in range(40)
+            for hash_func_name in ('sha1', 'sha224', 'sha256')
+        ] + ["aaa-dummy", "zzz-dummy"]
+        http_session = self.make_enumerate_session(blobrefs, page_size=3)
+
+        blobs = BlobClient(http_session, 'http://example.com/')
+
+        result = [
+            x.blobref for x in blobs.enumerate_sharded(shards=5, max_workers=3)
+        ]
+        self.assertEqual(result, sorted(blobrefs))
+
+        result = [
+            x.blobref for x in blobs.enumerate_sharded(
+                shards=20, ordered=False,
+            )
+        ]
+        self.assertEqual(sorted(result), sorted(blobrefs))
+
+    def test_enumerate_sharded_error(self):
+        from perkeeppy.exceptions import ServerError
+
+        http_session = MagicMock()
+        response = MagicMock()
+        response.status_code = 500
+        http_session.get.return_value = response
+
+        blobs = BlobClient(http_session, 'http://example.com/')
+
+        self.assertRaises(
+            ServerError,
+            lambda: list(blobs.enumerate_sharded(shards=2)),
+        )
+
+    def test_enumerate_after(self):
+        blobrefs = ["sha1-%02x" % i for i in range(7)]
+        http_session = self.make_enumerate_session(blobrefs)
+
+        blobs = BlobClient(http_session, 'http://example.com/')
+        result = [x.blobref for x in blobs.enumerate(after="sha1-03")]
+
+        self.assertEqual(result, blobrefs[4:])
+        http_session.get.assert_any_call(
+            'http://example.com/camli/enumerate-blobs?after=sha1-03'
+        )
+
+    def test_enumerate_resumable(self):
+        import os
+        import shutil
+        import tempfile
+
+        blobrefs = ["sha1-%02x" % i for i in range(7)]
+        http_session = self.make_enumerate_session(blobrefs)
+        blobs = BlobClient(http_session, 'http://example.com/')
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        checkpoint_path = os.path.join(temp_dir, 'checkpoint')
+
+        class Crash(Exception):
+            pass
+
+        enumeration = blobs.enumerate_resumable(
+            checkpoint_path=checkpoint_path,
+            checkpoint_interval=0,
+        )
+        seen = []
+        try:
+            for blob_meta in enumeration:
+                if blob_meta.blobref == "sha1-03":
+                    raise Crash()
+                seen.append(blob_meta.blobref)
+        except Crash:
+            pass
+
+        self.assertEqual(seen, blobrefs[:3])
+        self.assertEqual(enumeration.after, "sha1-02")
+        with open(checkpoint_path) as f:
+            self.assertEqual(f.read(), "sha1-02")
+
+        # A new enumeration picks up from the checkpoint
+        enumeration = blobs.enumerate_resumable(
+            checkpoint_path=checkpoint_path,
+        )
+        self.assertEqual(enumeration.after, "sha1-02")
+        seen.extend(x.blobref for x in enumeration)
+
+        self.assertEqual(seen, blobrefs)
+        self.assertEqual(enumeration.after, "sha1-06")
+
+        # The enumeration finished, so the checkpoint is gone and the next
+        # enumeration starts from the beginning.
+        self.assertFalse(os.path.exists(checkpoint_path))
+        enumeration = blobs.enumerate_resumable(
+            checkpoint_path=checkpoint_path,
+        )
+        self.assertEqual([x.blobref for x in enumeration], blobrefs)
+
     def test_get_size_multi(self):
         http_session = MagicMock()
         http_session.post = MagicMock()
@@ -292,6 +494,55 @@ class TestBlobClient(unittest.TestCase):
             }
         )
 
+    def test_get_size_multi_chunked(self):
+        import json
+
+        http_session = MagicMock()
+
+        def post(url, data):
+            response = MagicMock()
+            response.status_code = 200
+            response.content = json.dumps({
+                "stat": [
+                    {"blobRef": blobref, "size": int(blobref[5:])}
+                    for key, blobref in data.items()
+                    if key.startswith("blob") and int(blobref[5:]) % 2 == 0
+                ],
+            })
+            return response
+
+        http_session.post.side_effect = post
+
+        blobs = BlobClient(http_session, 'http://example.com/')
+        blobs.max_batch_blobs = 3
+
+        result = blobs.get_size_multi(
+            ("dummy%i" % i for i in range(10)),
+            max_workers=2,
+        )
+
+        self.assertEqual(
+            result,
+            {
+                "dummy%i" % i: (i if i % 2 == 0 else None)
+                for i in range(10)
+            }
+        )
+        self.assertEqual(
+            sorted(
+                len(call[1]["data"]) - 1
+                for call in http_session.post.call_args_list
+            ),
+            [1, 3, 3, 3],
+        )
+
+    def test_get_size_multi_empty(self):
+        http_session = MagicMock()
+        blobs = BlobClient(http_session, 'http://example.com/')
+
+        self.assertEqual(blobs.get_size_multi([]), {})
+        http_session.post.assert_not_called()
+
     def test_put_multi(self):
         http_session = MagicMock()
 
@@ -351,6 +602,216 @@ class TestBlobClient(unittest.TestCase):
             ]
         )
 
+    def test_put_multi_splits_by_size(self):
+        http_session = MagicMock()
+
+        class MockBlobClient(BlobClient):
+            get_size_multi = MagicMock()
+
+        MockBlobClient.get_size_multi.side_effect = (
+            lambda *blobrefs: {blobref: None for blobref in blobrefs}
+        )
+        response = MagicMock()
+        response.status_code = 200
+        http_session.post.return_value = response
+
+        blobs = MockBlobClient(http_session, 'http://example.com/')
+        blobs.max_upload_size = 2048
+
+        input_blobs = [Blob(bytes([i]) * 1000) for i in range(5)]
+        result = blobs.put_multi(x for x in input_blobs)
+
+        self.assertEqual(
+            result,
+            [blob.blobref for blob in input_blobs],
+        )
+        uploaded = [
+            sorted(call[1]['files'].keys())
+            for call in http_session.post.call_args_list
+        ]
+        self.assertEqual(
+            uploaded,
+            [
+                sorted(blob.blobref for blob in input_blobs[0:1]),
+                sorted(blob.blobref for blob in input_blobs[1:2]),
+                sorted(blob.blobref for blob in input_blobs[2:3]),
+                sorted(blob.blobref for blob in input_blobs[3:4]),
+                sorted(blob.blobref for blob in input_blobs[4:5]),
+            ]
+        )
+
+    def test_put_multi_splits_by_count(self):
+        http_session = MagicMock()
+
+        class MockBlobClient(BlobClient):
+            get_size_multi = MagicMock()
+
+        MockBlobClient.get_size_multi.side_effect = (
+            lambda *blobrefs: {blobref: None for blobref in blobrefs}
+        )
+        response = MagicMock()
+        response.status_code = 200
+        http_session.post.return_value = response
+
+        blobs = MockBlobClient(http_session, 'http://example.com/')
+        blobs.max_batch_blobs = 2
+
+        input_blobs = [Blob(b'dummy%i' % i) for i in range(5)]
+        result = blobs.put_multi(input_blobs)
+
+        self.assertEqual(
+            result,
+            [blob.blobref for blob in input_blobs],
+        )
+        self.assertEqual(
+            [
+                len(call[0])
+                for call in MockBlobClient.get_size_multi.call_args_list
+            ],
+            [2, 2, 1],
+        )
+        self.assertEqual(
+            [
+                len(call[1]['files'])
+                for call in http_session.post.call_args_list
+            ],
+            [2, 2, 1],
+        )
+
+    def test_put_multi_nothing_missing(self):
+        http_session = MagicMock()
+
+        class MockBlobClient(BlobClient):
+            get_size_multi = MagicMock()
+
+        MockBlobClient.get_size_multi.side_effect = (
+            lambda *blobrefs: {blobref: 6 for blobref in blobrefs}
+        )
+
+        blobs = MockBlobClient(http_session, 'http://example.com/')
+        result = blobs.put_multi(Blob(b"dummy1"), Blob(b"dummy1"))
+
+        self.assertEqual(
+            result,
+            [Blob(b"dummy1").blobref, Blob(b"dummy1").blobref],
+        )
+        http_session.post.assert_not_called()
+
+    def test_cache(self):
+        http_session = MagicMock()
+        cache = MagicMock()
+        blobref = 'sha1-7928f34bd3263b86e67d11efff30d67fe7f3d176'
+
+        blobs = BlobClient(
+            http_session, 'http://example.com/blerbs/', cache=cache,
+        )
+
+        # Cache hits never reach the server
+        cache.get.return_value = Blob(b'dummy blob')
+        cache.get_size.return_value = 10
+        self.assertEqual(blobs.get(blobref).data, b'dummy blob')
+        self.assertEqual(blobs.get_size(blobref), 10)
+        self.assertTrue(blobs.blob_exists(blobref))
+        http_session.get.assert_not_called()
+        http_session.request.assert_not_called()
+
+        # Cache misses are fetched and then cached
+        cache.get.return_value = None
+        response = MagicMock()
+        response.status_code = 200
+        response.content = b'dummy blob'
+        http_session.get.return_value = response
+
+        result = blobs.get(blobref)
+
+        self.assertEqual(result.data, b'dummy blob')
+        cache.put.assert_called_with(result)
+
+    def test_put_multi_populates_cache(self):
+        http_session = MagicMock()
+        cache = MagicMock()
+
+        class MockBlobClient(BlobClient):
+            get_size_multi = MagicMock()
+
+        existing = Blob(b'dummy1')
+        new = Blob(b'dummy2')
+        MockBlobClient.get_size_multi.return_value = {
+            existing.blobref: 6,
+            new.blobref: None,
+        }
+        response = MagicMock()
+        response.status_code = 200
+        http_session.post.return_value = response
+
+        blobs = MockBlobClient(
+            http_session, 'http://example.com/', cache=cache,
+        )
+        blobs.put_multi(existing, new)
+
+        self.assertEqual(
+            [call[0][0] for call in cache.put.call_args_list],
+            [existing, new],
+        )
+
+    def test_presence(self):
+        from perkeeppy.presence import MemoryPresenceCache
+
+        http_session = MagicMock()
+        response = MagicMock()
+        http_session.post.return_value = response
+        response.status_code = 200
+        response.content = """
+        {
+            "stat": [
+                {
+                    "blobRef": "dummy2",
+                    "size": 9
+                }
+            ]
+        }
+        """
+
+        presence = MemoryPresenceCache()
+        presence.add({"dummy1": 5})
+
+        blobs = BlobClient(
+            http_session, 'http://example.com/', presence=presence,
+        )
+        result = blobs.get_size_multi("dummy1", "dummy2", "dummy3")
+
+        http_session.post.assert_called_with(
+            "http://example.com/camli/stat",
+            data={
+                "camliversion": "1",
+                "blob1": "dummy2",
+                "blob2": "dummy3",
+            },
+        )
+        self.assertEqual(
+            result,
+            {
+                "dummy1": 5,
+                "dummy2": 9,
+                "dummy3": None,
+            }
+        )
+        self.assertIn("dummy2", presence)
+        self.assertNotIn("dummy3", presence)
+
+        # Everything known now, so no further requests
+        http_session.post.reset_mock()
+        result = blobs.get_size_multi("dummy1", "dummy2")
+        http_session.post.assert_not_called()
+
+        # Uploads are recorded too
+        blob = Blob(b"dummy3")
+        response.content = '{"stat": []}'
+        blobs.put(blob)
+        self.assertEqual(presence.get_sizes([blob.blobref]), {
+            blob.blobref: 6,
+        })
+
 
 class TestBlob(unittest.TestCase):
 
@@ -435,3 +896,84 @@ class TestBlob(unittest.TestCase):
             TypeError,
             lambda: Blob('hello', hashlib.sha1),
         )
+
+
+class TestBlobReader(unittest.TestCase):
+
+    blobref = 'sha1-7928f34bd3263b86e67d11efff30d67fe7f3d176'
+
+    def setUp(self):
+        import requests
+        self.http_session = requests.session()
+        self.blobs = BlobClient(self.http_session, 'https://example.com/')
+
+    def mock_blob(self, mock, blobref, content=b'dummy blob'):
+        mock.get('https://example.com/camli/' + blobref, content=content)
+
+    def test_get_stream(self):
+        import requests_mock
+        mock = requests_mock.Mocker()
+        self.mock_blob(mock, self.blobref)
+
+        with mock:
+            with self.blobs.get_stream(self.blobref) as reader:
+                self.assertEqual(reader.blobref, self.blobref)
+                self.assertEqual(reader.read(5), b'dummy')
+                self.assertEqual(reader.read(), b' blob')
+                self.assertEqual(reader.read(), b'')
+
+    def test_get_stream_hash_mismatch(self):
+        import requests_mock
+        from perkeeppy.exceptions import HashMismatchError
+        mock = requests_mock.Mocker()
+        self.mock_blob(mock, 'sha1-dummyblobref')
+
+        with mock:
+            reader = self.blobs.get_stream('sha1-dummyblobref')
+            self.assertEqual(reader.read(5), b'dummy')
+            self.assertRaises(HashMismatchError, reader.read)
+            reader.close()
+
+    def test_get_stream_not_found(self):
+        import requests_mock
+        from perkeeppy.exceptions import NotFoundError
+        mock = requests_mock.Mocker()
+        mock.get('https://example.com/camli/sha1-missing', status_code=404)
+
+        with mock:
+            self.assertRaises(
+                NotFoundError,
+                lambda: self.blobs.get_stream('sha1-missing'),
+            )
+
+    def test_get_into_file(self):
+        import io
+        import requests_mock
+        mock = requests_mock.Mocker()
+        self.mock_blob(mock, self.blobref)
+
+        target = io.BytesIO()
+        with mock:
+            written = self.blobs.get_into(self.blobref, target)
+
+        self.assertEqual(written, 10)
+        self.assertEqual(target.getvalue(), b'dummy blob')
+
+    def test_get_into_buffer(self):
+        import requests_mock
+        mock = requests_mock.Mocker()
+        self.mock_blob(mock, self.blobref)
+
+        target = bytearray(10)
+        with mock:
+            written = self.blobs.get_into(self.blobref, target)
+
+        self.assertEqual(written, 10)
+        self.assertEqual(target, b'dummy blob')
+
+        too_small = bytearray(4)
+        with mock:
+            self.assertRaises(
+                ValueError,
+                lambda: self.blobs.get_into(self.blobref, too_small),
+            )
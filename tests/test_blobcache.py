@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from perkeeppy.blobcache import DiskBlobCache
+from perkeeppy.blobclient import Blob
+
+
+class TestDiskBlobCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_put_get(self):
+        cache = DiskBlobCache(self.path)
+        blob = Blob(b'dummy blob')
+
+        self.assertIsNone(cache.get(blob.blobref))
+        self.assertIsNone(cache.get_size(blob.blobref))
+
+        cache.put(blob)
+
+        self.assertIn(blob.blobref, cache)
+        self.assertEqual(cache.get_size(blob.blobref), 10)
+        self.assertEqual(cache.get(blob.blobref).data, b'dummy blob')
+
+        # A new cache over the same directory sees the same blobs
+        cache = DiskBlobCache(self.path)
+        self.assertEqual(cache.get(blob.blobref).data, b'dummy blob')
+        self.assertEqual(
+            [x for x in os.listdir(self.path) if x.startswith('.tmp')],
+            [],
+        )
+
+    def test_lru_eviction(self):
+        cache = DiskBlobCache(self.path, max_size=25)
+        first = Blob(b'dummy blob 1')
+        second = Blob(b'dummy blob 2')
+        third = Blob(b'dummy blob 3')
+
+        cache.put(first)
+        cache.put(second)
+        # Touch the first blob so that the second is least recently used
+        cache.get(first.blobref)
+        cache.put(third)
+
+        self.assertIn(first.blobref, cache)
+        self.assertNotIn(second.blobref, cache)
+        self.assertIn(third.blobref, cache)
+        self.assertFalse(os.path.exists(cache._blob_path(second.blobref)))
+
+    def test_corrupt_blob_discarded(self):
+        cache = DiskBlobCache(self.path)
+        blob = Blob(b'dummy blob')
+        cache.put(blob)
+
+        with open(cache._blob_path(blob.blobref), 'wb') as f:
+            f.write(b'corrupted!')
+
+        self.assertIsNone(cache.get(blob.blobref))
+        self.assertNotIn(blob.blobref, cache)
+
+    def test_unsafe_blobref_ignored(self):
+        cache = DiskBlobCache(self.path)
+        blob = Blob(b'dummy blob')
+        blob._blobref = 'sha224-../../escape'
+
+        cache.put(blob)
+
+        self.assertNotIn(blob.blobref, cache)
@@ -0,0 +1,100 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from perkeeppy.concurrency import bounded_map, interleave
+
+
+class TestBoundedMap(unittest.TestCase):
+
+    def test_ordered(self):
+        results = bounded_map(
+            lambda x: x * 2, iter(range(20)), max_workers=3,
+        )
+        self.assertEqual(
+            [(item, future.result()) for item, future in results],
+            [(x, x * 2) for x in range(20)],
+        )
+
+    def test_unordered(self):
+        results = bounded_map(
+            lambda x: x * 2, range(20), max_workers=3, ordered=False,
+        )
+        self.assertEqual(
+            sorted((item, future.result()) for item, future in results),
+            [(x, x * 2) for x in range(20)],
+        )
+
+    def test_exceptions(self):
+        def func(x):
+            if x == 1:
+                raise ValueError('dummy')
+            return x
+
+        results = list(bounded_map(func, [0, 1, 2], max_workers=2))
+
+        self.assertEqual(results[0][1].result(), 0)
+        self.assertRaises(ValueError, results[1][1].result)
+        self.assertEqual(results[2][1].result(), 2)
+
+    def test_reads_ahead_lazily(self):
+        consumed = []
+        lock = threading.Lock()
+
+        def items():
+            for x in range(1000):
+                with lock:
+                    consumed.append(x)
+                yield x
+
+        results = bounded_map(lambda x: x, items(), max_workers=2)
+        next(results)
+        results.close()
+
+        self.assertLess(len(consumed), 10)
+
+    def test_executor(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = bounded_map(
+                lambda x: x * 2, range(5), max_workers=2, executor=executor,
+            )
+            self.assertEqual(
+                [(item, future.result()) for (item, future) in results],
+                [(x, x * 2) for x in range(5)],
+            )
+
+            # The executor is still usable afterwards
+            self.assertEqual(executor.submit(lambda: 1).result(), 1)
+
+
+class TestInterleave(unittest.TestCase):
+
+    def test_ordered(self):
+        funcs = [
+            (lambda start: lambda: iter(range(start, start + 10)))(start)
+            for start in range(0, 50, 10)
+        ]
+        self.assertEqual(
+            list(interleave(funcs, max_workers=2)),
+            list(range(50)),
+        )
+
+    def test_unordered(self):
+        funcs = [
+            (lambda start: lambda: iter(range(start, start + 10)))(start)
+            for start in range(0, 50, 10)
+        ]
+        self.assertEqual(
+            sorted(interleave(funcs, max_workers=2, ordered=False)),
+            list(range(50)),
+        )
+
+    def test_error(self):
+        def broken():
+            yield 1
+            raise ValueError('dummy')
+
+        self.assertRaises(
+            ValueError,
+            lambda: list(interleave([broken], max_workers=1)),
+        )
@@ -22,3 +22,12 @@ class TestConnection(unittest.TestCase):
             blob_client.http_session,
             http_session,
         )
+
+    def test_signer(self):
+        signer = MagicMock()
+        conn = Connection(
+            http_session=MagicMock(),
+            sign_root='dummy',
+            signer=signer,
+        )
+        self.assertIs(conn.signer, signer)
@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import patch
+
+from perkeeppy.descriptioncache import DescriptionCache
+
+
+class TestDescriptionCache(unittest.TestCase):
+
+    def test_add_get(self):
+        cache = DescriptionCache()
+        raw = {'blobRef': 'dummy1', 'camliType': 'permanode'}
+        pool = {'dummy1': raw}
+
+        self.assertEqual(cache.get_description('dummy1'), None)
+        cache.add_description('dummy1', raw, pool)
+        cache.add_claims('dummy1', ['claim'])
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get_description('dummy1'), (raw, pool))
+        self.assertEqual(cache.get_claims('dummy1'), ['claim'])
+        self.assertEqual(cache.get_claims('dummy2'), None)
+
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.misses, 2)
+
+    @patch('perkeeppy.descriptioncache.time.monotonic')
+    def test_expiry(self, monotonic):
+        cache = DescriptionCache(ttl=10.0)
+        monotonic.return_value = 100.0
+
+        permanode = {'blobRef': 'dummy1', 'camliType': 'permanode'}
+        file = {'blobRef': 'dummy2', 'camliType': 'file'}
+        cache.add_description('dummy1', permanode, {})
+        cache.add_description('dummy2', file, {})
+        cache.add_claims('dummy1', [])
+
+        monotonic.return_value = 109.0
+        self.assertEqual(cache.get_description('dummy1'), (permanode, {}))
+        self.assertEqual(cache.get_claims('dummy1'), [])
+
+        # Only the immutable file's description outlives the TTL.
+        monotonic.return_value = 110.0
+        self.assertEqual(cache.get_description('dummy1'), None)
+        self.assertEqual(cache.get_claims('dummy1'), None)
+        self.assertEqual(cache.get_description('dummy2'), (file, {}))
+        self.assertEqual(len(cache), 1)
+
+    @patch('perkeeppy.descriptioncache.time.monotonic')
+    def test_expiry_of_related(self, monotonic):
+        cache = DescriptionCache(ttl=10.0)
+        monotonic.return_value = 100.0
+
+        directory = {'blobRef': 'dummy1', 'camliType': 'directory'}
+        pool = {
+            'dummy1': directory,
+            'dummy2': {'blobRef': 'dummy2', 'camliType': 'permanode'},
+        }
+        cache.add_description('dummy1', directory, pool)
+
+        # The directory itself is immutable, but the permanode described
+        # along with it isn't.
+        monotonic.return_value = 110.0
+        self.assertEqual(cache.get_description('dummy1'), None)
+
+    def test_eviction(self):
+        cache = DescriptionCache(max_entries=2)
+
+        for blobref in ('dummy1', 'dummy2'):
+            cache.add_description(blobref, {'camliType': 'file'}, {})
+        # Using dummy1 makes dummy2 the least recently used.
+        cache.get_description('dummy1')
+        cache.add_description('dummy3', {'camliType': 'file'}, {})
+
+        self.assertEqual(len(cache), 2)
+        self.assertNotEqual(cache.get_description('dummy1'), None)
+        self.assertEqual(cache.get_description('dummy2'), None)
+        self.assertNotEqual(cache.get_description('dummy3'), None)
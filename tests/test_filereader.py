@@ -0,0 +1,168 @@
+import io
+import json
+import random
+import time
+import unittest
+
+from perkeeppy.blobclient import BlobClient, Blob
+from perkeeppy.exceptions import NotFoundError
+from perkeeppy.filereader import FileReader
+from perkeeppy.filewriter import FileWriter
+from perkeeppy.schema import SchemaObject
+
+
+class MockBlobClient(BlobClient):
+    """
+    A blob client that serves blobs from a dict rather than a server.
+    """
+
+    def __init__(self):
+        self.blobs = {}
+        self.gets = []
+
+    def get(self, blobref):
+        self.gets.append(blobref)
+        try:
+            return self.blobs[blobref]
+        except KeyError:
+            raise NotFoundError(blobref)
+
+    def put(self, blob):
+        self.blobs[blob.blobref] = blob
+        return blob.blobref
+
+    def put_multi(self, blobs):
+        return [self.put(blob) for blob in blobs]
+
+    def put_schema(self, camli_type, parts):
+        return self.put(
+            SchemaObject(camli_type, data={'parts': parts}).to_blob()
+        )
+
+
+class TestFileReader(unittest.TestCase):
+
+    def setUp(self):
+        self.blob_client = MockBlobClient()
+
+    def test_read_written_file(self):
+        data = random.Random(0).randbytes(1024 * 1024)
+        fileref = FileWriter(self.blob_client).upload_file(
+            'afile', io.BytesIO(data),
+        )
+
+        with FileReader(self.blob_client, fileref, max_workers=2) as f:
+            self.assertEqual(f.size, len(data))
+            self.assertEqual(f.read(), data)
+
+            f.seek(500000)
+            self.assertEqual(f.read(100000), data[500000:600000])
+
+            target = io.BytesIO()
+            f.seek(-1000, io.SEEK_END)
+            self.assertEqual(f.copy_to(target), 1000)
+            self.assertEqual(target.getvalue(), data[-1000:])
+
+    def test_nested_parts(self):
+        a = self.blob_client.put(Blob(b'0123456789'))
+        b = self.blob_client.put(Blob(b'abcdefghij'))
+        inner = self.blob_client.put_schema('bytes', [
+            {'blobRef': a, 'size': 10},
+            {'blobRef': b, 'size': 10},
+        ])
+        fileref = self.blob_client.put_schema('file', [
+            {'blobRef': b, 'size': 3, 'offset': 2},
+            {'bytesRef': inner, 'size': 12, 'offset': 5},
+            {'size': 4},
+            {'blobRef': a, 'size': 2},
+        ])
+        expected = b'cde' + b'56789abcdefg' + bytes(4) + b'01'
+
+        f = FileReader(self.blob_client, fileref)
+        self.assertEqual(f.size, len(expected))
+        self.assertEqual(f.read(), expected)
+
+        for offset in range(len(expected)):
+            for size in (1, 3, 7, 100):
+                self.assertEqual(
+                    f.read_range(offset, size),
+                    expected[offset:offset + size],
+                )
+        self.assertEqual(f.tell(), len(expected))
+        self.assertEqual(f.read(), b'')
+
+    def test_range_read_fetches_covering_parts(self):
+        chunks = [
+            self.blob_client.put(Blob(bytes([i]) * 100)) for i in range(20)
+        ]
+        fileref = self.blob_client.put_schema('file', [
+            {'blobRef': blobref, 'size': 100} for blobref in chunks
+        ])
+
+        f = FileReader(self.blob_client, fileref, max_workers=2)
+        self.blob_client.gets = []
+
+        self.assertEqual(f.read_range(1050, 100), b'\x0a' * 50 + b'\x0b' * 50)
+        f.close()
+
+        # Only the covering chunks and the next few were fetched
+        self.assertIn(chunks[10], self.blob_client.gets)
+        self.assertIn(chunks[11], self.blob_client.gets)
+        self.assertLessEqual(len(set(self.blob_client.gets)), 4)
+        self.assertNotIn(chunks[0], self.blob_client.gets)
+
+    def test_prefetch_used_by_read(self):
+        chunks = [
+            self.blob_client.put(Blob(bytes([i]) * 100)) for i in range(20)
+        ]
+        fileref = self.blob_client.put_schema('file', [
+            {'blobRef': blobref, 'size': 100} for blobref in chunks
+        ])
+
+        original_get = self.blob_client.get
+
+        def slow_get(blobref):
+            time.sleep(0.01)
+            return original_get(blobref)
+
+        self.blob_client.get = slow_get
+
+        with FileReader(self.blob_client, fileref, max_workers=4) as f:
+            self.blob_client.gets = []
+            for i in range(20):
+                self.assertEqual(f.read(100), bytes([i]) * 100)
+
+        # Each chunk was fetched once, with reads waiting for the prefetch
+        # already in progress rather than fetching the chunk again.
+        self.assertEqual(sorted(self.blob_client.gets), sorted(chunks))
+
+    def test_cache(self):
+        chunk = self.blob_client.put(Blob(b'x' * 100))
+        fileref = self.blob_client.put_schema('file', [
+            {'blobRef': chunk, 'size': 100},
+        ])
+
+        f = FileReader(self.blob_client, fileref)
+        self.blob_client.gets = []
+        for _ in range(3):
+            f.seek(0)
+            self.assertEqual(f.read(), b'x' * 100)
+
+        self.assertEqual(self.blob_client.gets, [chunk])
+
+    def test_not_a_file(self):
+        blobref = self.blob_client.put(
+            Blob(json.dumps({'camliType': 'permanode'}).encode('utf8'))
+        )
+
+        with self.assertRaises(ValueError):
+            FileReader(self.blob_client, blobref)
+
+    def test_missing_chunk(self):
+        fileref = self.blob_client.put_schema('file', [
+            {'blobRef': 'sha224-missing', 'size': 100},
+        ])
+
+        f = FileReader(self.blob_client, fileref)
+        with self.assertRaises(NotFoundError):
+            f.read()
@@ -0,0 +1,140 @@
+import io
+import json
+import random
+import unittest
+
+from perkeeppy.blobclient import BlobClient
+from perkeeppy.filewriter import (
+    FileWriter,
+    split_chunks,
+    FIRST_CHUNK_SIZE,
+    MAX_BLOB_SIZE,
+    TOO_SMALL_THRESHOLD,
+)
+
+
+class MockBlobClient(BlobClient):
+    """
+    A blob client that stores blobs in a dict rather than on a server.
+    """
+
+    def __init__(self):
+        self.blobs = {}
+        self.uploaded = []
+
+    def put_multi(self, blobs):
+        blobrefs = []
+        for blob in blobs:
+            if blob.blobref not in self.blobs:
+                self.blobs[blob.blobref] = blob
+                self.uploaded.append(blob.blobref)
+            blobrefs.append(blob.blobref)
+        return blobrefs
+
+
+class TestFileWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.blob_client = MockBlobClient()
+        self.writer = FileWriter(self.blob_client)
+
+    def read_parts(self, parts):
+        data = b''
+        for part in parts:
+            if 'blobRef' in part:
+                part_data = self.blob_client.blobs[part['blobRef']].data
+            else:
+                bytes_data = self.load_schema(part['bytesRef'])
+                self.assertEqual(bytes_data['camliType'], 'bytes')
+                part_data = self.read_parts(bytes_data['parts'])
+            self.assertEqual(len(part_data), part['size'])
+            data += part_data
+        return data
+
+    def load_schema(self, blobref):
+        return json.loads(self.blob_client.blobs[blobref].data.decode())
+
+    def test_split_chunks(self):
+        data = random.Random(0).randbytes(MAX_BLOB_SIZE)
+        chunks = list(split_chunks(io.BytesIO(data)))
+
+        self.assertEqual(b''.join(chunk for (chunk, _) in chunks), data)
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(
+            (len(chunks[0][0]), chunks[0][1]),
+            (FIRST_CHUNK_SIZE, 18),
+        )
+        for (chunk, bits) in chunks[1:-1]:
+            self.assertGreater(len(chunk), TOO_SMALL_THRESHOLD)
+            self.assertGreaterEqual(bits, 13)
+        self.assertEqual(chunks[-1][1], 0)
+
+    def test_split_chunks_max_size(self):
+        # A run of zeroes never produces a boundary
+        data = bytes(MAX_BLOB_SIZE * 2 + 10)
+        chunks = list(split_chunks(io.BytesIO(data)))
+
+        self.assertEqual(
+            [(len(chunk), bits) for (chunk, bits) in chunks],
+            [
+                (FIRST_CHUNK_SIZE, 18),
+                (MAX_BLOB_SIZE, 20),
+                (MAX_BLOB_SIZE - FIRST_CHUNK_SIZE + 10, 0),
+            ],
+        )
+
+    def test_split_chunks_small_file(self):
+        data = random.Random(0).randbytes(FIRST_CHUNK_SIZE)
+
+        # No checksum boundaries are used within the first chunk
+        for size in (1000, FIRST_CHUNK_SIZE - 1, FIRST_CHUNK_SIZE):
+            chunks = list(split_chunks(io.BytesIO(data[:size])))
+            self.assertEqual(
+                [(len(chunk), bits) for (chunk, bits) in chunks],
+                [(size, 18 if size == FIRST_CHUNK_SIZE else 0)],
+            )
+
+    def test_upload_file(self):
+        data = random.Random(0).randbytes(MAX_BLOB_SIZE)
+        fileref = self.writer.upload_file(
+            'afile', io.BytesIO(data), '2010-01-02T10:20:30Z',
+        )
+
+        file_data = self.load_schema(fileref)
+        self.assertEqual(file_data['camliType'], 'file')
+        self.assertEqual(file_data['fileName'], 'afile')
+        self.assertEqual(file_data['unixMtime'], '2010-01-02T10:20:30Z')
+        self.assertEqual(self.read_parts(file_data['parts']), data)
+
+        # The file schema is written after everything it refers to
+        self.assertEqual(self.blob_client.uploaded[-1], fileref)
+
+    def test_upload_empty_file(self):
+        fileref = self.writer.upload_file('empty', io.BytesIO(b''))
+
+        file_data = self.load_schema(fileref)
+        self.assertEqual(file_data['parts'], [])
+        self.assertNotIn('unixMtime', file_data)
+
+    def test_upload_changed_file(self):
+        data = random.Random(0).randbytes(MAX_BLOB_SIZE)
+        self.writer.upload_file('afile', io.BytesIO(data))
+        first_upload = len(self.blob_client.uploaded)
+
+        # Inserting data after the first chunk only changes the chunks
+        # nearby
+        changed = data[:600000] + b'inserted' + data[600000:]
+        fileref = self.writer.upload_file('afile', io.BytesIO(changed))
+
+        file_data = self.load_schema(fileref)
+        self.assertEqual(self.read_parts(file_data['parts']), changed)
+
+        new_chunks = [
+            blobref for blobref in self.blob_client.uploaded[first_upload:]
+            if not self.blob_client.blobs[blobref].data.startswith(b'{')
+        ]
+        self.assertEqual(len(new_chunks), 1)
+
+    def test_invalid_filename(self):
+        with self.assertRaises(ValueError):
+            self.writer.upload_file('', io.BytesIO(b''))
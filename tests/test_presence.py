@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from perkeeppy.presence import MemoryPresenceCache, SqlitePresenceCache
+
+
+class PresenceCacheTests(object):
+
+    def test_add_get(self):
+        cache = self.make_cache()
+        self.assertEqual(len(cache), 0)
+
+        cache.add({'dummy1': 5, 'dummy2': 9})
+
+        self.assertEqual(len(cache), 2)
+        self.assertIn('dummy1', cache)
+        self.assertNotIn('dummy3', cache)
+        self.assertEqual(
+            cache.get_sizes(['dummy1', 'dummy3', 'dummy2']),
+            {'dummy1': 5, 'dummy2': 9},
+        )
+
+    def test_many(self):
+        cache = self.make_cache()
+        cache.add({'dummy%i' % i: i for i in range(2000)})
+
+        result = cache.get_sizes('dummy%i' % i for i in range(0, 3000, 2))
+
+        self.assertEqual(
+            result,
+            {'dummy%i' % i: i for i in range(0, 2000, 2)},
+        )
+
+
+class TestMemoryPresenceCache(PresenceCacheTests, unittest.TestCase):
+
+    def make_cache(self):
+        return MemoryPresenceCache()
+
+
+class TestSqlitePresenceCache(PresenceCacheTests, unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.path)
+
+    def make_cache(self):
+        cache = SqlitePresenceCache(os.path.join(self.path, 'presence.db'))
+        self.caches.append(cache)
+        return cache
+
+    def test_persistent(self):
+        self.make_cache().add({'dummy1': 5})
+
+        self.assertEqual(self.make_cache().get_sizes(['dummy1']), {
+            'dummy1': 5,
+        })
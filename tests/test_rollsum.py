@@ -0,0 +1,50 @@
+import random
+import unittest
+
+from perkeeppy.rollsum import RollSum, BLOB_BITS
+
+
+class TestRollSum(unittest.TestCase):
+
+    def setUp(self):
+        self.data = random.Random(0).randbytes(64 * 1024)
+
+    def test_roll_bytes_matches_roll(self):
+        one = RollSum()
+        for ch in self.data[:1000]:
+            one.roll(ch)
+
+        many = RollSum()
+        many.roll_bytes(self.data, 0, 1000)
+
+        self.assertEqual(one.digest(), many.digest())
+
+    def test_roll_until_split(self):
+        expected = None
+        rollsum = RollSum()
+        for i, ch in enumerate(self.data):
+            rollsum.roll(ch)
+            if rollsum.on_split():
+                expected = i + 1
+                break
+        self.assertIsNotNone(expected)
+
+        rollsum = RollSum()
+        split = rollsum.roll_until_split(self.data, 0, len(self.data))
+        self.assertEqual(split, expected)
+        self.assertTrue(rollsum.on_split())
+        self.assertGreaterEqual(rollsum.bits(), BLOB_BITS)
+
+        # Stopping before the boundary finds nothing
+        rollsum = RollSum()
+        self.assertIsNone(rollsum.roll_until_split(self.data, 0, split - 1))
+
+    def test_window(self):
+        # The checksum only depends on the most recent bytes, so
+        # different prefixes converge once the window has passed them.
+        a = RollSum()
+        a.roll_bytes(b'a' * 100 + self.data, 0, 100 + 1000)
+        b = RollSum()
+        b.roll_bytes(b'b' * 200 + self.data, 0, 200 + 1000)
+
+        self.assertEqual(a.digest(), b.digest())
@@ -1,10 +1,19 @@
+import copy
+import pickle
 import unittest
 import json
 from datetime import datetime, timezone, timedelta
 
 from unittest import mock
 
-from perkeeppy.schema import SchemaObject, make_permanode, make_claim
+from perkeeppy.schema import (
+    SchemaObject,
+    make_claim,
+    make_permanode,
+    put_permanodes,
+    put_schema_objects,
+    to_blob_multi,
+)
 from perkeeppy.exceptions import SigningError
 
 
@@ -38,6 +47,111 @@ class TestSchemaObject(unittest.TestCase):
 
         self.assertEqual(blob.data, b'TESTPASSED')
 
+    def test_blob_cache(self):
+        schema_obj = SchemaObject('test', data={'hello': 'test'})
+
+        with mock.patch('perkeeppy.schema.json.dumps',
+                        wraps=json.dumps) as dumps:
+            first = schema_obj.to_blob()
+            second = schema_obj.to_blob()
+            self.assertEqual(dumps.call_count, 1)
+
+            self.assertEqual(first.blobref, second.blobref)
+            self.assertIsNot(first, second)
+
+            schema_obj.data['hello'] = 'changed'
+            third = schema_obj.to_blob()
+            self.assertEqual(dumps.call_count, 2)
+            self.assertEqual(json.loads(third.data)['hello'], 'changed')
+
+            del schema_obj.data['hello']
+            schema_obj.data.update(other='value')
+            schema_obj.to_blob()
+            self.assertEqual(dumps.call_count, 3)
+
+            schema_obj.data = {'camliType': 'replaced'}
+            self.assertEqual(
+                json.loads(schema_obj.to_blob().data),
+                {'camliType': 'replaced'},
+            )
+
+    def test_blob_cache_unchanged(self):
+        schema_obj = SchemaObject('test', data={'hello': 'test', 'n': 1})
+
+        with mock.patch('perkeeppy.schema.json.dumps',
+                        wraps=json.dumps) as dumps:
+            schema_obj.to_blob()
+
+            schema_obj.data['hello'] = 'test'
+            schema_obj.data.update(n=1)
+            schema_obj.data.setdefault('hello', 'other')
+            schema_obj.data.pop('missing', None)
+            schema_obj.data = dict(schema_obj.data)
+            schema_obj.to_blob()
+            self.assertEqual(dumps.call_count, 1)
+
+            # Equal in Python, but not once serialized
+            schema_obj.data['n'] = True
+            self.assertEqual(json.loads(schema_obj.to_blob().data)['n'], True)
+            self.assertEqual(dumps.call_count, 2)
+
+            schema_obj.data = {
+                'n': True,
+                'camliVersion': 1,
+                'camliType': 'test',
+                'hello': 'test',
+            }
+            schema_obj.to_blob()
+            self.assertEqual(dumps.call_count, 3)
+
+    def test_blob_cache_copies(self):
+        def data_of(schema_obj):
+            return json.loads(schema_obj.to_blob().data)
+
+        original = SchemaObject('test', data={'k': 1})
+        original.to_blob()
+
+        restored = pickle.loads(pickle.dumps(original))
+        self.assertEqual(data_of(restored), data_of(original))
+        restored.data['k'] = 2
+        self.assertEqual(data_of(restored)['k'], 2)
+        self.assertEqual(data_of(original)['k'], 1)
+
+        deep = copy.deepcopy(original)
+        deep.data['k'] = 3
+        self.assertEqual(data_of(deep)['k'], 3)
+        self.assertEqual(data_of(original)['k'], 1)
+
+        # A shallow copy shares its data with the original, and both see
+        # changes to it.
+        shallow = copy.copy(original)
+        shallow.data['k'] = 4
+        self.assertEqual(data_of(shallow)['k'], 4)
+        self.assertEqual(data_of(original)['k'], 4)
+
+    def test_signed_blob_cache(self):
+        schema_obj = SchemaObject('test', needs_signing=True)
+
+        signer = mock.MagicMock()
+        signer.sign_dict = mock.MagicMock(
+            side_effect=lambda data: data.update(camliSigner='x') or b'A')
+
+        self.assertEqual(schema_obj.to_blob(signer).data, b'A')
+        self.assertEqual(schema_obj.to_blob(signer).data, b'A')
+        self.assertEqual(signer.sign_dict.call_count, 1)
+
+        # Another signer signs again
+        other_signer = mock.MagicMock()
+        other_signer.sign_dict = mock.MagicMock(return_value=b'B')
+        self.assertEqual(schema_obj.to_blob(other_signer).data, b'B')
+
+        schema_obj.needs_signing = False
+        self.assertEqual(json.loads(schema_obj.to_blob().data), {
+            'camliType': 'test',
+            'camliVersion': 1,
+            'camliSigner': 'x',
+        })
+
     def test_signed_exception(self):
         schema_obj = SchemaObject('test', needs_signing=True)
 
@@ -95,3 +209,87 @@ class TestPermanode(unittest.TestCase):
 
         date_received = mocked.call_args[1]['data']['claimDate']
         self.assertEqual(date_received, desired.isoformat())
+
+
+class TestBulkSigning(unittest.TestCase):
+    def setUp(self):
+        self.signer = mock.MagicMock()
+        self.signer.sign_dict = lambda data: json.dumps(
+            dict(data, camliSig='SIGNED')
+        ).encode('utf8')
+
+    def test_to_blob_multi(self):
+        objects = (
+            make_claim('sha224-aaaa', 'tag', 'add', str(i), date='dummy')
+            for i in range(20)
+        )
+
+        blobs = list(to_blob_multi(objects, signer=self.signer,
+                                   max_workers=4))
+
+        self.assertEqual(
+            [json.loads(blob.data)['value'] for blob in blobs],
+            [str(i) for i in range(20)],
+        )
+        for blob in blobs:
+            self.assertEqual(json.loads(blob.data)['camliSig'], 'SIGNED')
+
+    def test_to_blob_multi_error(self):
+        objects = [SchemaObject('test', needs_signing=True)]
+
+        with self.assertRaises(SigningError):
+            list(to_blob_multi(objects))
+
+    def test_put_schema_objects(self):
+        blob_client = mock.MagicMock()
+        blob_client.put_multi = lambda blobs: [blob.blobref for blob in blobs]
+
+        objects = [SchemaObject('test', data={'i': i}) for i in range(5)]
+        blobrefs = put_schema_objects(blob_client, objects, self.signer)
+
+        self.assertEqual(
+            blobrefs,
+            [schema_obj.to_blob().blobref for schema_obj in objects],
+        )
+
+    def test_put_permanodes(self):
+        uploaded = []
+        blob_client = mock.MagicMock()
+        blob_client.put_multi = lambda blobs: uploaded.extend(blobs)
+
+        records = [
+            {'title': 'First', 'tag': ['a', 'b']},
+            {},
+            {'title': 'Third'},
+        ]
+        start = datetime(2018, 1, 2, 3, 4, 5)
+        permanode_refs = put_permanodes(
+            blob_client, iter(records), self.signer,
+            max_workers=2, claim_date=start,
+        )
+
+        data = [json.loads(blob.data) for blob in uploaded]
+        self.assertEqual(
+            [blob.blobref for blob in uploaded if
+             json.loads(blob.data)['camliType'] == 'permanode'],
+            permanode_refs,
+        )
+        self.assertEqual(len(permanode_refs), 3)
+
+        claims = [
+            (d['permaNode'], d['claimType'], d['attribute'], d['value'])
+            for d in data if d['camliType'] == 'claim'
+        ]
+        self.assertEqual(claims, [
+            (permanode_refs[0], 'set-attribute', 'title', 'First'),
+            (permanode_refs[0], 'add-attribute', 'tag', 'a'),
+            (permanode_refs[0], 'add-attribute', 'tag', 'b'),
+            (permanode_refs[2], 'set-attribute', 'title', 'Third'),
+        ])
+
+        dates = [d['claimDate'] for d in data if d['camliType'] == 'claim']
+        self.assertEqual(dates[0], '2018-01-02T03:04:05+00:00')
+        self.assertEqual(dates[3], '2018-01-02T03:04:05.000003+00:00')
+        self.assertEqual(dates, sorted(dates))
+        for d in data:
+            self.assertEqual(d['camliSig'], 'SIGNED')
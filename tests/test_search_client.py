@@ -1,7 +1,9 @@
 
+import json
 import unittest
 from unittest.mock import MagicMock
 
+from perkeeppy.descriptioncache import DescriptionCache
 from perkeeppy.searchclient import (
     SearchClient,
     ClaimMeta,
@@ -38,7 +40,7 @@ class TestSearchClient(unittest.TestCase):
             base_url="http://example.com/s/",
         )
 
-        results = searcher.query('dummyquery')
+        results = list(searcher.query('dummyquery'))
 
         http_session.post.assert_called_with(
             'http://example.com/s/camli/search/query',
@@ -80,7 +82,9 @@ class TestSearchClient(unittest.TestCase):
             base_url="http://example.com/s/",
         )
 
-        results = searcher.query(dict(constraint=dict(file=dict())))
+        results = list(
+            searcher.query(dict(constraint=dict(file=dict())))
+        )
 
         http_session.post.assert_called_with(
             'http://example.com/s/camli/search/query',
@@ -96,6 +100,148 @@ class TestSearchClient(unittest.TestCase):
             ["dummy-1", "dummy-2"],
         )
 
+    def test_query_pages(self):
+        http_session = MagicMock()
+
+        def make_response(content):
+            response = MagicMock()
+            response.status_code = 200
+            response.content = content
+            return response
+
+        searcher = SearchClient(
+            http_session=http_session,
+            base_url="http://example.com/s/",
+        )
+
+        for prefetch in (True, False):
+            http_session.post.reset_mock()
+            http_session.post.side_effect = [
+                make_response("""
+                {
+                    "blobs": [{"blob": "dummy-1"}, {"blob": "dummy-2"}],
+                    "continue": "pn:2"
+                }
+                """),
+                make_response("""
+                {
+                    "blobs": [{"blob": "dummy-3"}]
+                }
+                """),
+            ]
+
+            results = searcher.query(
+                'dummyquery', page_size=2, prefetch=prefetch,
+            )
+
+            # Nothing is requested until the results are consumed.
+            self.assertEqual(http_session.post.call_count, 0)
+
+            self.assertEqual(
+                [result.blobref for result in results],
+                ["dummy-1", "dummy-2", "dummy-3"],
+            )
+            self.assertEqual(
+                [c[1]["data"] for c in http_session.post.call_args_list],
+                [
+                    '{"expression": "dummyquery", "limit": 2}',
+                    '{"expression": "dummyquery", "limit": 2, '
+                    '"continue": "pn:2"}',
+                ],
+            )
+
+    def test_query_limit(self):
+        http_session = MagicMock()
+
+        response = MagicMock()
+        http_session.post.return_value = response
+
+        response.status_code = 200
+        response.content = """
+        {
+            "blobs": [{"blob": "dummy-1"}, {"blob": "dummy-2"}],
+            "continue": "pn:2"
+        }
+        """
+
+        searcher = SearchClient(
+            http_session=http_session,
+            base_url="http://example.com/s/",
+        )
+
+        for prefetch in (True, False):
+            http_session.post.reset_mock()
+            results = list(
+                searcher.query('dummyquery', limit=2, prefetch=prefetch)
+            )
+
+            self.assertEqual(
+                [result.blobref for result in results],
+                ["dummy-1", "dummy-2"],
+            )
+            # The limit was reached on the first page, so the next page is
+            # never requested, even in the background.
+            self.assertEqual(http_session.post.call_count, 1)
+
+    def test_query_describe(self):
+        http_session = MagicMock()
+
+        response = MagicMock()
+        http_session.post.return_value = response
+
+        response.status_code = 200
+        response.content = """
+        {
+            "blobs": [{"blob": "dummy-1"}, {"blob": "dummy-2"}],
+            "description": {
+                "meta": {
+                    "dummy-1": {
+                        "blobRef": "dummy-1",
+                        "camliType": "permanode"
+                    },
+                    "dummy-2": {
+                        "blobRef": "dummy-2",
+                        "camliType": "permanode"
+                    },
+                    "dummy-file": {
+                        "blobRef": "dummy-file",
+                        "camliType": "file"
+                    }
+                }
+            }
+        }
+        """
+
+        searcher = SearchClient(
+            http_session=http_session,
+            base_url="http://example.com/s/",
+        )
+
+        results = list(searcher.query('dummyquery', describe={"depth": 2}))
+
+        http_session.post.assert_called_with(
+            'http://example.com/s/camli/search/query',
+            data='{"expression": "dummyquery", "describe": {"depth": 2}}',
+        )
+
+        self.assertEqual(
+            [result.description.blobref for result in results],
+            ["dummy-1", "dummy-2"],
+        )
+        self.assertEqual(
+            [result.description.type for result in results],
+            ["permanode", "permanode"],
+        )
+        self.assertIs(
+            results[0].description.other_raw_dicts,
+            results[1].description.other_raw_dicts,
+        )
+
+        # Related blobs described for the page don't need another request.
+        other = results[1].description.describe_another("dummy-file")
+        self.assertEqual(other.type, "file")
+        self.assertEqual(http_session.get.call_count, 0)
+
     def test_describe_blob(self):
         http_session = MagicMock()
         http_session.get = MagicMock()
@@ -154,6 +300,131 @@ class TestSearchClient(unittest.TestCase):
             }
         )
 
+    def test_describe_many(self):
+        http_session = MagicMock()
+
+        def post(url, data):
+            self.assertEqual(url, 'http://example.com/s/camli/search/describe')
+            blobrefs = json.loads(data)["blobrefs"]
+            meta = {
+                blobref: {"blobRef": blobref, "camliType": "permanode"}
+                for blobref in blobrefs
+                if blobref != "unknown"
+            }
+            # Each permanode's content is described along with it.
+            meta["content-" + blobrefs[0]] = {
+                "blobRef": "content-" + blobrefs[0],
+                "camliType": "file",
+            }
+            response = MagicMock()
+            response.status_code = 200
+            response.content = json.dumps({"meta": meta})
+            return response
+
+        http_session.post.side_effect = post
+
+        searcher = SearchClient(
+            http_session=http_session,
+            base_url="http://example.com/s/",
+        )
+
+        descrs = searcher.describe_many(
+            ["dummy-1", "dummy-2", "dummy-1", "unknown", "dummy-3"],
+            batch_size=2,
+        )
+
+        self.assertEqual(http_session.post.call_count, 2)
+        self.assertEqual(
+            sorted(descrs.keys()),
+            ["dummy-1", "dummy-2", "dummy-3"],
+        )
+        self.assertEqual(descrs["dummy-2"].blobref, "dummy-2")
+        self.assertEqual(descrs["dummy-2"].type, "permanode")
+
+        # Descriptions from one batch are visible from another.
+        other = descrs["dummy-1"].describe_another("content-unknown")
+        self.assertEqual(other.type, "file")
+        self.assertEqual(http_session.get.call_count, 0)
+
+    def test_describe_cached(self):
+        http_session = MagicMock()
+
+        def get(url, params):
+            blobref = params.get("blobref") or params.get("permanode")
+            response = MagicMock()
+            response.status_code = 200
+            response.content = json.dumps({
+                "meta": {
+                    blobref: {"blobRef": blobref, "camliType": "permanode"},
+                },
+                "claims": [{"type": "set-attribute", "permanode": blobref}],
+            })
+            return response
+
+        http_session.get.side_effect = get
+
+        cache = DescriptionCache()
+        searcher = SearchClient(
+            http_session=http_session,
+            base_url="http://example.com/s/",
+            cache=cache,
+        )
+
+        for _ in range(3):
+            descr = searcher.describe_blob("dummy-1")
+            self.assertEqual(descr.blobref, "dummy-1")
+            claims = searcher.get_claims_for_permanode("dummy-1")
+            self.assertEqual(claims[0].permanode_blobref, "dummy-1")
+
+        self.assertEqual(http_session.get.call_count, 2)
+        self.assertEqual(cache.hits, 4)
+        self.assertEqual(cache.misses, 2)
+
+        # describe_many only asks the server about blobs not in the cache.
+        http_session.post.return_value.status_code = 200
+        http_session.post.return_value.content = json.dumps({
+            "meta": {"dummy-2": {"blobRef": "dummy-2"}},
+        })
+
+        descrs = searcher.describe_many(["dummy-1", "dummy-2"])
+
+        self.assertEqual(sorted(descrs.keys()), ["dummy-1", "dummy-2"])
+        http_session.post.assert_called_once_with(
+            'http://example.com/s/camli/search/describe',
+            data='{"blobrefs": ["dummy-2"]}',
+        )
+
+    def test_describe_many_cached_pools(self):
+        http_session = MagicMock()
+        http_session.post.return_value.status_code = 200
+        http_session.post.return_value.content = json.dumps({
+            "meta": {
+                "file-1": {"blobRef": "file-1", "camliType": "file"},
+                "perm-1": {
+                    "blobRef": "perm-1",
+                    "camliType": "permanode",
+                    "permanode": {"attr": {"camliContent": ["file-2"]}},
+                },
+                "file-2": {"blobRef": "file-2", "camliType": "file"},
+            },
+        })
+
+        cache = DescriptionCache()
+        searcher = SearchClient(
+            http_session=http_session,
+            base_url="http://example.com/s/",
+            cache=cache,
+        )
+
+        searcher.describe_many(["file-1", "perm-1"])
+
+        # Each blob is cached with only the descriptions it refers to,
+        # rather than the whole batch.
+        (_, file_pool) = cache.get_description("file-1")
+        self.assertEqual(sorted(file_pool), ["file-1"])
+        (_, perm_pool) = cache.get_description("perm-1")
+        self.assertEqual(sorted(perm_pool), ["file-2", "perm-1"])
+
     def test_get_claims_for_permanode(self):
         http_session = MagicMock()
         http_session.get = MagicMock()
@@ -1,11 +1,27 @@
+import os
+import shutil
+import tempfile
 import unittest
+import unittest.mock
 import requests
 import requests_mock
 import json
 from urllib.parse import parse_qs
 
-from perkeeppy.signing import Signer
-from perkeeppy.exceptions import SigningError
+try:
+    import pgpy
+    from pgpy.constants import (
+        EllipticCurveOID,
+        HashAlgorithm,
+        KeyFlags,
+        PubKeyAlgorithm,
+        SymmetricKeyAlgorithm,
+    )
+except ImportError:
+    pgpy = None
+
+from perkeeppy.signing import Signer, LocalSigner, LocalVerifier
+from perkeeppy.exceptions import NotFoundError, SigningError
 
 
 class TestSigner(unittest.TestCase):
@@ -138,3 +154,188 @@ class TestSigner(unittest.TestCase):
             verified = self.signer.verify_bytes(b'{"pretendValidJson": false}')
 
         self.assertTupleEqual(verified, (False, 'Obvious fake!'))
+
+
+def make_key(algorithm=None, size=1024):
+    if algorithm is None:
+        algorithm = PubKeyAlgorithm.RSAEncryptOrSign
+    key = pgpy.PGPKey.new(algorithm, size)
+    uid = pgpy.PGPUID.new('Test', email='test@example.com')
+    key.add_uid(uid, usage={KeyFlags.Sign}, hashes=[HashAlgorithm.SHA256])
+    return key
+
+
+def verify(key, signed):
+    # This mirrors how Perkeep verifies signed JSON
+    signed = signed.decode('utf8').rstrip()
+    sig_index = signed.rindex(',"camliSig":"')
+    payload = signed[:sig_index] + '}'
+    sig = signed[sig_index + len(',"camliSig":"'):-2]
+
+    (body, crc) = sig.rsplit('=', 1)
+    lines = [body[i:i + 64] for i in range(0, len(body), 64)]
+    armored = (
+        '-----BEGIN PGP SIGNATURE-----\n\n' +
+        '\n'.join(lines) + '\n=' + crc +
+        '\n-----END PGP SIGNATURE-----\n'
+    )
+    signature = pgpy.PGPSignature.from_blob(armored)
+    return bool(key.pubkey.verify(payload.encode('utf8'), signature))
+
+
+@unittest.skipIf(pgpy is None, 'PGPy is not installed')
+class TestLocalSigner(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.key = make_key()
+
+    def test_sign_dict(self):
+        signer = LocalSigner(self.key)
+
+        result = signer.sign_dict({'someOtherData': 'Hello'})
+
+        data = json.loads(result)
+        self.assertEqual(data['camliSigner'], signer.public_key_blob.blobref)
+        self.assertEqual(data['camliVersion'], 1)
+        self.assertEqual(data['someOtherData'], 'Hello')
+        self.assertTrue(result.endswith(b'"}\n'))
+        self.assertTrue(verify(self.key, result))
+        self.assertTrue(
+            signer.public_key_blob.data.startswith(
+                b'-----BEGIN PGP PUBLIC KEY BLOCK-----'
+            )
+        )
+
+    def test_sign_string(self):
+        signer = LocalSigner(self.key, camli_signer='sha1-aaaabbbbccccdddd')
+        in_str = ('{\n\t"camliVersion": 1,\n'
+                  '\t"camliSigner": "sha1-aaaabbbbccccdddd",\n'
+                  '\t"someOtherData": "Héllo"\n}\n\n')
+
+        result = signer.sign_string(in_str)
+
+        self.assertTrue(result.startswith(in_str.rstrip()[:-1].encode()))
+        self.assertTrue(verify(self.key, result))
+
+        # Tampering is detected
+        tampered = result.replace('Héllo'.encode(), b'Hello')
+        self.assertFalse(verify(self.key, tampered))
+
+    def test_wrong_signer(self):
+        signer = LocalSigner(self.key)
+        with self.assertRaises(SigningError):
+            signer.sign_string('{"camliSigner": "sha1-aaaabbbbccccdddd"}')
+        with self.assertRaises(SigningError):
+            signer.sign_string('not json')
+
+    def test_protected_key(self):
+        key = make_key()
+        key.protect('secret', SymmetricKeyAlgorithm.AES256,
+                    HashAlgorithm.SHA256)
+
+        with self.assertRaises(SigningError):
+            LocalSigner(key)
+
+        signer = LocalSigner(key, passphrase='secret')
+        self.assertTrue(verify(key, signer.sign_dict({})))
+
+    def test_non_rsa_key(self):
+        key = make_key(PubKeyAlgorithm.ECDSA, EllipticCurveOID.NIST_P256)
+        signer = LocalSigner(key)
+        self.assertTrue(verify(key, signer.sign_dict({})))
+
+    def test_from_file(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        path = os.path.join(temp_dir, 'secring.gpg')
+        with open(path, 'wb') as f:
+            f.write(bytes(self.key))
+
+        signer = LocalSigner.from_file(path)
+        self.assertEqual(
+            signer.camli_signer,
+            LocalSigner(self.key).camli_signer,
+        )
+        self.assertTrue(verify(self.key, signer.sign_dict({})))
+
+    def test_public_key(self):
+        with self.assertRaises(SigningError):
+            LocalSigner(self.key.pubkey)
+
+
+class MockBlobClient(object):
+    def __init__(self, blobs):
+        self.blobs = {blob.blobref: blob for blob in blobs}
+        self.gets = []
+
+    def get(self, blobref):
+        self.gets.append(blobref)
+        try:
+            return self.blobs[blobref]
+        except KeyError:
+            raise NotFoundError(blobref)
+
+
+@unittest.skipIf(pgpy is None, 'PGPy is not installed')
+class TestLocalVerifier(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.key = make_key()
+        cls.signer = LocalSigner(cls.key)
+
+    def setUp(self):
+        self.blob_client = MockBlobClient([self.signer.public_key_blob])
+        self.verifier = LocalVerifier(self.blob_client)
+
+    def test_verify_bytes(self):
+        signed = self.signer.sign_dict({'someOtherData': 'Hello'})
+        self.assertEqual(self.verifier.verify_bytes(signed), (True, None))
+
+        tampered = signed.replace(b'Hello', b'Jello')
+        (valid, message) = self.verifier.verify_bytes(tampered)
+        self.assertFalse(valid)
+        self.assertIsNotNone(message)
+
+        # The public key was only fetched once
+        self.assertEqual(
+            self.blob_client.gets,
+            [self.signer.public_key_blob.blobref],
+        )
+
+    def test_malformed(self):
+        for byte_str in (
+            b'{"camliVersion": 1}',
+            b'{"camliSigner": "sha1-aaaa","camliSig":"abc"',
+            b'\xff',
+        ):
+            (valid, message) = self.verifier.verify_bytes(byte_str)
+            self.assertFalse(valid)
+            self.assertIsNotNone(message)
+
+    def test_unknown_signer(self):
+        signer = LocalSigner(self.key, camli_signer='sha1-aaaabbbbccccdddd')
+        signed = signer.sign_dict({})
+
+        self.assertEqual(
+            self.verifier.verify_bytes(signed),
+            (False, 'Public key sha1-aaaabbbbccccdddd not found'),
+        )
+
+    def test_verify_many(self):
+        signed = [
+            self.signer.sign_dict({'index': i}) for i in range(10)
+        ]
+        signed[3] = signed[3].replace(b'"index": 3', b'"index": 4')
+
+        with unittest.mock.patch('perkeeppy.signing.VERIFY_CHUNK_SIZE', 3):
+            results = list(self.verifier.verify_many(
+                iter(signed), max_workers=2,
+            ))
+
+        self.assertEqual([byte_str for (byte_str, _) in results], signed)
+        self.assertEqual(
+            [valid for (_, (valid, _)) in results],
+            [True, True, True, False, True, True, True, True, True, True],
+        )
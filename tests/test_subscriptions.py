@@ -0,0 +1,220 @@
+import asyncio
+import json
+import unittest
+
+import aiohttp
+from aiohttp import web
+
+from perkeeppy.aio import AsyncSearchClient
+
+
+class StandInServer(object):
+    """
+    A minimal imitation of the search websocket, which answers each query
+    with the current results from a dict mapping expressions to lists of
+    blobrefs, and sends the results again whenever publish is called.
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.queries = {}
+        self.messages = []
+        self.ws = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/search/camli/search/ws', self.handle_ws)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        return 'http://127.0.0.1:%i/search/' % port
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def handle_ws(self, request):
+        self.ws = web.WebSocketResponse()
+        await self.ws.prepare(request)
+
+        async for msg in self.ws:
+            raw = json.loads(msg.data)
+            self.messages.append(raw)
+            if raw["query"] is None:
+                self.queries.pop(raw["tag"], None)
+            else:
+                self.queries[raw["tag"]] = raw["query"]
+                await self.send(raw["tag"])
+
+        return self.ws
+
+    async def publish(self):
+        for tag in list(self.queries):
+            await self.send(tag)
+
+    async def send(self, tag):
+        expression = self.queries[tag]["expression"]
+        blobrefs = self.results.get(expression, [])
+        await self.ws.send_str(json.dumps({
+            "tag": tag,
+            "result": {
+                "blobs": [{"blob": blobref} for blobref in blobrefs],
+            },
+        }))
+
+
+def run_with_server(test):
+    async def run():
+        server = StandInServer()
+        base_url = await server.start()
+        try:
+            async with aiohttp.ClientSession() as http_session:
+                searcher = AsyncSearchClient(http_session, base_url)
+                await asyncio.wait_for(test(server, searcher), 10)
+        finally:
+            await server.stop()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+
+class TestSubscriptions(unittest.TestCase):
+
+    def test_iterate(self):
+        async def test(server, searcher):
+            server.results["is:permanode"] = ["dummy-1"]
+
+            async with searcher.subscriptions() as subs:
+                sub = await subs.subscribe("is:permanode")
+                updates = sub.__aiter__()
+
+                update = await updates.__anext__()
+                self.assertEqual(
+                    [result.blobref for result in update.results],
+                    ["dummy-1"],
+                )
+                self.assertEqual(
+                    [result.blobref for result in update.added],
+                    ["dummy-1"],
+                )
+                self.assertEqual(update.removed, [])
+
+                server.results["is:permanode"] = ["dummy-2", "dummy-3"]
+                await server.publish()
+
+                update = await updates.__anext__()
+                self.assertEqual(
+                    [result.blobref for result in update.added],
+                    ["dummy-2", "dummy-3"],
+                )
+                self.assertEqual(update.removed, ["dummy-1"])
+
+                await sub.unsubscribe()
+                with self.assertRaises(StopAsyncIteration):
+                    await updates.__anext__()
+
+            self.assertEqual(server.messages, [
+                {"tag": "1", "query": {"expression": "is:permanode"}},
+                {"tag": "1", "query": None},
+            ])
+
+        run_with_server(test)
+
+    def test_callbacks(self):
+        async def test(server, searcher):
+            server.results["is:image"] = ["dummy-1"]
+            server.results["is:permanode"] = ["dummy-2"]
+            received = []
+            done = asyncio.Event()
+
+            async def callback(update):
+                received.append(
+                    [result.blobref for result in update.results],
+                )
+                if len(received) == 3:
+                    done.set()
+
+            async with searcher.subscriptions() as subs:
+                await subs.subscribe("is:image", callback=callback)
+                await subs.subscribe(
+                    "is:permanode",
+                    callback=callback,
+                    describe={"depth": 1},
+                )
+                while len(server.queries) < 2:
+                    await asyncio.sleep(0.01)
+
+                server.results["is:image"] = ["dummy-1", "dummy-3"]
+                await server.send("1")
+                await done.wait()
+
+            self.assertEqual(received, [
+                ["dummy-1"],
+                ["dummy-2"],
+                ["dummy-1", "dummy-3"],
+            ])
+            # Both queries went over the same websocket.
+            self.assertEqual(
+                server.messages[1]["query"],
+                {"expression": "is:permanode", "describe": {"depth": 1}},
+            )
+
+        run_with_server(test)
+
+    def test_callback_isolation(self):
+        async def test(server, searcher):
+            server.results["is:image"] = ["dummy-1"]
+            server.results["is:permanode"] = ["dummy-2"]
+            server.results["is:file"] = ["dummy-3"]
+            received = []
+            unblock = asyncio.Event()
+            done = asyncio.Event()
+
+            def failing_callback(update):
+                raise ValueError("dummy")
+
+            async def slow_callback(update):
+                await unblock.wait()
+
+            def callback(update):
+                received.append(
+                    [result.blobref for result in update.results],
+                )
+                if len(received) == 2:
+                    done.set()
+
+            with self.assertLogs("perkeeppy.subscriptions") as logs:
+                async with searcher.subscriptions() as subs:
+                    await subs.subscribe("is:image", callback=failing_callback)
+                    await subs.subscribe("is:file", callback=slow_callback)
+                    await subs.subscribe("is:permanode", callback=callback)
+                    while len(server.queries) < 3:
+                        await asyncio.sleep(0.01)
+
+                    server.results["is:permanode"] = ["dummy-4"]
+                    await server.publish()
+
+                    # Updates keep arriving despite the failing and the
+                    # blocked callbacks.
+                    await done.wait()
+                    unblock.set()
+
+            self.assertEqual(received, [["dummy-2"], ["dummy-4"]])
+            self.assertIn("ValueError: dummy", logs.output[0])
+
+        run_with_server(test)
+
+    def test_close_ends_iteration(self):
+        async def test(server, searcher):
+            subs = searcher.subscriptions()
+            sub = await subs.subscribe("is:permanode")
+            await subs.close()
+
+            updates = [update async for update in sub]
+            self.assertLessEqual(len(updates), 1)
+
+        run_with_server(test)
@@ -0,0 +1,201 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from perkeeppy.blobclient import BlobClient, BlobMeta, Blob
+from perkeeppy.exceptions import (
+    HashMismatchError,
+    NotFoundError,
+    ServerError,
+)
+from perkeeppy.sync import BlobSync
+
+
+class MockBlobClient(BlobClient):
+    """
+    A blob client backed by a dict, standing in for a server.
+    """
+
+    def __init__(self, blobs):
+        super(MockBlobClient, self).__init__(MagicMock(), 'http://example/')
+        self.blobs = {blob.blobref: blob for blob in blobs}
+        self.uploads = []
+
+    def enumerate(self, prefetch=False, after=None):
+        for blobref in sorted(self.blobs):
+            if after is None or blobref > after:
+                yield BlobMeta(
+                    blobref,
+                    size=self.blobs[blobref].size,
+                    blob_client=self,
+                )
+
+    def get(self, blobref):
+        if blobref not in self.blobs:
+            raise NotFoundError(blobref)
+        return self.blobs[blobref]
+
+    def _upload_blobs(self, blobs):
+        self.uploads.append([blob.blobref for blob in blobs])
+        for blob in blobs:
+            self.blobs[blob.blobref] = blob
+
+
+class TestBlobSync(unittest.TestCase):
+
+    def setUp(self):
+        self.all_blobs = [Blob(b'dummy%i' % i) for i in range(10)]
+        self.source = MockBlobClient(self.all_blobs)
+        self.destination = MockBlobClient(self.all_blobs[::3])
+        self.destination.max_batch_blobs = 2
+
+    def expected_missing(self):
+        present = set(blob.blobref for blob in self.all_blobs[::3])
+        return sorted(
+            blob.blobref for blob in self.all_blobs
+            if blob.blobref not in present
+        )
+
+    def test_missing(self):
+        sync = BlobSync(self.source, self.destination)
+
+        self.assertEqual(
+            [x.blobref for x in sync.missing()],
+            self.expected_missing(),
+        )
+
+    def test_run(self):
+        progress = []
+        sync = BlobSync(self.source, self.destination, get_workers=3)
+        report = sync.run(progress=progress.append)
+
+        self.assertEqual(report.copied, 6)
+        self.assertEqual(report.copied_bytes, 36)
+        self.assertEqual(report.skipped, 4)
+        self.assertEqual(report.failed, [])
+        self.assertGreater(report.bytes_per_second, 0)
+        self.assertEqual(len(progress), 3)
+        self.assertEqual(
+            sorted(self.destination.blobs),
+            sorted(blob.blobref for blob in self.all_blobs),
+        )
+        self.assertEqual(
+            sorted(sum(self.destination.uploads, [])),
+            self.expected_missing(),
+        )
+
+    def test_dry_run(self):
+        sync = BlobSync(self.source, self.destination)
+        report = sync.run(dry_run=True)
+
+        self.assertEqual(report.copied, 6)
+        self.assertEqual(report.skipped, 4)
+        self.assertEqual(self.destination.uploads, [])
+
+    def test_checkpoint(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        checkpoint_path = os.path.join(temp_dir, 'checkpoint')
+
+        missing = self.expected_missing()
+        original_upload = self.destination._upload_blobs
+
+        def fail_later_batches(blobs):
+            if blobs[0].blobref >= missing[2]:
+                raise ServerError('dummy')
+            original_upload(blobs)
+
+        self.destination._upload_blobs = fail_later_batches
+
+        sync = BlobSync(self.source, self.destination, upload_workers=1)
+        report = sync.run(checkpoint_path=checkpoint_path)
+
+        self.assertEqual(report.copied, 2)
+        self.assertEqual(sorted(report.failed), missing[2:])
+        with open(checkpoint_path) as f:
+            self.assertEqual(f.read(), missing[1])
+
+        # The next run resumes after the checkpoint
+        self.destination._upload_blobs = original_upload
+        report = sync.run(checkpoint_path=checkpoint_path)
+
+        self.assertEqual(report.copied, 4)
+        self.assertEqual(report.failed, [])
+        self.assertEqual(
+            sorted(self.destination.blobs),
+            sorted(blob.blobref for blob in self.all_blobs),
+        )
+
+        # That run completed, so the checkpoint is gone and a later run
+        # looks at every blob again.
+        self.assertFalse(os.path.exists(checkpoint_path))
+        report = sync.run(checkpoint_path=checkpoint_path)
+        self.assertEqual(report.skipped, 10)
+
+    def test_get_errors(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        checkpoint_path = os.path.join(temp_dir, 'checkpoint')
+
+        missing = self.expected_missing()
+        original_get = self.source.get
+
+        def failing_get(blobref):
+            if blobref == missing[1]:
+                raise ServerError('dummy')
+            if blobref == missing[4]:
+                raise HashMismatchError('dummy')
+            return original_get(blobref)
+
+        self.source.get = failing_get
+
+        sync = BlobSync(self.source, self.destination)
+        report = sync.run(checkpoint_path=checkpoint_path)
+
+        self.assertEqual(report.copied, 4)
+        self.assertEqual(report.failed, [missing[1], missing[4]])
+        self.assertIsInstance(report.errors[missing[1]], ServerError)
+        self.assertIsInstance(report.errors[missing[4]], HashMismatchError)
+
+        # The failed blobs can be retried, so the checkpoint doesn't move
+        # past them and the next run copies them.
+        self.source.get = original_get
+        report = sync.run(checkpoint_path=checkpoint_path)
+
+        self.assertEqual(report.copied, 2)
+        self.assertEqual(report.failed, [])
+        self.assertFalse(os.path.exists(checkpoint_path))
+
+    def test_first_batch_fails(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        checkpoint_path = os.path.join(temp_dir, 'checkpoint')
+
+        missing = self.expected_missing()
+        original_get = self.source.get
+
+        def failing_get(blobref):
+            if blobref == missing[0]:
+                raise ServerError('dummy')
+            return original_get(blobref)
+
+        self.source.get = failing_get
+
+        # Checkpointing after every batch must cope with there being
+        # nothing to record yet.
+        sync = BlobSync(self.source, self.destination)
+        report = sync.run(
+            checkpoint_path=checkpoint_path,
+            checkpoint_interval=0,
+        )
+
+        self.assertEqual(report.copied, 5)
+        self.assertEqual(report.failed, [missing[0]])
+        self.assertFalse(os.path.exists(checkpoint_path))
+
+        self.source.get = original_get
+        report = sync.run(checkpoint_path=checkpoint_path)
+        self.assertEqual(report.copied, 1)
+        self.assertEqual(report.failed, [])
@@ -0,0 +1,126 @@
+import unittest
+from unittest.mock import MagicMock
+
+from perkeeppy.blobclient import BlobClient, Blob
+from perkeeppy.exceptions import ServerError
+from perkeeppy.uploader import PipelinedUploader, UploadReport
+
+
+class TestPipelinedUploader(unittest.TestCase):
+
+    def make_blob_client(self, present=()):
+        http_session = MagicMock()
+
+        class MockBlobClient(BlobClient):
+            get_size_multi = MagicMock()
+            _upload_blobs = MagicMock()
+
+        MockBlobClient.get_size_multi.side_effect = (
+            lambda *blobrefs: {
+                blobref: (6 if blobref in present else None)
+                for blobref in blobrefs
+            }
+        )
+
+        blobs = MockBlobClient(http_session, 'http://example.com/')
+        blobs.max_batch_blobs = 2
+        return blobs
+
+    def test_upload(self):
+        input_blobs = [Blob(b'dummy%i' % i) for i in range(5)]
+        present = set([input_blobs[1].blobref, input_blobs[4].blobref])
+        blobs = self.make_blob_client(present=present)
+
+        batch_futures = []
+        with PipelinedUploader(blobs, stat_workers=2,
+                               upload_workers=2) as uploader:
+            report = uploader.upload(
+                (blob for blob in input_blobs),
+                callback=batch_futures.append,
+            )
+
+        self.assertEqual(len(batch_futures), 3)
+        self.assertEqual(
+            sorted(report.uploaded),
+            sorted(
+                blob.blobref for blob in input_blobs
+                if blob.blobref not in present
+            ),
+        )
+        self.assertEqual(sorted(report.skipped), sorted(present))
+        self.assertEqual(report.failed, [])
+
+        uploaded = []
+        for call in blobs._upload_blobs.call_args_list:
+            uploaded.extend(blob.blobref for blob in call[0][0])
+        self.assertEqual(sorted(uploaded), sorted(report.uploaded))
+
+    def test_upload_failure(self):
+        input_blobs = [Blob(b'dummy%i' % i) for i in range(4)]
+        blobs = self.make_blob_client()
+
+        error = ServerError('dummy')
+
+        def fail_first_batch(missing):
+            if input_blobs[0] in missing:
+                raise error
+
+        blobs._upload_blobs.side_effect = fail_first_batch
+
+        with PipelinedUploader(blobs) as uploader:
+            report = uploader.upload(input_blobs)
+
+        self.assertEqual(
+            sorted(report.failed),
+            sorted(blob.blobref for blob in input_blobs[0:2]),
+        )
+        self.assertEqual(
+            sorted(report.uploaded),
+            sorted(blob.blobref for blob in input_blobs[2:4]),
+        )
+        self.assertIs(report.errors[input_blobs[0].blobref], error)
+
+    def test_stat_failure(self):
+        input_blobs = [Blob(b'dummy%i' % i) for i in range(2)]
+        blobs = self.make_blob_client()
+        blobs.get_size_multi.side_effect = ServerError('dummy')
+
+        with PipelinedUploader(blobs) as uploader:
+            report = uploader.submit_batch(input_blobs).result()
+
+        self.assertEqual(
+            sorted(report.failed),
+            sorted(blob.blobref for blob in input_blobs),
+        )
+        blobs._upload_blobs.assert_not_called()
+
+    def test_upload_stage_unavailable(self):
+        input_blobs = [Blob(b'dummy%i' % i) for i in range(2)]
+        blobs = self.make_blob_client()
+
+        with PipelinedUploader(blobs) as uploader:
+            uploader._upload_executor.shutdown()
+
+            # The batch can't be handed to the upload stage, which must
+            # be reported rather than leaving upload() waiting forever.
+            with self.assertRaises(RuntimeError):
+                uploader.upload(input_blobs)
+
+        blobs._upload_blobs.assert_not_called()
+
+
+class TestUploadReport(unittest.TestCase):
+
+    def test_merge(self):
+        first = UploadReport()
+        first.uploaded.append('dummy1')
+        second = UploadReport()
+        second.skipped.append('dummy2')
+        second.add_failed(['dummy3'], 'dummy-error')
+
+        first.merge(second)
+
+        self.assertEqual(first.uploaded, ['dummy1'])
+        self.assertEqual(first.skipped, ['dummy2'])
+        self.assertEqual(first.failed, ['dummy3'])
+        self.assertEqual(first.errors, {'dummy3': 'dummy-error'})
@@ -1,10 +1,15 @@
+import json
+import os
+import shutil
+import tempfile
 import unittest
 import requests
 import requests_mock
 from requests_toolbelt.multipart.decoder import MultipartDecoder
 import io
 
-from perkeeppy.uploadhelper import UploadHelper
+from perkeeppy.exceptions import ServerError
+from perkeeppy.uploadhelper import UploadHelper, MultipartEncoder
 
 
 class UploadHelperTest(unittest.TestCase):
@@ -27,7 +32,12 @@ class UploadHelperTest(unittest.TestCase):
 
         self.assertEqual(fileref, 'sha224-aaaabbbb')
 
-        decoder = MultipartDecoder(mock.last_request.body,
+        # The body is streamed, so the mock sees the unread encoder
+        body = mock.last_request.body.read()
+        self.assertEqual(len(body),
+                         int(mock.last_request.headers['Content-Length']))
+
+        decoder = MultipartDecoder(body,
                                    mock.last_request.headers['Content-Type'])
 
         found_modtime, found_file = False, False
@@ -45,3 +55,181 @@ class UploadHelperTest(unittest.TestCase):
                         'modtime was not found in multipart data')
         self.assertTrue(found_file,
                         'file was not found in multipart data')
+
+        # The server only applies modtime to the files after it
+        self.assertEqual(
+            [
+                b'modtime' in part.headers[b'Content-Disposition']
+                for part in decoder.parts
+            ],
+            [True, False],
+        )
+
+
+class NonSeekableFile(io.RawIOBase):
+    def __init__(self, data):
+        self._file = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._file.readinto(b)
+
+
+class MultipartEncoderTest(unittest.TestCase):
+    def decode(self, encoder, body):
+        decoder = MultipartDecoder(body, encoder.content_type)
+        return [
+            (part.headers[b'Content-Disposition'], part.content)
+            for part in decoder.parts
+        ]
+
+    def test_encoder(self):
+        data = bytes(range(256)) * 1000
+        progress = []
+        encoder = MultipartEncoder(
+            [
+                ('file', ('a "quoted" file', io.BytesIO(data))),
+                ('modtime', (None, '2010-01-02T10:20:30Z')),
+            ],
+            progress=lambda *args: progress.append(args),
+        )
+
+        body = b''.join(iter(lambda: encoder.read(1000), b''))
+
+        self.assertEqual(len(body), len(encoder))
+        self.assertEqual(self.decode(encoder, body), [
+            (b'form-data; name="file"; filename="a %22quoted%22 file"', data),
+            (b'form-data; name="modtime"', b'2010-01-02T10:20:30Z'),
+        ])
+
+        self.assertEqual(progress[-1][0], len(body))
+        self.assertEqual(progress[-1][1], len(body))
+        self.assertEqual(
+            [sent for (sent, _, _) in progress],
+            list(range(1000, len(body), 1000)) + [len(body)],
+        )
+
+    def test_unknown_size(self):
+        data = b'streamed' * 1000
+        encoder = MultipartEncoder(
+            [('file', ('afile', NonSeekableFile(data)))],
+        )
+
+        self.assertIsNone(encoder.size)
+        with self.assertRaises(TypeError):
+            len(encoder)
+
+        body = b''.join(encoder)
+        self.assertEqual(self.decode(encoder, body), [
+            (b'form-data; name="file"; filename="afile"', data),
+        ])
+
+    def test_upload_unknown_size(self):
+        mock = requests_mock.Mocker()
+        mock.post('https://example.com/perkeep/',
+                  text='{"got":[{"fileref":"sha224-aaaabbbb"}]}')
+
+        uploadhelper = UploadHelper(requests.session(),
+                                    'https://example.com/perkeep/')
+        with mock:
+            fileref = uploadhelper.upload_file(
+                'afile', NonSeekableFile(b'streamed'),
+            )
+
+        self.assertEqual(fileref, 'sha224-aaaabbbb')
+        self.assertEqual(
+            mock.last_request.headers['Transfer-Encoding'], 'chunked',
+        )
+        body = b''.join(mock.last_request.body)
+        self.assertIn(b'\r\n\r\nstreamed\r\n', body)
+
+
+class UploadFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.uploadhelper = UploadHelper(requests.session(),
+                                         'https://example.com/perkeep/')
+        self.uploadhelper.max_request_files = 3
+        self.uploadhelper.max_request_size = 100
+        self.requests = []
+
+    def respond(self, request, context):
+        # Answers in reverse order, to check that the form names are used
+        # to match up the filerefs.
+        decoder = MultipartDecoder(request.body.read(),
+                                   request.headers['Content-Type'])
+        got = []
+        parts = []
+        mtime = None
+        for part in decoder.parts:
+            disposition = part.headers[b'Content-Disposition'].decode()
+            form_name = disposition.split('name="')[1].split('"')[0]
+            if form_name == 'modtime':
+                mtime = part.content.decode()
+                continue
+            parts.append((part.content.decode(), mtime))
+            got.append({
+                'formName': form_name,
+                'fileref': 'ref-' + part.content.decode(),
+            })
+        self.requests.append(parts)
+        return json.dumps({'got': list(reversed(got))})
+
+    def test_upload_files(self):
+        files = [
+            ('file%i' % i, io.BytesIO(b'data%i' % i)) for i in range(7)
+        ]
+        files[1] = files[1] + ('2010-01-02T10:20:30Z',)
+        files[2] = files[2] + ('2010-01-02T10:20:30Z',)
+        # Too big to share a request with anything else
+        files[4] = ('big', io.BytesIO(b'b' * 99))
+
+        mock = requests_mock.Mocker()
+        mock.post('https://example.com/perkeep/', text=self.respond)
+
+        with mock:
+            results = list(self.uploadhelper.upload_files(
+                iter(files), max_workers=2,
+            ))
+
+        self.assertEqual([item for (item, _) in results], files)
+        self.assertEqual(
+            [fileref for (_, fileref) in results],
+            ['ref-data0', 'ref-data1', 'ref-data2', 'ref-data3',
+             'ref-' + 'b' * 99, 'ref-data5', 'ref-data6'],
+        )
+
+        self.assertEqual(sorted(self.requests), sorted([
+            [('data0', None),
+             ('data1', '2010-01-02T10:20:30Z'),
+             ('data2', '2010-01-02T10:20:30Z')],
+            [('data3', None)],
+            [('b' * 99, None)],
+            [('data5', None), ('data6', None)],
+        ]))
+
+    def test_upload_paths(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        path = os.path.join(temp_dir, 'afile')
+        with open(path, 'wb') as f:
+            f.write(b'from disk')
+
+        mock = requests_mock.Mocker()
+        mock.post('https://example.com/perkeep/', text=self.respond)
+
+        with mock:
+            results = list(self.uploadhelper.upload_files([('afile', path)]))
+
+        self.assertEqual(results, [(('afile', path), 'ref-from disk')])
+
+    def test_missing_fileref(self):
+        mock = requests_mock.Mocker()
+        mock.post('https://example.com/perkeep/', text='{"got": []}')
+
+        with mock:
+            with self.assertRaises(ServerError):
+                list(self.uploadhelper.upload_files(
+                    [('afile', io.BytesIO(b'data'))],
+                ))